@@ -69,6 +69,7 @@ class Asari(pipeline_tools.FeatureFinderPipeline):
         return self.param_choices
 
     def setup_workspace(self):
+        super().setup_workspace()
         import subprocess
         subprocess.run('conda create -y -n asari_env "python=3.12.5" pip -c conda-forge', shell = True)
         subprocess.run('conda run -n asari_env pip install "asari-metabolomics==1.13.1"', shell = True)
@@ -76,22 +77,19 @@ class Asari(pipeline_tools.FeatureFinderPipeline):
     def run_job(self, job):
         super().run_job(job)
         
-        import subprocess
         from time import time
         import os
-        import pandas as pd
         import shutil
         
         #set up temporary workspace
-        tmpdir = str(os.getpid())
-        os.mkdir(tmpdir)
-        mzmls = [f for f in os.listdir() if f.endswith('.mzML')]
+        tmpdir = self.trial_dir()
+        mzmls = [f for f in os.listdir(self.inputs) if f.endswith('.mzML')]
         base_names = [f[:-5] for f in mzmls]
-        psms = [f for f in os.listdir() if f.endswith('_PSMs.txt')]
         os.chdir(tmpdir)
         try:
-            for file in mzmls + psms:
-                os.link(f'../{file}', file)
+            with self.span('stage-inputs'):
+                for file in mzmls:
+                    os.link(os.path.join(self.inputs, file), file)
                 
             with open('asari.params', 'w') as yaml:
                 for param, value in self.run_params.items():
@@ -100,38 +98,38 @@ class Asari(pipeline_tools.FeatureFinderPipeline):
                     if not self.params[param] == 'null':
                         yaml.write(f'{param}: !!{self.asari_param_dtypes[param]} {self.params[param]}\n')
             
+            def run_tool():
+                self.run_command('conda run -n asari_env asari process -p asari.params -i ./')
+                outdir = next(f for f in os.listdir() if f.startswith('output_'))
+                return [os.path.join(outdir,'export/full_Feature_table.tsv')]
+            tool_runtime = self.cached_tool_run(job, mzmls, run_tool)
             start = time()
-            subprocess.run('conda run -n asari_env asari process -p asari.params -i ./', shell = True)
             
             #run peptide rollup
-            peptide_results = []
-            outdir = next(f for f in os.listdir() if f.startswith('output_'))
-            features = pd.read_csv(os.path.join(outdir,'export/full_Feature_table.tsv'), sep = '\t')
-            features = features[['rtim_left_base', 'rtime_right_base', 'mz'] + base_names]
-            features.columns = ['rt_start', 'rt_end', 'mz'] + base_names
+            feature_tables = []
+            psm_tables = []
+            with self.span('parse-features'):
+                outdir = next(f for f in os.listdir() if f.startswith('output_'))
+                features = pipeline_tools.read_feature_table(os.path.join(outdir,'export/full_Feature_table.tsv'),
+                                                             'Asari',
+                                                             {b:(b, 'float32', 1) for b in base_names})
             for base_name in base_names:
-                feature_subset = features[features[base_name] > 0]
-                feature_subset['intensity'] = feature_subset[base_name]
+                feature_subset = features.loc[features[base_name] > 0, ['rt_start', 'rt_end', 'mz', base_name]]
+                feature_subset = feature_subset.rename(columns = {base_name:'intensity'})
                 
-                psms = pd.read_csv(f'{base_name}_PSMs.txt', sep = '\t')
-                psms['mass'] = psms['Theo. MH+ [Da]'] - pipeline_tools.H
-                psms['rt'] = psms['RT [min]']
-                psms['sequence'] = psms['Annotated Sequence']
-                psms = psms[['mass', 'rt', 'sequence']]
+                psms = self.load_psms(base_name)
                 
-                peptide_results.append(self.peptide_rollup(feature_subset, psms))
+                feature_tables.append(feature_subset)
+                psm_tables.append(psms)
+            grid = self.sweep_metrics(feature_tables, psm_tables)
             end = time()
         
             #process results
-            quant_depth, mre = self.calc_metrics(peptide_results[0], peptide_results[1])
-            runtime = end - start
-            
-            result_line = list(job.values()) + [quant_depth, mre, runtime]
-            with open('../outcomes.tsv', 'a') as tsv:
-                tsv.write('\t'.join(str(r) for r in result_line) + '\n')
+            self.record_sweep(job, grid, tool_runtime + end - start)
             
         except Exception as e:
             print(e)
         #clean up temporary files
-        os.chdir('..')
-        shutil.rmtree(tmpdir)
+        with self.span('cleanup'):
+            os.chdir(self.workspace)
+            shutil.rmtree(tmpdir)
@@ -9,9 +9,14 @@ Created on Tue Aug 13 13:07:45 2024
 from optimize_dinosaur import pipeline_tools
 
 class Dinosaur(pipeline_tools.FeatureFinderPipeline):
+    #the java heap ceiling of a Dinosaur run, each run gets this or its share of the memory
+    #of the trial if sizing shrank that below it
+    java_heap_gb = 16
+    
     def __init__(self):
         self.name = 'Dinosaur'
         self.cores = 4
+        self.file_memory_gb = self.java_heap_gb
         self.memory = self.cores*4
         self.timeout = '01:00:00'
         self.get_params()
@@ -38,6 +43,7 @@ class Dinosaur(pipeline_tools.FeatureFinderPipeline):
         return self.param_choices
 
     def setup_workspace(self):
+        super().setup_workspace()
         import os
         import subprocess 
         
@@ -49,61 +55,59 @@ class Dinosaur(pipeline_tools.FeatureFinderPipeline):
         super().run_job(job)
         
         import os
-        import subprocess
         import shutil
         from time import time
 
-        import pandas as pd
         
         #set up temporary workspace
-        tmpdir = str(os.getpid())
-        os.mkdir(tmpdir)
-        mzmls = [f for f in os.listdir() if f.endswith('.mzML')]
+        tmpdir = self.trial_dir()
+        mzmls = [f for f in os.listdir(self.inputs) if f.endswith('.mzML')]
         base_names = [f[:-5] for f in mzmls]
-        psms = [f for f in os.listdir() if f.endswith('_PSMs.txt')]
         os.chdir(tmpdir)
         try:
-            for file in mzmls + psms:
-                os.link(f'../{file}', file)
-            start = time()
+            with self.span('stage-inputs'):
+                for file in mzmls:
+                    os.link(os.path.join(self.inputs, file), file)
             
-            #run Dinosaur    
-            with open('dinosaur.params', 'w') as params:
-                params.write('\n'.join(f'{k}={v}' for k,v in job.items() if k in self.dinosaur_param_set))
+            #run Dinosaur on as many files at once as fit into memory and roll up each file as soon as it is done
+            def run_file(base_name):
+                self.run_command(' '.join([f'java -Xmx{min(self.java_heap_gb, self.file_memory)}g -jar {os.path.join(self.workspace, "Dinosaur.jar")}',
+                                           f'--advParams={os.path.abspath("dinosaur.params")}',
+                                           f'--concurrency={self.file_cores}',
+                                           f'{base_name}.mzML']))
             
-            for mzml in mzmls:
-                subprocess.run(f'java -Xmx16g -jar ../Dinosaur.jar --advParams={os.path.abspath("dinosaur.params")} --concurrency={self.cores} {mzml}', shell = True)
-            
-            #run peptide rollup
-            peptide_results = []
-            for base_name in base_names:
-                features = pd.read_csv(f'{base_name}.features.tsv', sep = '\t')
-                features['rt_start'] = features['rtStart']
-                features['rt_end'] = features['rtEnd']
-                features['mz'] = (features['mass']/features['charge']) + pipeline_tools.H
-                features['intensity'] = features['intensitySum']/features['charge']
-                features = features[['rt_start', 'rt_end', 'mz', 'intensity']]
+            def rollup(base_name):
+                with self.span('parse-features'):
+                    features = pipeline_tools.read_feature_table(f'{base_name}.features.tsv', 'Dinosaur')
+                    features['mz'] /= features['charge']
+                    features['mz'] += pipeline_tools.H
+                    features['intensity'] /= features['charge']
                 
-                psms = pd.read_csv(f'{base_name}_PSMs.txt', sep = '\t')
-                psms['mass'] = psms['Theo. MH+ [Da]'] - pipeline_tools.H
-                psms['rt'] = psms['RT [min]']
-                psms['sequence'] = psms['Annotated Sequence']
-                psms = psms[['mass', 'rt', 'sequence']]
+                psms = self.load_psms(base_name)
+                return self.rollup_file(features, psms)
+            
+            rollups = {}
+            def run_tool():
+                with open('dinosaur.params', 'w') as params:
+                    params.write('\n'.join(f'{k}={v}' for k,v in job.items() if k in self.dinosaur_param_set))
                 
-                peptide_results.append(self.peptide_rollup(features, psms))
+                rollups.update(zip(base_names, self.run_files(base_names, run_file, rollup)))
+                return [f'{base_name}.features.tsv' for base_name in base_names]
+            tool_runtime = self.cached_tool_run(job, mzmls, run_tool)
+            start = time()
+            
+            #the tool did not run on a cache hit so the files are rolled up here
+            per_file = [rollups[b] if b in rollups else rollup(b) for b in base_names]
+            grid = self.sweep_grid(per_file)
             end = time()
             
             #process results
-            quant_depth, mre = self.calc_metrics(peptide_results[0], peptide_results[1])
-            runtime = end - start
-            
-            result_line = list(job.values()) + [quant_depth, mre, runtime]
-            with open('../outcomes.tsv', 'a') as tsv:
-                tsv.write('\t'.join(str(r) for r in result_line) + '\n')
+            self.record_sweep(job, grid, tool_runtime + end - start)
             
         except Exception as e:
             print(e)
         #clean up temporary files
-        os.chdir('..')
-        shutil.rmtree(tmpdir)
+        with self.span('cleanup'):
+            os.chdir(self.workspace)
+            shutil.rmtree(tmpdir)
 
@@ -33,6 +33,10 @@ class Flashlfq(pipeline_tools.PepQuantPipeline):
                             'out':'/data/',
                             'thr':2})
     
+    def staged_inputs(self, directory):
+        #the PSMs of every file in the format of FlashLFQ
+        return super().staged_inputs(directory) + ['psms.tsv']
+    
     def setup_workspace(self):
         import subprocess
         import os
@@ -66,7 +70,6 @@ class Flashlfq(pipeline_tools.PepQuantPipeline):
         super().run_job(job)
 
         import os
-        import subprocess
         import shutil
         from time import time
         import traceback
@@ -74,26 +77,27 @@ class Flashlfq(pipeline_tools.PepQuantPipeline):
         import pandas as pd
         
         #set up temporary workspace
-        tmpdir = str(os.getpid())
+        tmpdir = self.trial_dir()
         print(tmpdir, flush = True)
-        os.mkdir(tmpdir)
-        mzmls = [f for f in os.listdir() if f.endswith('.mzML') and f.startswith('20210827')]
-        psms = [f for f in os.listdir() if f.endswith('_PSMs.txt')]
+        mzmls = [f for f in os.listdir(self.inputs) if f.endswith('.mzML') and f.startswith('20210827')]
+        psms = [f for f in os.listdir(self.inputs) if f.endswith('_PSMs.txt')]
         os.chdir(tmpdir)
         try:
-            for file in mzmls + psms:
-                os.link(f'../{file}', file)
-            os.link('../psms.tsv', 'psms.tsv')
+            with self.span('stage-inputs'):
+                for file in mzmls + psms:
+                    os.link(os.path.join(self.inputs, file), file)
+                os.link(os.path.join(self.inputs, 'psms.tsv'), 'psms.tsv')
             
             flfq_params = ' '.join(f'--{k}={v}' if v != 'true' else f'--{k}' for k,v in self.params.items() if v != 'false')
-            command = f'singularity run --bind ./:/data/ --containall ../flashlfq.sif {flfq_params}'
+            command = f'singularity run --bind ./:/data/ --containall {os.path.join(self.workspace, "flashlfq.sif")} {flfq_params}'
             print(command, flush = True)
             start = time()
-            subprocess.run(command, shell = True)
+            self.run_command(command)
             end = time()
             
             #process results
-            peptides = pd.read_csv('QuantifiedPeptides.tsv', sep = '\t')
+            with self.span('parse-features'):
+                peptides = pd.read_csv('QuantifiedPeptides.tsv', sep = '\t')
             peptide_results = []
             for mzml in mzmls:
                 mzml_col = f'Intensity_{mzml[:-5]}'
@@ -101,17 +105,18 @@ class Flashlfq(pipeline_tools.PepQuantPipeline):
                 subset['sequence'] = subset['Sequence']
                 subset['intensity'] = subset[mzml_col]
                 peptide_results.append(subset[['sequence', 'intensity']])
-            quant_depth, mre = self.calc_metrics(peptide_results[0], peptide_results[1])
+            with self.span('metrics'):
+                quant_depth, mre = self.calc_metrics(*peptide_results)
             runtime = end - start
             
-            result_line = [v for k,v in job.items() if not k in ('idt', 'rep', 'out', 'thr')]
-            result_line += [quant_depth, mre, runtime]
-            with open('../outcomes.tsv', 'a') as tsv:
-                tsv.write('\t'.join(str(r) for r in result_line) + '\n')
+            self.record_outcome({k:v for k,v in job.items() if not k in ('idt', 'rep', 'out', 'thr')},
+                                (quant_depth, mre),
+                                runtime)
             
         except Exception as e:
             traceback.print_exc(e)
         finally:
             #clean up temporary files
-            os.chdir('..')
-            shutil.rmtree(tmpdir)
+            with self.span('cleanup'):
+                os.chdir(self.workspace)
+                shutil.rmtree(tmpdir)
@@ -20,7 +20,8 @@ class Osfd(pipeline_tools.FeatureFinderPipeline):
     def __init__(self):
         self.name = 'Osfd'
         self.cores = 2
-        self.memory = 8
+        self.file_memory_gb = 8
+        self.memory = self.cores*self.file_memory_gb
         self.timeout = '08:00:00'
         self.get_params()
     
@@ -40,6 +41,7 @@ class Osfd(pipeline_tools.FeatureFinderPipeline):
         return self.param_choices
 
     def setup_workspace(self):
+        super().setup_workspace()
         import subprocess
         subprocess.run('singularity build --fakeroot osfd.sif docker://stavisvols/osfd',
                        shell = True)
@@ -48,62 +50,57 @@ class Osfd(pipeline_tools.FeatureFinderPipeline):
         super().run_job(job)
         
         import os
-        import subprocess
         import shutil
         from time import time
         import traceback
 
-        import pandas as pd
         
         #set up temporary workspace
-        tmpdir = str(os.getpid())
+        tmpdir = self.trial_dir()
         print(tmpdir, flush = True)
-        os.mkdir(tmpdir)
-        mzmls = [f for f in os.listdir() if f.endswith('.mzML') and f.startswith('20210827')]
+        mzmls = [f for f in os.listdir(self.inputs) if f.endswith('.mzML') and f.startswith('20210827')]
         base_names = [f[:-5] for f in mzmls]
-        psms = [f for f in os.listdir() if f.endswith('_PSMs.txt')]
         os.chdir(tmpdir)
         try:
-            for file in mzmls + psms:
-                os.link(f'../{file}', file)
-            start = time()
+            with self.span('stage-inputs'):
+                for file in mzmls:
+                    os.link(os.path.join(self.inputs, file), file)
             
-            #run OSFD                
+            #run OSFD on every file at once and roll up each file as soon as it is done
             args = ' '.join(f'--{k} {v}' for k,v in job.items() if k in self.osfd_param_set)
-            singularity_command = 'singularity run --containall --fakeroot --bind ./:/data/ ../osfd.sif'
-            for mzml, base_name in zip(mzmls, base_names):
-                osfd_command = f'Rscript /osfd/peakpicking.R {args} -i /data/{mzml} -o /data/{base_name}.features'
+            singularity_command = f'singularity run --containall --fakeroot --bind ./:/data/ {os.path.join(self.workspace, "osfd.sif")}'
+            def run_file(base_name):
+                osfd_command = f'Rscript /osfd/peakpicking.R {args} -i /data/{base_name}.mzML -o /data/{base_name}.features'
                 command = f'{singularity_command} {osfd_command}'
                 print(command, flush = True)
-                subprocess.run(command, shell = True)
+                self.run_command(command)
             
-            #run peptide rollup
-            peptide_results = []
-            for base_name in base_names:
-                features = pd.read_csv(f'{base_name}.features', sep = '\t')
-                features['rt_start'] = features['rt_start']/60
-                features['rt_end'] = features['rt_end']/60
+            def rollup(base_name):
+                with self.span('parse-features'):
+                    features = pipeline_tools.read_feature_table(f'{base_name}.features', 'Osfd')
                 
-                psms = pd.read_csv(f'{base_name}_PSMs.txt', sep = '\t')
-                psms['mass'] = psms['Theo. MH+ [Da]'] - pipeline_tools.H
-                psms['rt'] = psms['RT [min]']
-                psms['sequence'] = psms['Annotated Sequence']
-                psms = psms[['mass', 'rt', 'sequence']]
-                
-                peptide_results.append(self.peptide_rollup(features, psms))
+                psms = self.load_psms(base_name)
+                return self.rollup_file(features, psms)
+            
+            rollups = {}
+            def run_tool():
+                rollups.update(zip(base_names, self.run_files(base_names, run_file, rollup)))
+                return [f'{base_name}.features' for base_name in base_names]
+            tool_runtime = self.cached_tool_run(job, mzmls, run_tool)
+            start = time()
+            
+            #the tool did not run on a cache hit so the files are rolled up here
+            per_file = [rollups[b] if b in rollups else rollup(b) for b in base_names]
+            grid = self.sweep_grid(per_file)
             end = time()
             
             #process results
-            quant_depth, mre = self.calc_metrics(peptide_results[0], peptide_results[1])
-            runtime = end - start
-            
-            result_line = list(job.values()) + [quant_depth, mre, runtime]
-            with open('../outcomes.tsv', 'a') as tsv:
-                tsv.write('\t'.join(str(r) for r in result_line) + '\n')
+            self.record_sweep(job, grid, tool_runtime + end - start)
             
         except Exception as e:
             traceback.print_exc(e)
         #clean up temporary files
-        os.chdir('..')
-        shutil.rmtree(tmpdir)
+        with self.span('cleanup'):
+            os.chdir(self.workspace)
+            shutil.rmtree(tmpdir)
 
@@ -45,6 +45,12 @@ class Percolator(pipeline_tools.Pipeline):
                         'FDR':-1}
         return self.metrics
     
+    def staged_inputs(self, directory):
+        import os
+        
+        #the comet results and the initial weights, the container is read from the workspace
+        return [f for f in os.listdir(directory) if f.endswith('.pin') or f == 'weights.tsv']
+    
     def setup_workspace(self):
         import subprocess
         import os
@@ -82,38 +88,46 @@ class Percolator(pipeline_tools.Pipeline):
                                     'optimize_percolator.mzML'])
                 subprocess.run(command, shell = True)
         
+    def job_params(self, job):
+        '''
+        takes a dictionary of parameter choices
+        returns the percolator command line arguments they stand for,
+        False leaves the flag out and True passes it without a value
+        '''
+        import re
+        
+        job_params = ' '.join(f'--{k} {v}' if str(v) != 'True' else f'--{k}' for k,v in job.items() if str(v) != 'False')
+        return re.sub(r'--tab-in ', '', job_params)
+    
     def run_job(self, job):
         super().run_job(job)
         import os
         import shutil
-        import subprocess
         import pandas as pd
         import numpy as np
         import time
-        import re
 
         #set up temporary workspace
-        temp_dir = str(os.getpid())
-        files = [f for f in os.listdir() if os.path.isfile(f)]
-        os.mkdir(temp_dir)
+        temp_dir = self.trial_dir()
         os.chdir(temp_dir)
-        for file in files:
-            os.link(f'../{file}', file)
+        with self.span('stage-inputs'):
+            for file in self.staged_inputs(self.inputs):
+                os.link(os.path.join(self.inputs, file), file)
         try:
             #run percolator
             singularity_params = '--fakeroot --containall --bind ./:/data/ -w --unsquash'
             perc_params = '-U -m /data/results.pout'
-            job_params = ' '.join(f'--{k} {v}' if v != 'True' else f'--{k}' for k,v in job.items() if v != 'False')
-            job_params = re.sub(r'--tab-in ', '', job_params)
-            command = f'singularity run {singularity_params} percolator.sif percolator {perc_params} {job_params}'
+            job_params = self.job_params(job)
+            command = f'singularity run {singularity_params} {os.path.join(self.workspace, "percolator.sif")} percolator {perc_params} {job_params}'
             print(command)
             
             start = time.time()
-            subprocess.run(command, shell = True)
+            self.run_command(command)
             end = time.time()
             
             #parse results
-            psms = pd.read_csv('results.pout', sep = '\t')
+            with self.span('parse-psms'):
+                psms = pd.read_csv('results.pout', sep = '\t')
             psms = psms[psms['q-value'] < 0.01]
             psms['fp'] = [all('ecoli' in p for p in ps.split(';')) for ps in psms['proteinIds']]
             fp = np.sum(psms['fp'])*16.6
@@ -122,14 +136,13 @@ class Percolator(pipeline_tools.Pipeline):
             depth = tp
             runtime = end - start
             
-            result_line = list(job.values()) + [depth, fdr, runtime]
-            with open('../outcomes.tsv', 'a') as tsv:
-                tsv.write('\t'.join(str(r) for r in result_line) + '\n')
+            self.record_outcome(job, (depth, fdr), runtime)
 
         except Exception as e:
             print(e)
         #clean up temporary files
-        os.chdir('..')
-        shutil.rmtree(temp_dir)
+        with self.span('cleanup'):
+            os.chdir(self.workspace)
+            shutil.rmtree(temp_dir)
 
 
@@ -9,10 +9,15 @@ Created on Mon Aug 26 17:20:57 2024
 from optimize_dinosaur import pipeline_tools
 
 class Pyopenms(pipeline_tools.PepQuantPipeline):
+    #score every onMultiMatch strategy from each feature finder run
+    sweep_rollup = True
+    supports_fidelity = True
+    
     def __init__(self):
         self.name = 'Pyopenms'
         self.cores = 2
-        self.memory = 8
+        self.file_memory_gb = 8
+        self.memory = self.cores*self.file_memory_gb
         self.timeout = '08:00:00'
     
     def get_params(self):
@@ -40,14 +45,17 @@ class Pyopenms(pipeline_tools.PepQuantPipeline):
         return params
 
     def setup_workspace(self):
+        super().setup_workspace()
         import subprocess
         import os
         import shutil
         
-        #copy tool script to working directory
-        tool = os.path.split(os.path.abspath(pipeline_tools.__file__))[0]
-        tool = os.path.join(os.path.split(tool)[0], 'tools/pms_quantify_peptides.py')
+        #copy tool script and its helper modules to working directory
+        package = os.path.split(os.path.abspath(pipeline_tools.__file__))[0]
+        tool = os.path.join(os.path.split(package)[0], 'tools/pms_quantify_peptides.py')
         shutil.copy2(tool, 'pms_quantify_peptides.py')
+        for module in ('feature_matching.py', 'psm_store.py'):
+            shutil.copy2(os.path.join(package, module), module)
         
         #make conda environment for running tool
         if not os.path.exists('~/.conda/envs/pyopenms_env'):
@@ -56,7 +64,6 @@ class Pyopenms(pipeline_tools.PepQuantPipeline):
                                      'pyopenms=3.1.0',
                                      'pandas=2.2.2', 
                                      'numpy=1.23.5', 
-                                     'sortedcontainers=2.4.0', 
                                      '-c bioconda', 
                                      '-c conda-forge']),
                            shell = True)
@@ -65,7 +72,6 @@ class Pyopenms(pipeline_tools.PepQuantPipeline):
         super().run_job(job)
         
         import os
-        import subprocess
         import shutil
         from time import time
         import traceback
@@ -74,49 +80,55 @@ class Pyopenms(pipeline_tools.PepQuantPipeline):
         import numpy as np
         
         #set up temporary workspace
-        tmpdir = str(os.getpid())
+        tmpdir = self.trial_dir()
         print(tmpdir, flush = True)
-        os.mkdir(tmpdir)
-        mzmls = [f for f in os.listdir() if f.endswith('.mzML') and f.startswith('20210827')]
+        mzmls = [f for f in os.listdir(self.inputs) if f.endswith('.mzML') and f.startswith('20210827')]
         base_names = [f[:-5] for f in mzmls]
-        psms = [f for f in os.listdir() if f.endswith('_PSMs.txt')]
         os.chdir(tmpdir)
         try:
-            for file in mzmls + psms:
-                os.link(f'../{file}', file)
+            with self.span('stage-inputs'):
+                for file in mzmls:
+                    os.link(os.path.join(self.inputs, file), file)
                 
             #make params file
             with open('params', 'w') as params:
                 params.write('\n'.join([f'{k}\t{v}' for k,v in job.items()]))
             
-            start = time()
-            peptide_results = []
-            for base_name in base_names:
+            #run the tool on every file at once and read each result as soon as it is done
+            def run_file(base_name):
                 mzml_file = next(mzml for mzml in mzmls if mzml.startswith(base_name))
-                psm_file = next(psm for psm in psms if psm.startswith(base_name))
                 command = ' '.join(['conda run -n pyopenms_env',
-                                    'python ../pms_quantify_peptides.py',
+                                    f'python {os.path.join(self.workspace, "pms_quantify_peptides.py")}',
                                     f'--mzml {mzml_file}',
-                                    f'--psms {psm_file}',
+                                    f'--psms {self.psm_store(base_name)}',
                                     '--params params',
                                     f'--output {base_name}.results'])
-                subprocess.run(command, shell = True)
-                peptide_results.append(pd.read_csv(f'{base_name}.results', sep = '\t').replace(0, np.nan))
-                
-            end = time()
+                self.run_command(command)
+            
+            def read_results(base_name):
+                with self.span('parse-features'):
+                    return pd.read_csv(f'{base_name}.results', sep = '\t').replace(0, np.nan)
             
-            #process results
-            quant_depth, mre = self.calc_metrics(peptide_results[0], peptide_results[1])
-            runtime = end - start
+            start = time()
+            peptide_results = self.run_files(base_names, run_file, read_results)
+            end = time()
             
-            result_line = list(job.values()) + [quant_depth, mre, runtime]
-            with open('../outcomes.tsv', 'a') as tsv:
-                tsv.write('\t'.join(str(r) for r in result_line) + '\n')
+            #process results, the tool reports every onMultiMatch strategy
+            strategies = self.get_params()['onMultiMatch'] if self.sweep_rollup else [job['onMultiMatch']]
+            siblings = []
+            for strategy in strategies:
+                tables = [r[['sequence', f'intensity_{strategy}']].set_axis(['sequence', 'intensity'], axis = 1)
+                          for r in peptide_results]
+                with self.span('metrics'):
+                    metrics = self.calc_metrics(*tables)
+                siblings.append((job if strategy == job['onMultiMatch'] else dict(job, onMultiMatch = strategy), metrics))
+            self.record_siblings(job, siblings, end - start)
             
         except Exception as e:
             traceback.print_exc(e)
         finally:
             #clean up temporary files
-            os.chdir('..')
-            shutil.rmtree(tmpdir)
+            with self.span('cleanup'):
+                os.chdir(self.workspace)
+                shutil.rmtree(tmpdir)
 
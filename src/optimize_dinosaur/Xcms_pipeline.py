@@ -9,10 +9,20 @@ Created on Wed Aug 28 15:37:38 2024
 from optimize_dinosaur import pipeline_tools
 
 class Xcms_base(pipeline_tools.FeatureFinderPipeline):
+    #whether pilot jobs send files to one XCMS server per node stage, which keeps the libraries and spectra loaded,
+    #instead of starting the container for every file, this needs node_staging and an xcms.sif built
+    #from src/tools/xcms_quantify_features since the published image predates --serve
+    xcms_server = False
+    #seconds a request waits for the server to take it before the trial fails
+    server_start_timeout = 900
+    #the number of files the server keeps the spectra of loaded, the least recently used are dropped
+    server_cache_files = 8
+    
     def __init__(self):
         self.name = NotImplemented
         self.cores = 2
-        self.memory = 16
+        self.file_memory_gb = 16
+        self.memory = self.cores*self.file_memory_gb
         self.timeout = '04:00:00'
         self.algorithm = NotImplemented
         self.get_params()
@@ -29,6 +39,7 @@ class Xcms_base(pipeline_tools.FeatureFinderPipeline):
         return params
 
     def setup_workspace(self):
+        super().setup_workspace()
         import subprocess
 
         #pull docker container based tool
@@ -48,29 +59,124 @@ class Xcms_base(pipeline_tools.FeatureFinderPipeline):
         with open(out_path, 'w') as toml_file:
             toml_file.write('\n'.join(toml) + '\n')
     
+    def server_request(self, mzml, output):
+        '''
+        has the XCMS server of the node stage find the features of one file, the server is started
+        on the first request of the stage and keeps every file it has read loaded until the stage is removed
+        arguments:
+            mzml: the path of the staged input mzML, which the server caches the spectra of
+            output: the path of the feature table to write
+        the xcms_params and merge_params files are read from the current directory,
+        the request is a file in the requests directory of the server holding a line of paths in the container,
+        the server takes it by removing it, runs it in a fork that writes its pid to output.pid
+        and answers by writing output or output.failed with the error
+        the trial budget applies as it does to run_command() and the walltime of the trial
+        applies whatever the budget, a request that runs out of either is withdrawn or its fork killed
+        '''
+        import os
+        import signal
+        import threading
+        from time import time, sleep
+        
+        from optimize_dinosaur.executors import LocalExecutor
+        from optimize_dinosaur.watchdog import TrialTimeout
+        
+        stage = self.node_stage()
+        #the forks run in place of the tools of the trials, so they share the node as those would
+        cpus, memory = LocalExecutor.node_resources()
+        workers = max(1, min(cpus // self.file_cores, int(memory // self.file_memory_gb)))
+        command = ' '.join([f'singularity run --bind {stage.directory}:/scratch/ {os.path.join(self.workspace, "xcms.sif")}',
+                            'Rscript /xcms/xcms_quantify_features.R',
+                            '--serve /scratch/services/xcms',
+                            f'--workers {workers}',
+                            f'--cache {self.server_cache_files}'])
+        def container(path):
+            return '/scratch/' + os.path.relpath(os.path.abspath(path), stage.directory)
+        line = '\t'.join([container(mzml), 
+                          container(output), 
+                          container('xcms_params'), 
+                          container('merge_params'), 
+                          self.algorithm]) + '\n'
+        failed = f'{output}.failed'
+        budget = getattr(self, 'budget', None)
+        deadline = self.trial_start + pipeline_tools.walltime_seconds(self.timeout)*self.fidelity
+        if budget is not None:
+            deadline = min(deadline, self.trial_start + budget)
+        start = time()
+        
+        directory = stage.service('xcms', command)
+        name = f'{os.getpid()}_{os.path.basename(output)}'
+        request = os.path.join(directory, 'requests', f'{name}.request')
+        #the request appears under its final name only once it is complete
+        with open(os.path.join(directory, 'requests', f'{name}.tmp'), 'w') as tmp:
+            tmp.write(line)
+        os.rename(tmp.name, request)
+        answered = False
+        try:
+            while os.path.exists(request):
+                if stage.service_pid('xcms') is None:
+                    stage.service('xcms', command)
+                if time() - start > self.server_start_timeout:
+                    raise RuntimeError(f'the XCMS server did not take {mzml}, see {directory}/log')
+                if time() > deadline:
+                    raise TrialTimeout(f'the XCMS server did not take {mzml} within the time left to the trial')
+                sleep(1)
+            
+            while not os.path.exists(output):
+                if os.path.exists(failed):
+                    answered = True
+                    with open(failed, 'r') as error:
+                        raise RuntimeError(f'XCMS failed on {mzml}: {error.read().strip()}')
+                if stage.service_pid('xcms') is None:
+                    raise RuntimeError(f'the XCMS server stopped while working on {mzml}, see {directory}/log')
+                if time() > deadline:
+                    raise TrialTimeout(f'XCMS ran on {mzml} for longer than the time left to the trial')
+                sleep(1)
+            answered = True
+        except TrialTimeout:
+            #the trial store belongs to the main thread, run_files() censors the trial from there
+            if threading.current_thread() is threading.main_thread():
+                self.censor_trial()
+            raise
+        finally:
+            if not answered:
+                try:
+                    #the server has not taken the request yet and now never will
+                    os.remove(request)
+                except FileNotFoundError:
+                    #a fork writes its pid before it looks for the marker, so either it skips the request
+                    #or its pid is there to be read
+                    open(f'{output}.cancelled', 'w').close()
+                    try:
+                        with open(f'{output}.pid', 'r') as pid_file:
+                            pid = int(pid_file.read())
+                        if os.getsid(pid) == stage.service_pid('xcms'):
+                            os.kill(pid, signal.SIGKILL)
+                    except (OSError, ValueError):
+                        pass
+            #the server is not a child of this process so only its time is known
+            self.record_tool_run(start, {})
+    
     def run_job(self, job):
         super().run_job(job)
         
         import os
-        import subprocess
         import shutil
         from time import time
         import traceback
 
-        import pandas as pd
         import numpy as np
         
         #set up temporary workspace
-        tmpdir = str(os.getpid())
+        tmpdir = self.trial_dir()
         print(tmpdir, flush = True)
-        os.mkdir(tmpdir)
-        mzmls = [f for f in os.listdir() if f.endswith('.mzML') and f.startswith('20210827')]
+        mzmls = [f for f in os.listdir(self.inputs) if f.endswith('.mzML') and f.startswith('20210827')]
         base_names = [f[:-5] for f in mzmls]
-        psms = [f for f in os.listdir() if f.endswith('_PSMs.txt')]
         os.chdir(tmpdir)
         try:
-            for file in mzmls + psms:
-                os.link(f'../{file}', file)
+            with self.span('stage-inputs'):
+                for file in mzmls:
+                    os.link(os.path.join(self.inputs, file), file)
                 
             #make params files
             self.write_toml(dict(i for i in job.items() if i[0] in self.xcms_param_set),
@@ -78,59 +184,51 @@ class Xcms_base(pipeline_tools.FeatureFinderPipeline):
             self.write_toml(dict(i for i in job.items() if i[0] in self.merge_param_set),
                             'merge_params')
 
-            start = time()
-            peptide_results = []
-            for base_name in base_names:
+            #run XCMS on every file at once and roll up each file as soon as it is done
+            def run_file(base_name):
                 mzml_file = next(mzml for mzml in mzmls if mzml.startswith(base_name))
-                command = ' '.join(['singularity run --bind ./:/data/ ../xcms.sif',
+                #the server lives in the node stage, which only a pilot holds for long enough
+                if self.xcms_server and self.pilot and self.node_staging:
+                    self.server_request(os.path.join(self.inputs, mzml_file), f'{base_name}.results')
+                    return
+                command = ' '.join([f'singularity run --bind ./:/data/ {os.path.join(self.workspace, "xcms.sif")}',
                                     'Rscript /xcms/xcms_quantify_features.R',
                                     f'--mzml /data/{mzml_file}',
                                     f'--output /data/{base_name}.results',
                                     '--xcms_params /data/xcms_params',
                                     '--peakmerge_params /data/merge_params',
                                     f'--algorithm {self.algorithm}'])
-                subprocess.run(command, shell = True)
-                
-                features = pd.read_csv(f'{base_name}.results', sep = '\t').replace(0, np.nan)
-                features.columns = ['mz',
-                                    'mzmin',
-                                    'mzmax',
-                                    'rt',
-                                    'rt_start',
-                                    'rt_end',
-                                    'intensity',
-                                    'intb',
-                                    'maxo',
-                                    'sn',
-                                    'sample']
-                features = features[['rt_start', 'rt_end', 'mz', 'intensity']]
-                features['rt_start'] = features['rt_start']/60
-                features['rt_end'] = features['rt_end']/60
-                
-                psms = pd.read_csv(f'{base_name}_PSMs.txt', sep = '\t')
-                psms['mass'] = psms['Theo. MH+ [Da]'] - pipeline_tools.H
-                psms['rt'] = psms['RT [min]']
-                psms['sequence'] = psms['Annotated Sequence']
-                psms = psms[['mass', 'rt', 'sequence']]  
-                
-                peptide_results.append(self.peptide_rollup(features, psms))
+                self.run_command(command)
+            
+            def rollup(base_name):
+                with self.span('parse-features'):
+                    features = pipeline_tools.read_feature_table(f'{base_name}.results', 'Xcms').replace(0, np.nan)
                 
+                psms = self.load_psms(base_name)
+                return self.rollup_file(features, psms)
+            
+            rollups = {}
+            def run_tool():
+                rollups.update(zip(base_names, self.run_files(base_names, run_file, rollup)))
+                return [f'{base_name}.results' for base_name in base_names]
+            tool_runtime = self.cached_tool_run(job, mzmls, run_tool)
+            start = time()
+            
+            #the tool did not run on a cache hit so the files are rolled up here
+            per_file = [rollups[b] if b in rollups else rollup(b) for b in base_names]
+            grid = self.sweep_grid(per_file)
             end = time()
             
             #process results
-            quant_depth, mre = self.calc_metrics(peptide_results[0], peptide_results[1])
-            runtime = end - start
-            
-            result_line = list(job.values()) + [quant_depth, mre, runtime]
-            with open('../outcomes.tsv', 'a') as tsv:
-                tsv.write('\t'.join(str(r) for r in result_line) + '\n')
+            self.record_sweep(job, grid, tool_runtime + end - start)
             
         except Exception as e:
             traceback.print_exc(e)
         finally:
             #clean up temporary files
-            os.chdir('..')
-            shutil.rmtree(tmpdir)
+            with self.span('cleanup'):
+                os.chdir(self.workspace)
+                shutil.rmtree(tmpdir)
 
 class Xcms_cw(Xcms_base):
     def __init__(self):
@@ -186,6 +284,8 @@ class Xcms_mf(Xcms_base):
         super().__init__()
         self.name = 'Xcms_mf'
         self.algorithm = 'xcms_mf'
+        #matched filter runs are too large to run side by side
+        self.file_memory_gb = 32
         self.memory = 32
 
     def get_params(self):
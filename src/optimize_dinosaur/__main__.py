@@ -15,8 +15,13 @@ parser = argparse.ArgumentParser()
 parser.add_argument('-t', '--task', action = 'store', choices = ['initialize',
                                                                  'optimize',
                                                                  'initial_job',
-                                                                 'genetic_job'],
-                    help = 'Which task to perform, you should only ever directly call initialize or optimize')
+                                                                 'genetic_job',
+                                                                 'queue_job',
+                                                                 'pilot_job',
+                                                                 'export',
+                                                                 'reap',
+                                                                 'hotspots'],
+                    help = 'Which task to perform, you should only ever directly call initialize, optimize, export, reap or hotspots')
 parser.add_argument('-i', '--index', action = 'store', type = int, required = False, default = -1,
                     help = 'The slurm array index')
 parser.add_argument('-d', '--directory', action = 'store', required = True,
@@ -25,19 +30,68 @@ parser.add_argument('-p', '--pipeline', action = 'store', required = True, choic
                     help = 'The pipeline to work on')
 parser.add_argument('-n', '--N_jobs', action = 'store', type = int, default = 95,
                     help = 'The number of genetic optimization jobs to run')
+parser.add_argument('-m', '--mode', action = 'store', choices = ['genetic', 'queue', 'pilot'], default = 'genetic',
+                    help = 'How optimize proposes genomes. genetic: every job breeds its own child. queue: this process coordinates and jobs pull genomes from it. pilot: as queue but whole node jobs run many trials at once until their walltime')
+parser.add_argument('-w', '--walltime', action = 'store', default = '24:00:00',
+                    help = 'The slurm time limit of pilot jobs')
+parser.add_argument('--pilots', action = 'store', type = int, default = 1,
+                    help = 'The number of pilot jobs, each holds one node')
+parser.add_argument('-g', '--strategy', action = 'store', choices = ['genetic', 'tpe', 'surrogate'], default = 'genetic',
+                    help = 'How new genomes are proposed. genetic: crossover and mutation of the Pareto front. tpe: a tree-structured Parzen estimator. surrogate: random forest screening of many genetic children')
+parser.add_argument('-f', '--fidelities', action = 'store', default = '1',
+                    help = 'Comma separated fractions of each gradient to evaluate genomes on, e.g. 0.25,1. Genomes that rank in the top of a fidelity are promoted to the next one')
+parser.add_argument('-s', '--store', action = 'store', choices = ['tsv', 'sqlite'], default = 'tsv',
+                    help = 'The trial store backend, only used by initialize. sqlite allows genetic jobs to start without staggering')
+parser.add_argument('-e', '--design', action = 'store', choices = ['oat', 'lhs', 'oa', 'halton'], default = 'oat',
+                    help = 'The initial design, only used by initialize. oat: every option of one parameter at a time, the default. lhs: a Latin hypercube over the options. oa: a strength 2 orthogonal array, a Latin hypercube if none fits in the budget. halton: a scrambled Halton sequence')
+parser.add_argument('-b', '--budget', action = 'store', type = int, default = 64,
+                    help = 'The number of initial trials, only used by initialize and ignored by the oat design')
+parser.add_argument('-r', '--runtime', action = 'store', choices = ['objective', 'ignore'], default = 'objective',
+                    help = 'Whether the runtime of a trial is minimized alongside the pipeline metrics')
+parser.add_argument('-c', '--runtime_cap', action = 'store', type = float, default = None,
+                    help = 'Trials that take longer than this many seconds are treated as failures')
+parser.add_argument('-x', '--expired', action = 'store', choices = ['fail', 'retry'], default = 'fail',
+                    help = 'What happens to trials whose job was killed without recording an outcome. fail: record a failed outcome. retry: allow the genome to be proposed again, only supported by the sqlite store')
+parser.add_argument('--executor', action = 'store', choices = ['slurm', 'local'], default = 'slurm',
+                    help = 'Where jobs run. slurm: as slurm array tasks. local: as processes on this machine, packed by the pipeline cores and memory')
+parser.add_argument('--cpus', action = 'store', type = int, default = None,
+                    help = 'The number of CPUs the local executor uses, defaults to all of them')
+parser.add_argument('--memory', action = 'store', type = float, default = None,
+                    help = 'The GB of memory the local executor uses, defaults to the available memory')
+parser.add_argument('--resources', action = 'store', choices = ['adaptive', 'static'], default = 'adaptive',
+                    help = 'How jobs are sized. adaptive: cores, memory and time limit shrink to what earlier trials used. static: the pipeline settings')
+parser.add_argument('--staging', action = 'store', choices = ['node', 'shared'], default = None,
+                    help = 'Where trials run. node: in $TMPDIR on copies of the inputs made once per node and kept while a job on the node holds them. shared: in the workspace on hard links of the inputs. Defaults to node in pilot mode and to shared otherwise, where every job would copy the inputs again')
 args = parser.parse_args()
 import os
+if args.staging is None:
+    #a pilot holds the stage for its walltime, single trial jobs would each copy the inputs and remove them again
+    args.staging = 'node' if args.mode == 'pilot' else 'shared'
 args.directory = os.path.abspath(args.directory)
+args.fidelities = [float(f) for f in args.fidelities.split(',')]
 
 from optimize_dinosaur.initial_setup import make_workspace, initial_slurm_array_submission
 from optimize_dinosaur.initial_trials import run_initial_job
-from optimize_dinosaur.optimizer_job import run_optimizer_job, genetic_slurm_array_submission
+from optimize_dinosaur.optimizer_job import (run_optimizer_job, genetic_slurm_array_submission, run_coordinator, 
+                                             run_queue_job, run_pilot_job, pilot_slurm_submission)
 
 pipeline = next(p for p in pipeline_objects if p.name == args.pipeline)
+pipeline.runtime_objective = args.runtime == 'objective'
+pipeline.runtime_cap = args.runtime_cap
+pipeline.retry_expired = args.expired == 'retry'
+pipeline.adaptive_resources = args.resources == 'adaptive'
+pipeline.node_staging = args.staging == 'node'
+#jobs run with the cores they were given, which adaptive sizing may have reduced
+if 'SLURM_CPUS_PER_TASK' in os.environ:
+    pipeline.cores = min(pipeline.cores, int(os.environ['SLURM_CPUS_PER_TASK']))
+
+from optimize_dinosaur.executors import LocalExecutor, SlurmExecutor
+executor = LocalExecutor(args.cpus, args.memory) if args.executor == 'local' else SlurmExecutor()
 
 if args.task == 'initialize':
-    make_workspace(args.directory, pipeline)
-    initial_slurm_array_submission(args.directory, pipeline)
+    make_workspace(args.directory, pipeline, args.store, args.design, args.budget)
+    initial_slurm_array_submission(args.directory, pipeline, executor)
+    executor.wait()
 
 else:
     if os.path.split(args.directory)[-1] == f'{pipeline.name}_optimization':
@@ -45,12 +99,59 @@ else:
               flush = True)
     os.chdir(os.path.join(args.directory, f'{pipeline.name}_optimization'))
     
+    if args.task in ('optimize', 'pilot_job') and pipeline.adaptive_resources:
+        pipeline.workspace = os.getcwd()
+        sized = pipeline.size_resources()
+        if sized:
+            print(f'sized jobs from {sized} trials: {pipeline.cores} cores, {pipeline.memory} GB, {pipeline.timeout}', flush = True)
+    
     if args.task == 'optimize':
-        genetic_slurm_array_submission(pipeline, args.directory, args.N_jobs)
+        if pipeline.supports_fidelity:
+            #every job reads the same cropped inputs, which are built once here
+            from optimize_dinosaur.fidelity import prepare_inputs
+            for fidelity in [f for f in args.fidelities if f < 1]:
+                prepare_inputs(os.getcwd(), fidelity)
+        if args.mode in ('queue', 'pilot'):
+            #workers must not see the closed marker of a previous coordinator
+            from optimize_dinosaur.work_queue import WorkQueue
+            WorkQueue('work_queue').open()
+            if args.mode == 'queue':
+                def submit(n):
+                    genetic_slurm_array_submission(pipeline, args.directory, n, 'queue_job', fidelities = args.fidelities, executor = executor)
+                submit(args.N_jobs)
+            else:
+                def submit(n):
+                    pilot_slurm_submission(pipeline, args.directory, args.pilots, args.walltime, args.fidelities, executor)
+                submit(args.pilots)
+            run_coordinator(pipeline, args.N_jobs, args.strategy, args.fidelities, resubmit = submit)
+        else:
+            genetic_slurm_array_submission(pipeline, args.directory, args.N_jobs, strategy = args.strategy, fidelities = args.fidelities, executor = executor)
+        executor.wait()
     
     elif args.task == 'initial_job':
         run_initial_job(args.index, pipeline)
     
     elif args.task == 'genetic_job':
-        run_optimizer_job(args.index, pipeline)
-
+        run_optimizer_job(args.index, pipeline, args.strategy, args.fidelities)
+    
+    elif args.task == 'queue_job':
+        run_queue_job(args.index, pipeline, args.fidelities)
+    
+    elif args.task == 'pilot_job':
+        run_pilot_job(args.index, pipeline, args.walltime, args.fidelities)
+    
+    elif args.task == 'export':
+        #rewrite the TSV tables from trials.sqlite for analysis, a no-op for the TSV store
+        from optimize_dinosaur.trial_store import open_store
+        open_store(os.getcwd(), pipeline).export_tsv()
+    
+    elif args.task == 'reap':
+        #recover trials killed by slurm and remove their temporary directories
+        from optimize_dinosaur.leases import reap
+        recovered, removed = reap(pipeline, os.getcwd(), pipeline.retry_expired)
+        print(f'recovered {recovered} trials and removed {removed} orphaned directories', flush = True)
+    
+    elif args.task == 'hotspots':
+        #where the time of the campaign went, by trial stage
+        from optimize_dinosaur.pipeline_tools import timing_summary
+        print(timing_summary(os.getcwd()).to_string(float_format = lambda x: f'{x:.2f}'), flush = True)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:02:37 2026
+
+@author: 4vt
+"""
+
+import numpy as np
+
+def primes(n):
+    '''
+    returns the first n prime numbers
+    '''
+    found = []
+    candidate = 2
+    while len(found) < n:
+        if all(candidate % p for p in found if p*p <= candidate):
+            found.append(candidate)
+        candidate += 1
+    return found
+
+def one_at_a_time(sizes, budget, rng):
+    '''
+    the defaults plus every option of one parameter at a time with the others at their defaults
+    the budget is ignored
+    '''
+    codes = [np.zeros(len(sizes), dtype = np.int16)]
+    for i, size in enumerate(sizes):
+        for option in range(1, size):
+            code = np.zeros(len(sizes), dtype = np.int16)
+            code[i] = option
+            codes.append(code)
+    return np.array(codes)
+
+def latin_hypercube(sizes, budget, rng, n_designs = 20):
+    '''
+    a Latin hypercube over the option indices, each parameter is split into budget strata
+    so every option appears in close to budget/size rows
+    the best of n_designs random hypercubes by the smallest number of genes
+    in which any two rows differ is returned
+    '''
+    best = None
+    best_distance = -1
+    for _ in range(n_designs):
+        strata = np.column_stack([rng.permutation(budget) for _ in sizes])
+        codes = np.floor((strata + rng.random(strata.shape))/budget*sizes).astype(np.int16)
+        distance = np.sum(codes[:,None,:] != codes[None,:,:], axis = 2)
+        distance = distance[np.triu_indices(budget, 1)].min() if budget > 1 else 0
+        if distance > best_distance:
+            best = codes
+            best_distance = distance
+    return best
+
+def orthogonal_array(sizes, budget, rng):
+    '''
+    a strength 2 orthogonal array from the Bose construction, p**2 runs over p + 1 columns
+    of p levels for a prime p, so every pair of parameters sees every pair of levels equally often
+    p is the largest prime with p**2 <= budget and enough columns for every parameter
+    a subset of the runs is not orthogonal, so if no such array fits in the budget
+    a Latin hypercube is returned instead
+    levels are mapped onto the options of each parameter spread evenly
+    '''
+    candidates = primes(max(len(sizes), int(np.sqrt(budget))) + 1)
+    fits = [prime for prime in candidates if prime + 1 >= len(sizes) and prime*prime <= budget]
+    if not fits:
+        print(f'no strength 2 orthogonal array over {len(sizes)} parameters fits in {budget} runs, using a Latin hypercube', flush = True)
+        return latin_hypercube(sizes, budget, rng)
+    p = max(fits)
+    i, j = np.divmod(np.arange(p*p), p)
+    columns = [i, j] + [(i + k*j) % p for k in range(1, p)]
+    columns = [columns[c] for c in rng.permutation(len(columns))[:len(sizes)]]
+    codes = np.column_stack([(rng.permutation(p)[c]*size)//p for c, size in zip(columns, sizes)])
+    return codes.astype(np.int16)
+
+def halton(sizes, budget, rng):
+    '''
+    a scrambled Halton sequence, one prime base per parameter
+    the digits of every base are randomly permuted to break up the correlations
+    between the larger bases that unscrambled sequences show in many dimensions
+    '''
+    points = np.zeros((budget, len(sizes)))
+    index = np.arange(1, budget + 1)
+    for d, base in enumerate(primes(len(sizes))):
+        n = index.copy()
+        scale = 1.0
+        while np.any(n > 0):
+            scale /= base
+            n, digit = np.divmod(n, base)
+            points[:, d] += rng.permutation(base)[digit]*scale
+    return np.minimum(np.floor(points*sizes), sizes - 1).astype(np.int16)
+
+designs = {'oat':one_at_a_time,
+           'lhs':latin_hypercube,
+           'oa':orthogonal_array,
+           'halton':halton}
+
+def initial_design(params, design = 'oat', budget = 64, seed = None):
+    '''
+    arguments:
+        params: a dictionary of {parameter:[value options]} from pipeline.get_params()
+        design: a key of designs
+        budget: the number of genomes to generate, the all defaults genome is added to every design
+        seed: the seed of the random generator
+    returns:
+        a dataframe of unique genomes with one column per parameter
+    '''
+    import pandas as pd
+
+    from optimize_dinosaur.genome import GenomeCodec
+
+    codec = GenomeCodec(params)
+    rng = np.random.default_rng(seed)
+    codes = designs[design](codec.sizes, budget, rng)
+    codes = np.vstack([np.zeros((1, len(codec.sizes)), dtype = np.int16), codes])
+    _, first = np.unique(codec.keys(codes), return_index = True)
+    codes = codes[np.sort(first)]
+    return pd.DataFrame([codec.decode(c) for c in codes], columns = codec.names)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 17:20:09 2026
+
+@author: 4vt
+"""
+
+import os
+import subprocess
+
+def slurm_params():
+    '''
+    returns the lines of slurm_params.txt, the site specific sbatch options
+    '''
+    slurm_params_file = os.path.abspath(__file__)
+    slurm_params_file = os.path.split(os.path.split(os.path.split(slurm_params_file)[0])[0])[0]
+    slurm_params_file = os.path.join(slurm_params_file, 'slurm_params.txt')
+    with open(slurm_params_file, 'r') as params_file:
+        return [l.strip() for l in params_file if l.strip()]
+
+class SlurmExecutor():
+    '''
+    runs tasks as a slurm array, one array task per index
+    '''
+    def submit(self, pipeline, arguments, N, timeout, script, exclusive = False):
+        '''
+        arguments:
+            pipeline: the pipeline being optimized, its cores and memory are requested per task
+            arguments: a list of the optimize_dinosaur command line arguments of every task,
+                the task index is appended as -i
+            N: the number of tasks
+            timeout: the slurm time limit of each task
+            script: the name of the sbatch script to write
+            exclusive: request a whole node with all of its memory for every task
+        '''
+        header = ['#!/bin/bash'] + ['#SBATCH ' + l for l in slurm_params()]
+        if exclusive:
+            resources = ['#SBATCH --exclusive', '#SBATCH --mem=0']
+        else:
+            resources = [f'#SBATCH -c {pipeline.cores}', f'#SBATCH --mem={pipeline.memory}g']
+        with open(script, 'w') as sbatch:
+            sbatch.write('\n'.join(header + [f'#SBATCH -t {timeout}',
+                                             '#SBATCH --nodes=1'] + resources + [
+                                             f'#SBATCH -J {pipeline.name}',
+                                             f'#SBATCH --output=out_{pipeline.name}_%j_%a.log',
+                                             f'#SBATCH --error=err_{pipeline.name}_%j_%a.log',
+                                             f'#SBATCH --array=0-{N-1}\n',]))
+            sbatch.write(' '.join(['python -m optimize_dinosaur'] + arguments + ['-i $SLURM_ARRAY_TASK_ID']))
+        subprocess.run(f'sbatch {script}', shell = True)
+
+    def wait(self):
+        #slurm runs the tasks after this process has exited
+        pass
+
+class LocalExecutor():
+    '''
+    runs tasks as processes on this machine, as many at once as fit into
+    the available CPUs and memory given pipeline.cores and pipeline.memory
+    each task is killed once it runs past the time limit, like slurm would
+    '''
+    def __init__(self, cpus = None, memory = None):
+        '''
+        arguments:
+            cpus: the number of CPUs to use, by default every CPU this process may run on
+            memory: the GB of memory to use, by default the memory available now
+        '''
+        self.cpus = cpus or len(os.sched_getaffinity(0))
+        self.memory = memory or self.available_memory()
+        self.pool = None
+
+    @staticmethod
+    def available_memory():
+        '''
+        returns MemAvailable from /proc/meminfo in GB
+        '''
+        with open('/proc/meminfo', 'r') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1])/2**20
+        raise OSError('MemAvailable is missing from /proc/meminfo')
+
+    @staticmethod
+    def node_resources():
+        '''
+        returns (CPUs, GB of memory) of this node or of the slurm allocation on it
+        '''
+        cpus = int(os.environ.get('SLURM_CPUS_ON_NODE', 0)) or len(os.sched_getaffinity(0))
+        #both variables are unset outside of slurm
+        memory = int(os.environ.get('SLURM_MEM_PER_NODE', 0))/1024 or LocalExecutor.available_memory()
+        return cpus, memory
+
+    def slots(self, pipeline):
+        '''
+        returns the number of tasks of pipeline that run at once, at least one
+        '''
+        return max(1, min(self.cpus // pipeline.cores, int(self.memory // pipeline.memory)))
+
+    def run_task(self, command, log, timeout):
+        from optimize_dinosaur.watchdog import supervised_run, TrialTimeout
+
+        try:
+            supervised_run(f'{command} > out_{log}.log 2> err_{log}.log', timeout)
+        except TrialTimeout as e:
+            print(e, flush = True)
+
+    def submit(self, pipeline, arguments, N, timeout, script, exclusive = False):
+        '''
+        arguments:
+            as for SlurmExecutor.submit(), script is not used
+            and exclusive tasks run one at a time with the whole machine
+        the tasks run in the background, call wait() to block until they are done
+        '''
+        import shlex
+        import sys
+        from concurrent.futures import ThreadPoolExecutor
+
+        from optimize_dinosaur.pipeline_tools import walltime_seconds
+
+        slots = 1 if exclusive else self.slots(pipeline)
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(slots)
+            self.futures = []
+        base = ' '.join([shlex.quote(sys.executable), '-m optimize_dinosaur'] + arguments)
+        print(f'running {N} tasks {slots} at a time', flush = True)
+        for i in range(N):
+            log = f'{pipeline.name}_{os.getpid()}_{i}'
+            self.futures.append(self.pool.submit(self.run_task, f'{base} -i {i}', log, walltime_seconds(timeout)))
+
+    def wait(self):
+        '''
+        blocks until every submitted task has finished
+        '''
+        if self.pool is None:
+            return
+        for future in self.futures:
+            future.result()
+        self.pool.shutdown()
+        self.pool = None
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:40:16 2026
+
+@author: 4vt
+"""
+
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+
+class FeatureCache():
+    '''
+    a content addressed store of raw feature finder output on the shared workspace
+    entries are keyed by the tool name, its parameters and the hashes of its input files
+    and the least recently used entries are evicted once the cache exceeds max_gb
+    '''
+    def __init__(self, directory, max_gb = 50):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_gb*1e9
+        os.makedirs(self.directory, exist_ok = True)
+        self.digest_file = os.path.join(self.directory, 'input_digests.json')
+
+    @contextmanager
+    def lock(self):
+        with open(f'{self.digest_file}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def file_digest(self, path):
+        '''
+        takes a file path
+        returns the sha256 hex digest of the file
+        digests are remembered by device, inode, size and modification time, so hard links
+        of an input share the digest of the original and large mzML files are only read once
+        per campaign, files are hashed under a lock so that concurrent jobs do not hash
+        the same file or drop each other's digests
+        '''
+        stat = os.stat(path)
+        stamp = f'{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}'
+        digests = self.read_json(self.digest_file)
+        if stamp not in digests:
+            with self.lock():
+                digests = self.read_json(self.digest_file)
+                if stamp not in digests:
+                    sha = hashlib.sha256()
+                    with open(path, 'rb') as file:
+                        for block in iter(lambda: file.read(1 << 20), b''):
+                            sha.update(block)
+                    digests[stamp] = sha.hexdigest()
+                    self.write_json(self.digest_file, digests)
+        return digests[stamp]
+
+    def key(self, tool, params, inputs):
+        '''
+        arguments:
+            tool: the tool name
+            params: a dictionary of the tool specific parameters
+            inputs: a list of input file paths
+        returns:
+            the cache key as a hex string
+        '''
+        content = {'tool':tool,
+                   'params':sorted((str(k), str(v)) for k,v in params.items()),
+                   'inputs':sorted((os.path.basename(f), self.file_digest(f)) for f in inputs)}
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+    def fetch(self, key, destination = '.'):
+        '''
+        arguments:
+            key: a cache key from self.key()
+            destination: the directory to restore the cached files into
+        returns:
+            the runtime of the original tool run or None on a cache miss
+        '''
+        entry = os.path.join(self.directory, key)
+        try:
+            meta = self.read_json(os.path.join(entry, 'entry.json'))
+            for file in meta['files']:
+                target = os.path.join(destination, file)
+                os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok = True)
+                self.link_or_copy(os.path.join(entry, 'files', file), target)
+            os.utime(entry)
+        except (OSError, KeyError, ValueError):
+            return None
+        return meta['runtime']
+
+    def store(self, key, files, runtime, source = '.'):
+        '''
+        arguments:
+            key: a cache key from self.key()
+            files: a list of tool output paths relative to source
+            runtime: the tool runtime in seconds
+            source: the directory the tool was run in
+        '''
+        staging = os.path.join(self.directory, f'tmp_{os.getpid()}_{key}')
+        try:
+            for file in files:
+                target = os.path.join(staging, 'files', file)
+                os.makedirs(os.path.dirname(target), exist_ok = True)
+                self.link_or_copy(os.path.join(source, file), target)
+            self.write_json(os.path.join(staging, 'entry.json'), {'files':list(files),
+                                                                  'runtime':runtime})
+            os.rename(staging, os.path.join(self.directory, key))
+        except OSError:
+            #another job stored this key first or an output is missing
+            shutil.rmtree(staging, ignore_errors = True)
+        self.evict()
+
+    def evict(self):
+        '''
+        removes least recently used entries until the cache fits in max_bytes
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if not os.path.isdir(entry) or name.startswith('tmp_'):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(root, f))
+                           for root, _, files in os.walk(entry) for f in files)
+                entries.append((os.path.getmtime(entry), size, entry))
+            except OSError:
+                #evicted by another job
+                continue
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        while entries and total > self.max_bytes:
+            _, size, entry = entries.pop(0)
+            shutil.rmtree(entry, ignore_errors = True)
+            total -= size
+
+    @staticmethod
+    def link_or_copy(source, target):
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    @staticmethod
+    def read_json(path):
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    @staticmethod
+    def write_json(path, data):
+        tmp = f'{path}.{os.getpid()}'
+        with open(tmp, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp, path)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:31 2026
+
+@author: 4vt
+
+this module only depends on numpy so that it can be copied next to the
+tool scripts and imported from inside their conda environments
+"""
+
+import numpy as np
+
+def unique_pairs(left, right, return_index = False):
+    '''
+    takes two equal length integer arrays
+    returns the unique (left, right) pairs as two int64 arrays sorted by left then right
+    if return_index is set the position of the first occurrence of each pair is also returned
+    '''
+    left = np.asarray(left, dtype = np.int64)
+    right = np.asarray(right, dtype = np.int64)
+    if not left.size:
+        return (left, right, left.copy()) if return_index else (left, right)
+    width = int(right.max()) + 1
+    keys, index = np.unique(left*width + right, return_index = True)
+    if return_index:
+        return keys // width, keys % width, index
+    return keys // width, keys % width
+
+def best_per_group(groups, values):
+    '''
+    arguments:
+        groups: an integer array of group labels
+        values: an array of scores with the same length as groups
+    returns:
+        a boolean mask that selects the single highest scoring entry of each group
+    '''
+    mask = np.zeros(len(groups), dtype = bool)
+    if not len(groups):
+        return mask
+    order = np.lexsort((-np.asarray(values), groups))
+    sorted_groups = np.asarray(groups)[order]
+    first = np.ones(len(order), dtype = bool)
+    first[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    mask[order[first]] = True
+    return mask
+
+def match_intervals(query_low, query_high, query_rt,
+                    feature_low, feature_high, rt_start, rt_end,
+                    chunk_size = 2000000):
+    '''
+    batched interval join between query windows and feature bounding boxes
+    a query matches a feature when their m/z intervals overlap and
+    the query retention time falls inside [rt_start, rt_end]
+    arguments:
+        query_low, query_high, query_rt: arrays with one entry per query
+        feature_low, feature_high, rt_start, rt_end: arrays with one entry per feature
+        chunk_size: roughly the number of candidate pairs to hold in memory at once
+    returns:
+        (query_index, feature_index) a pair of int64 arrays with one entry per match
+    '''
+    query_low = np.asarray(query_low, dtype = np.float64)
+    query_high = np.asarray(query_high, dtype = np.float64)
+    query_rt = np.asarray(query_rt, dtype = np.float64)
+    feature_low = np.asarray(feature_low, dtype = np.float64)
+    feature_high = np.asarray(feature_high, dtype = np.float64)
+    rt_start = np.asarray(rt_start, dtype = np.float64)
+    rt_end = np.asarray(rt_end, dtype = np.float64)
+    empty = np.zeros(0, dtype = np.int64)
+    if not (query_low.size and feature_low.size):
+        return empty, empty
+
+    #every candidate has a lower m/z bound in [query_low - max_width, query_high]
+    order = np.argsort(feature_low, kind = 'stable')
+    sorted_low = feature_low[order]
+    max_width = np.max(feature_high - feature_low)
+    first = np.searchsorted(sorted_low, query_low - max_width, side = 'left')
+    last = np.searchsorted(sorted_low, query_high, side = 'right')
+    counts = np.maximum(last - first, 0)
+
+    #split the queries so each chunk expands to about chunk_size candidates
+    cumulative = np.cumsum(counts)
+    edges = np.searchsorted(cumulative, np.arange(chunk_size, cumulative[-1], chunk_size))
+    edges = np.unique(np.concatenate(([0], edges, [len(counts)])))
+
+    query_hits = []
+    feature_hits = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        chunk_counts = counts[start:end]
+        total = int(np.sum(chunk_counts))
+        if not total:
+            continue
+        offsets = np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        queries = np.repeat(np.arange(start, end, dtype = np.int64), chunk_counts)
+        features = order[np.repeat(first[start:end], chunk_counts) + np.arange(total) - offsets]
+
+        hit = feature_high[features] >= query_low[queries]
+        hit &= rt_start[features] <= query_rt[queries]
+        hit &= rt_end[features] >= query_rt[queries]
+        query_hits.append(queries[hit])
+        feature_hits.append(features[hit].astype(np.int64))
+
+    if not query_hits:
+        return empty, empty
+    return np.concatenate(query_hits), np.concatenate(feature_hits)
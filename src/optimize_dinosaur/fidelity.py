@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:34:27 2026
+
+@author: 4vt
+"""
+
+import fcntl
+import os
+import re
+import shutil
+
+import numpy as np
+
+rt_pattern = re.compile(r'name="scan start time" value="([^"]+)"(?:[^>]*unitName="(\w+)")?')
+
+def spectrum_blocks(mzml):
+    '''
+    takes the path to an mzML file
+    yields (text, retention time in minutes) for each spectrum element
+    and (text, None) for the lines between spectra
+    mzML files are expected to be pretty printed with one element per line
+    as written by msconvert and ThermoRawFileParser
+    '''
+    with open(mzml, 'r') as file:
+        block = []
+        in_spectrum = False
+        for line in file:
+            if not in_spectrum and '<spectrum ' in line:
+                if block:
+                    yield ''.join(block), None
+                block = []
+                in_spectrum = True
+            block.append(line)
+            if in_spectrum and '</spectrum>' in line:
+                text = ''.join(block)
+                match = rt_pattern.search(text)
+                rt = np.nan
+                if match:
+                    rt = float(match.group(1))
+                    rt = rt/60 if match.group(2) == 'second' else rt
+                yield text, rt
+                block = []
+                in_spectrum = False
+        if block:
+            yield ''.join(block), None
+
+def rt_window(mzml, fraction):
+    '''
+    arguments:
+        mzml: the path to an mzML file
+        fraction: the fraction of the gradient to keep
+    returns:
+        (low, high) retention times in minutes of the central fraction of the run
+    '''
+    rts = np.array([rt for _, rt in spectrum_blocks(mzml) if rt is not None])
+    rts = rts[np.isfinite(rts)]
+    start, end = np.min(rts), np.max(rts)
+    margin = (end - start)*(1 - fraction)/2
+    return start + margin, end - margin
+
+def crop_mzml(source, target, low, high):
+    '''
+    writes a copy of an mzML file that only holds the spectra with a retention time in [low, high]
+    spectra are renumbered and the file is written without the index,
+    which every supported tool rebuilds on its own
+    '''
+    kept = sum(1 for _, rt in spectrum_blocks(source) if rt is not None and low <= rt <= high)
+    index = 0
+    in_index = False
+    with open(target, 'w') as out:
+        for text, rt in spectrum_blocks(source):
+            if rt is None:
+                #drop the indexedmzML wrapper and the byte offset index, which would be wrong
+                for line in text.splitlines(keepends = True):
+                    in_index = in_index or '<indexList' in line
+                    if in_index:
+                        in_index = '</indexList>' not in line
+                        continue
+                    if any(tag in line for tag in ('indexedmzML', '<indexListOffset', '<fileChecksum')):
+                        continue
+                    out.write(re.sub(r'(<spectrumList[^>]*count=")\d+', rf'\g<1>{kept}', line))
+            elif low <= rt <= high:
+                out.write(re.sub(r'(<spectrum [^>]*index=")\d+', rf'\g<1>{index}', text, count = 1))
+                index += 1
+
+def crop_psms(source, target, low, high):
+    '''
+    writes a copy of a Proteome Discoverer _PSMs.txt file with only the PSMs in [low, high] minutes
+    '''
+    import pandas as pd
+
+    psms = pd.read_csv(source, sep = '\t', dtype = str, keep_default_na = False, quoting = 3)
+    rt = pd.to_numeric(psms['RT [min]'], errors = 'coerce')
+    psms[(rt >= low) & (rt <= high)].to_csv(target, sep = '\t', index = False, quoting = 3)
+
+def prepare_inputs(workspace, fraction):
+    '''
+    arguments:
+        workspace: the optimization workspace directory
+        fraction: the fidelity, the fraction of each gradient to keep
+    returns:
+        the directory of RT cropped mzML files and matching _PSMs.txt files,
+        which is built once per campaign and then shared by every job
+    the optimize task builds every fidelity before any job starts, jobs that find one
+    missing build it under a lock so that the others wait for it instead of cropping their own copy
+    '''
+    target = os.path.join(workspace, f'fidelity_{fraction:g}')
+    if os.path.exists(target):
+        return target
+    with open(f'{target}.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(target):
+            return target
+        staging = f'{target}.{os.getpid()}'
+        os.mkdir(staging)
+        try:
+            for mzml in [f for f in os.listdir(workspace) if f.endswith('.mzML')]:
+                low, high = rt_window(os.path.join(workspace, mzml), fraction)
+                crop_mzml(os.path.join(workspace, mzml), os.path.join(staging, mzml), low, high)
+                psm_file = f'{mzml[:-5]}_PSMs.txt'
+                if os.path.exists(os.path.join(workspace, psm_file)):
+                    crop_psms(os.path.join(workspace, psm_file), os.path.join(staging, psm_file), low, high)
+            os.rename(staging, target)
+        finally:
+            shutil.rmtree(staging, ignore_errors = True)
+    return target
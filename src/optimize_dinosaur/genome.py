@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:14:52 2026
+
+@author: 4vt
+"""
+
+import hashlib
+
+import numpy as np
+
+class GenomeCodec():
+    '''
+    the canonical integer form of a genome, each gene is the index of the chosen
+    value in pipeline.get_params()[param] so genomes read back as strings from a table
+    and genomes built from numpy or python values encode identically
+    keys are stable 64-bit integers, when the product of the option counts fits
+    in 63 bits the key is the exact mixed radix number of the genome
+    '''
+    #the key of a genome with a value that is not among the options
+    invalid = np.iinfo(np.int64).min
+
+    def __init__(self, params):
+        self.names = list(params.keys())
+        self.options = [list(o) for o in params.values()]
+        self.sizes = np.array([len(o) for o in self.options], dtype = np.int64)
+        self.lookups = []
+        for options in self.options:
+            lookup = {}
+            for i, option in enumerate(options):
+                lookup.setdefault(str(option), i)
+            self.lookups.append(lookup)
+        self.dtype = np.uint8 if self.sizes.max() <= 256 else np.uint16
+        space = 1
+        for size in self.sizes:
+            space *= int(size)
+        self.packed = space < 2**63
+        self.radix = np.cumprod(np.concatenate(([1], self.sizes[:-1]))) if self.packed else None
+
+    def gene(self, i, value):
+        '''
+        returns the index of value among the options of parameter i or -1
+        values are matched by their string form and failing that numerically, so 5 matches '5.0'
+        '''
+        code = self.lookups[i].get(str(value))
+        if code is not None:
+            return code
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return -1
+        for code, option in enumerate(self.options[i]):
+            try:
+                if float(option) == value:
+                    return code
+            except (TypeError, ValueError):
+                continue
+        return -1
+
+    def encode(self, job):
+        '''
+        takes a dictionary of parameter choices, extra keys are ignored
+        returns an int16 array with one gene per parameter, -1 for unknown values
+        '''
+        return np.array([self.gene(i, job[n]) for i,n in enumerate(self.names)], dtype = np.int16)
+
+    def encode_frame(self, frame):
+        '''
+        takes a dataframe with one column per parameter
+        returns an int16 array of shape (rows, parameters), -1 for unknown values
+        '''
+        codes = np.empty((len(frame), len(self.names)), dtype = np.int16)
+        for i, name in enumerate(self.names):
+            genes = {}
+            column = frame[name]
+            for value in set(column):
+                genes[value] = self.gene(i, value)
+            codes[:,i] = [genes[v] for v in column]
+        return codes
+
+    def decode(self, code):
+        '''
+        takes an array of genes
+        returns a dictionary of parameter choices with the string form of the values from get_params(),
+        which is how they read back from the trial tables and how pipelines expect them
+        '''
+        return {n:str(o[int(c)]) for n,o,c in zip(self.names, self.options, code)}
+
+    def decode_strings(self, codes):
+        '''
+        takes an array of shape (rows, parameters)
+        returns a dictionary of {parameter:array of the string values}
+        '''
+        codes = np.asarray(codes).reshape(-1, len(self.names))
+        return {n:np.array([str(o) for o in options], dtype = object)[codes[:,i]]
+                for i,(n,options) in enumerate(zip(self.names, self.options))}
+
+    def key(self, genome):
+        '''
+        takes a dictionary of parameter choices or an array of genes
+        returns the 64-bit key of the genome
+        '''
+        code = self.encode(genome) if isinstance(genome, dict) else np.asarray(genome)
+        return int(self.keys(code.reshape(1, -1))[0])
+
+    def keys(self, codes):
+        '''
+        takes an array of shape (rows, parameters)
+        returns an int64 array of keys, rows with unknown genes get self.invalid
+        '''
+        codes = np.asarray(codes, dtype = np.int64).reshape(-1, len(self.names))
+        if self.packed:
+            keys = codes @ self.radix
+        else:
+            keys = np.array([int.from_bytes(hashlib.blake2b(c.astype('<u2').tobytes(), digest_size = 8).digest(),
+                                            'little', signed = True)
+                             for c in codes], dtype = np.int64)
+        keys[np.any(codes < 0, axis = 1)] = self.invalid
+        return keys
+
+    def pack(self, code):
+        '''
+        returns the genes as bytes for storage
+        '''
+        return np.asarray(code).astype(self.dtype).tobytes()
+
+    def unpack(self, data):
+        '''
+        takes the bytes from self.pack()
+        returns an int16 array of genes
+        '''
+        return np.frombuffer(data, dtype = self.dtype).astype(np.int16)
+
+    def random(self, rng):
+        '''
+        returns a uniformly random array of genes
+        '''
+        return rng.integers(0, self.sizes).astype(np.int16)
+
+    def crossover(self, a, b, rng):
+        '''
+        uniform crossover, each gene comes from either parent with equal probability
+        '''
+        return np.where(rng.integers(0, 2, len(self.names)).astype(bool), b, a).astype(np.int16)
+
+    def mutate(self, code, rng):
+        '''
+        returns a copy of the genes with one random gene set to a random option
+        '''
+        code = np.array(code, dtype = np.int16)
+        i = rng.integers(len(self.names))
+        code[i] = rng.integers(self.sizes[i])
+        return code
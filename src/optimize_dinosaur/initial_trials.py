@@ -7,7 +7,11 @@ Created on Tue Jul 30 15:25:11 2024
 """
 
 def run_initial_job(sarray_i, pipeline):
+    import os
+    
     import pandas as pd
+    
+    from optimize_dinosaur.leases import Lease
 
     jobs = pd.read_csv('initial_trials.tsv', 
                        sep = '\t', 
@@ -15,6 +19,11 @@ def run_initial_job(sarray_i, pipeline):
                        keep_default_na = False,
                        quoting = 3)
     job = {col:param for col,param in zip(jobs.columns, jobs.iloc[sarray_i,:])}
-    pipeline.run_job(job)
+    with Lease(os.getcwd(), job, 1.0, (pipeline.cores, pipeline.memory), pipeline.trial_path(os.getcwd())):
+        try:
+            pipeline.run_job(job)
+        finally:
+            pipeline.record_usage(job)
+            pipeline.record_timings(job)
     
  
\ No newline at end of file
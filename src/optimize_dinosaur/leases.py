@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 13:26:40 2026
+
+@author: 4vt
+"""
+
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+
+#seconds between heartbeats of a running trial
+heartbeat = 60
+#seconds without a heartbeat after which a trial is assumed to have been killed
+expiry = 900
+
+class Lease():
+    '''
+    a lease on an in-flight trial, held in leases/ of the workspace for as long as the
+    block runs and kept fresh by a heartbeat thread that touches the lease file
+    if slurm kills the job for walltime or memory the heartbeat stops and reap()
+    records the trial and removes its temporary directory
+    '''
+    def __init__(self, workspace, job, fidelity = 1.0, resources = None, scratch = None):
+        '''
+        arguments:
+            workspace: the optimization workspace directory
+            job: a dictionary of parameter choices
+            fidelity: the fidelity the trial runs at
+            resources: the (cores, memory in GB) of the job, reap() records
+                the trial at them if the job is killed
+            scratch: the temporary directory of the trial from pipeline.trial_path(),
+                <pid> in the workspace by default
+        '''
+        self.workspace = workspace
+        self.holder = f'{socket.gethostname()}_{os.getpid()}'
+        self.path = os.path.join(workspace, 'leases', f'{self.holder}.json')
+        self.lease = {'job':{k:str(v) for k,v in job.items()},
+                      'fidelity':fidelity,
+                      'holder':self.holder,
+                      'scratch':scratch or str(os.getpid()),
+                      'host':socket.gethostname(),
+                      'started':time.time()}
+        if resources is not None:
+            self.lease['cores'], self.lease['memory'] = resources
+        self.stop = threading.Event()
+
+    def beat(self):
+        while not self.stop.wait(heartbeat):
+            try:
+                os.utime(self.path)
+            except OSError:
+                #the lease was reaped while the file system was unreachable
+                return
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as file:
+            json.dump(self.lease, file)
+        os.replace(tmp, self.path)
+        self.thread = threading.Thread(target = self.beat, daemon = True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        return False
+
+def live_scratch(directory):
+    '''
+    returns the set of paths of the temporary directories held by leases that are not expired
+    '''
+    scratch = set()
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        try:
+            if not entry.endswith('.json') or time.time() - os.path.getmtime(path) > expiry:
+                continue
+            with open(path, 'r') as file:
+                scratch.add(os.path.join(os.path.dirname(directory), json.load(file)['scratch']))
+        except (OSError, ValueError):
+            continue
+    return scratch
+
+def reap(pipeline, workspace, retry = False):
+    '''
+    recovers the trials whose lease expired and removes orphaned temporary directories
+    arguments:
+        pipeline: the pipeline being optimized
+        workspace: the optimization workspace directory
+        retry: release the genome so it can be proposed again if the store allows it,
+            otherwise the trial is recorded as a failed outcome so it counts against the budget
+    returns:
+        (the number of trials recovered, the number of directories removed)
+    '''
+    from optimize_dinosaur.trial_store import open_store
+
+    directory = os.path.join(workspace, 'leases')
+    if not os.path.exists(directory):
+        return 0, 0
+    reaper = f'{socket.gethostname()}_{os.getpid()}'
+    store = None
+    recovered = 0
+    for entry in [e for e in os.listdir(directory) if e.endswith('.json')]:
+        path = os.path.join(directory, entry)
+        reaping = f'{path}.reaping.{reaper}'
+        try:
+            last_beat = os.path.getmtime(path)
+            if time.time() - last_beat < expiry:
+                continue
+            #only one reaper wins the rename
+            os.rename(path, reaping)
+            with open(reaping, 'r') as file:
+                lease = json.load(file)
+        except (OSError, ValueError):
+            continue
+
+        store = store or open_store(workspace, pipeline)
+        job = lease['job']
+        if not (retry and store.release(job)):
+            failed = [float('nan')]*len(store.metrics)
+            store.record_outcome(job, failed, time.time() - lease['started'], lease['fidelity'])
+        if 'memory' in lease:
+            #the job was killed without recording its usage, whether for memory or walltime
+            #is not known so it is recorded at its memory for as long as it was seen running
+            wall = max(last_beat - lease['started'], 0)
+            store.record_usage(job, {'peak_rss_gb':lease['memory'],
+                                     'cpu_seconds':lease['cores']*wall,
+                                     'tool_seconds':wall,
+                                     'wall_seconds':wall}, lease['fidelity'])
+        #a trial directory in node local scratch can only be removed from its own node,
+        #elsewhere it is left to the node stage, which removes the directories of dead jobs
+        if lease.get('host', socket.gethostname()) == socket.gethostname():
+            shutil.rmtree(os.path.join(workspace, lease['scratch']), ignore_errors = True)
+        os.remove(reaping)
+        recovered += 1
+        print(f'reaped the expired trial of {lease["holder"]}', flush = True)
+
+    #temporary directories are named for the pid of their job,
+    #those without a live lease that have not changed within the expiry are orphans
+    live = live_scratch(directory)
+    removed = 0
+    for entry in os.listdir(workspace):
+        path = os.path.join(workspace, entry)
+        if not entry.isdigit() or path in live or not os.path.isdir(path):
+            continue
+        try:
+            if time.time() - os.path.getmtime(path) < expiry:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors = True)
+        removed += 1
+    return recovered, removed
@@ -7,109 +7,422 @@ Created on Tue Jul 30 14:24:48 2024
 """
 
 def breeding_population(outcomes, pipeline):
-    from sortedcontainers import SortedList
-    metric1, metric2 = pipeline.get_metrics().items()
-    
-    m1_index = SortedList(zip(outcomes[metric1[0]], outcomes.index), key = lambda x: x[0]*metric1[1])
-    m2_index = SortedList(zip(outcomes[metric2[0]], outcomes.index), key = lambda x: x[0]*metric2[1])
-    
-    breeding_pop = []
-    for i, m1, m2 in zip(outcomes.index, 
-                         outcomes[metric1[0]], 
-                         outcomes[metric2[0]]):
-        m1_dominated = m1_index[m1_index.bisect_right((m1,)):]
-        if m1_dominated:
-            m1_dominated = set(o[1] for o in m1_dominated) if type(m1_dominated[0]) == tuple else set([m1_dominated[1]])
-        else:
-            m1_dominated = set([])
-        m2_dominated = m2_index[m2_index.bisect_right((m2,)):]
-        if m2_dominated:
-            m2_dominated = set(o[1] for o in m2_dominated) if type(m2_dominated[0]) == tuple else set([m2_dominated[1]])
-        else:
-            m2_dominated = set([])
-        if len(m1_dominated.intersection(m2_dominated)) <= 1:
-            breeding_pop.append(i)
-    
-    return breeding_pop
+    '''
+    arguments:
+        outcomes: the dataframe of outcomes read from the trial store
+        pipeline: the pipeline being optimized
+    returns:
+        (the outcome indices on the Pareto front, their selection probabilities)
+        the front over pipeline.get_objectives() and the hypervolume contributions of its members
+        are kept up to date incrementally in pareto_archive.json
+        members are selected in proportion to the hypervolume only they dominate,
+        so isolated trade-offs are bred more often than crowded ones
+        if the front has fewer than two members the best ranked outcomes are used
+    '''
+    import numpy as np
+    
+    from optimize_dinosaur.pareto import (ParetoArchive, pipeline_objectives, objective_signature, 
+                                          nondominated_sort, crowding_distance, normalize)
+    
+    points = pipeline_objectives(outcomes, pipeline)
+    archive = ParetoArchive('pareto_archive.json', objective_signature(pipeline))
+    archive.update(points)
+    rows = list(archive.rows)
+    
+    if len(rows) < 2:
+        ranks = nondominated_sort(points)
+        crowding = crowding_distance(points, ranks)
+        rows = list(np.lexsort((-crowding, ranks))[:2])
+        return list(outcomes.index[rows]), np.full(len(rows), 1/len(rows))
+    
+    #normalize over the whole population so no objective dominates the volume by its units
+    scaled, reference = normalize(points)
+    contributions = archive.hypervolume_contributions(scaled[rows], reference)
+    #every member keeps some chance of selection, duplicate points contribute nothing on their own
+    weights = np.full(len(rows), 0.1/len(rows))
+    if np.sum(contributions) > 0:
+        weights += 0.9*contributions/np.sum(contributions)
+    else:
+        weights *= 10
+    return list(outcomes.index[rows]), weights
 
-def run_optimizer_job(sarry_i, pipeline):
+def make_child(outcomes, attempts, pipeline, store, rng, breeding = None):
+    '''
+    arguments:
+        outcomes: the dataframe of outcomes read from the trial store
+        attempts: a set of the genome keys of every attempted genome
+        pipeline: the pipeline being optimized
+        store: the trial store, genomes are claimed in it if its claims are atomic,
+            None to only check against attempts
+        rng: a numpy random generator
+        breeding: the result of breeding_population() if it is already known
+    returns:
+        a dictionary of parameter choices that has not been attempted before
+    crossover and mutation work on the integer genes from genome.GenomeCodec
+    '''
+    from optimize_dinosaur.genome import GenomeCodec
+    
+    codec = GenomeCodec(pipeline.get_params())
+    
+    #find breeding population
+    if breeding is None:
+        breeding = breeding_population(outcomes, pipeline)
+    breeding_pop, weights = breeding
+    
+    #select parents
+    p1, p2 = rng.choice(breeding_pop, 2, replace = False, p = weights)
+    parents = codec.encode_frame(outcomes.loc[[p1, p2]])
+    
+    #make child, genes with values that are no longer options are redrawn
+    child = codec.crossover(parents[0], parents[1], rng)
+    unknown = child < 0
+    child[unknown] = codec.random(rng)[unknown]
+            
+    #muatate to ensure solution uniqueness
+    #with atomic claims the store has the final say in case another job took this genome
+    def taken(code):
+        if codec.key(code) in attempts:
+            return True
+        return store is not None and store.atomic_claims and not store.claim(codec.decode(code))
+    while taken(child):
+        child = codec.mutate(child, rng)
+    return codec.decode(child)
+
+def promoted(store, pipeline, job, fidelity, eta):
+    '''
+    asynchronous successive halving, a genome is promoted from a rung when it ranks
+    in the best 1/eta of the outcomes measured so far at that fidelity
+    arguments:
+        store: the trial store
+        pipeline: the pipeline being optimized
+        job: a dictionary of parameter choices
+        fidelity: the fidelity the genome was just measured at
+        eta: the ratio of the next fidelity to this one
+    returns:
+        True if the genome should be run at the next fidelity
+    '''
+    import numpy as np
+    
+    from optimize_dinosaur.genome import GenomeCodec
+    from optimize_dinosaur.strategies import ranked_outcomes
+    
+    codec = GenomeCodec(pipeline.get_params())
+    rungs = store.rung_outcomes(fidelity)
+    if len(rungs) < eta:
+        #too few outcomes on this rung to judge, keep climbing
+        return True
+    rows = np.flatnonzero(codec.keys(codec.encode_frame(rungs)) == codec.key(job))
+    if not len(rows):
+        #the run failed
+        return False
+    _, order = ranked_outcomes(rungs, pipeline)
+    return int(np.flatnonzero(order == rows[0])[0]) < np.ceil(len(rungs)/eta)
+
+def run_trial(pipeline, job, fidelities = (1.0,)):
+    '''
+    runs a genome at the lowest fidelity and promotes it up the ladder of fidelities
+    by successive halving, the last rung is always the full data
+    arguments:
+        pipeline: the pipeline being optimized
+        job: a dictionary of parameter choices
+        fidelities: the fractions of each gradient to run on
+    '''
+    import os
+    
+    from optimize_dinosaur.leases import Lease
+    
+    fidelities = sorted(set(fidelities) | {1.0}) if pipeline.supports_fidelity else [1.0]
+    try:
+        for low, high in zip(fidelities, fidelities[1:] + [None]):
+            pipeline.fidelity = low
+            with Lease(os.getcwd(), job, low, (pipeline.cores, pipeline.memory), pipeline.trial_path(os.getcwd())):
+                try:
+                    pipeline.run_job(dict(job))
+                finally:
+                    pipeline.record_usage(job)
+                    pipeline.record_timings(job)
+            if high is None or not promoted(pipeline.trial_store(), pipeline, job, low, high/low):
+                break
+    finally:
+        pipeline.fidelity = 1.0
+
+def trial_walltime(pipeline, fidelities = (1.0,)):
+    '''
+    returns the walltime in seconds of a trial that may run at every fidelity
+    '''
+    from optimize_dinosaur.pipeline_tools import walltime_seconds
+    
+    fidelities = sorted(set(fidelities) | {1.0}) if pipeline.supports_fidelity else [1.0]
+    return walltime_seconds(pipeline.timeout)*sum(fidelities)
+
+def run_optimizer_job(sarry_i, pipeline, strategy = 'genetic', fidelities = (1.0,)):
     import os
     import time
     
-    import pandas as pd
     import numpy as np
     
+    from optimize_dinosaur.leases import reap
+    from optimize_dinosaur.strategies import strategies
+    from optimize_dinosaur.trial_store import open_store
+    
     rng = np.random.default_rng(os.getpid())
-    #on some systems a large number of jobs get started at the same time
-    #to ensure we don't generate duplicate jobs we stagger the start times randomly
-    time.sleep(rng.uniform(0,20))
-    params = pipeline.get_params()
+    store = open_store(os.getcwd(), pipeline)
+    #recover trials of jobs that slurm killed before they recorded an outcome
+    reap(pipeline, os.getcwd(), pipeline.retry_expired)
+    if not store.atomic_claims:
+        #on some systems a large number of jobs get started at the same time
+        #to ensure we don't generate duplicate jobs we stagger the start times randomly
+        time.sleep(rng.uniform(0,20))
     
     #read finished run data and attempted solutions
-    attempts = pd.read_csv('attempted_solutions.tsv', 
-                           sep = '\t', 
-                           dtype = str, 
-                           keep_default_na = False,
-                           quoting = 3)
-    attempts = set(zip(*[attempts[c] for c in attempts.columns]))
-    
-    outcomes = pd.read_csv('outcomes.tsv', 
-                           sep = '\t', 
-                           dtype = str, 
-                           keep_default_na = False,
-                           quoting = 3)
+    attempts = store.attempts()
+    outcomes = store.outcomes()
+    
+    #run job
+    run_trial(pipeline, strategies[strategy]().propose(outcomes, attempts, pipeline, store, rng), fidelities)
+
+def run_coordinator(pipeline, N, strategy = 'genetic', fidelities = (1.0,), lookahead = 1, poll = 10,
+                    resubmit = None, idle = None, max_resubmits = 3):
+    '''
+    the ask/tell coordinator, it proposes genomes from the latest outcomes
+    and hands them to queue workers through the work_queue directory
+    arguments:
+        pipeline: the pipeline being optimized
+        N: the number of genomes to run
+        strategy: a key of strategies.strategies
+        fidelities: the fidelities the workers run genomes at
+        lookahead: the number of genomes kept pending beyond the waiting workers
+        poll: the number of seconds between checks of the queue
+        resubmit: a function that takes the number of genomes that are still to be run
+            and submits workers for them, called when no worker is left
+        idle: the number of seconds without a waiting or running worker after which
+            no worker is assumed to be left, defaults to the walltime of a trial
+        max_resubmits: the number of times workers are resubmitted before the coordinator gives up
+    the coordinator stops once N genomes finished or when no worker is left and
+    resubmit is None or was called max_resubmits times
+    '''
+    import os
+    import time
+    
+    import numpy as np
+    import pandas as pd
+    
+    from optimize_dinosaur.leases import reap
+    from optimize_dinosaur.strategies import strategies
+    from optimize_dinosaur.trial_store import open_store
+    from optimize_dinosaur.work_queue import WorkQueue
+    
+    rng = np.random.default_rng(os.getpid())
+    store = open_store(os.getcwd(), pipeline)
+    queue = WorkQueue('work_queue')
+    queue.open()
+    attempts = store.attempts()
+    outcomes = store.outcomes()
+    max_age = trial_walltime(pipeline, fidelities)
+    idle = max_age if idle is None else idle
+    strategy = strategies[strategy]()
+    
+    proposed = 0
+    finished = 0
+    #claims that expired are counted when they expire and not again if their worker posts late
+    expired = set()
+    resubmits = 0
+    last_seen = time.time()
+    while finished < N:
+        #tell, the outcomes themselves are read incrementally from the trial store
+        results = [r for r in queue.collect() if r['job_id'] not in expired]
+        newly_expired = queue.expire(max_age)
+        expired.update(newly_expired)
+        finished += len(results) + len(newly_expired)
+        reap(pipeline, os.getcwd(), pipeline.retry_expired)
+        new_outcomes = store.outcomes(len(outcomes))
+        if len(new_outcomes):
+            outcomes = pd.concat([outcomes, new_outcomes])
         
-    #find breeding population
-    breeding_pop = breeding_population(outcomes, pipeline)
+        #ask, only propose as many genomes as there are workers ready for them
+        while proposed < N and queue.n_pending() < queue.n_waiting() + lookahead:
+            job = strategy.propose(outcomes, attempts, pipeline, store, rng)
+            attempts.add(store.codec.key(job))
+            queue.put(job)
+            proposed += 1
+        print(f'proposed {proposed}, finished {finished} of {N}', flush = True)
+        
+        #array workers that timed out or died and pilots that reached their walltime leave genomes unclaimed
+        if results or queue.n_waiting() or queue.n_claimed():
+            last_seen = time.time()
+        elif finished < N and time.time() - last_seen > idle:
+            if resubmit is None or resubmits >= max_resubmits:
+                print(f'no worker was seen for {idle:.0f} seconds, stopping with {N - finished} genomes left', flush = True)
+                break
+            print(f'no worker was seen for {idle:.0f} seconds, resubmitting workers for {N - finished} genomes', flush = True)
+            resubmit(N - finished)
+            resubmits += 1
+            last_seen = time.time()
+        time.sleep(poll)
+    queue.close()
+
+def run_pulled(queue, pulled, pipeline, fidelities = (1.0,)):
+    '''
+    runs a genome pulled from the work queue and posts how it went
+    arguments:
+        queue: the work_queue.WorkQueue
+        pulled: the (job id, dictionary of parameter choices) from queue.pull()
+        pipeline: the pipeline being optimized
+        fidelities: the fidelities the genome is run at
+    '''
+    from time import time
     
-    #select parents
-    p1, p2 = rng.choice(breeding_pop, 2, replace = False)
-    p1 = outcomes.loc[p1, params.keys()]
-    p2 = outcomes.loc[p2, params.keys()]
-    
-    parent_params = {k:p for k,p in zip(params.keys(), zip(p1, p2))}
-    
-    #make child
-    choices = rng.choice((0,1), len(params.keys()), replace = True)
-    new_params = {k:parent_params[k][c] for k,c in zip(params.keys(), choices)}
-    for k in new_params.keys():
-        if type(new_params[k]) != str:
-            new_params[k] = new_params[k].item()
-            
-    #muatate to ensure solution uniqueness
-    while tuple(new_params.values()) in attempts:
-        mutate_param = str(rng.choice(list(params.keys()), 1)[0])
-        new_params[mutate_param] = rng.choice(params[mutate_param], 1)[0].item()
+    job_id, job = pulled
+    start = time()
+    status = 'done'
+    try:
+        run_trial(pipeline, job, fidelities)
+    except Exception:
+        status = 'failed'
+        raise
+    finally:
+        queue.post(job_id, {'status':status, 'elapsed':time() - start})
 
-    #run job
-    pipeline.run_job(new_params)
+def run_queue_job(sarray_i, pipeline, fidelities = (1.0,)):
+    '''
+    a queue worker, pulls one genome from the coordinator and runs it
+    '''
+    from optimize_dinosaur.work_queue import WorkQueue
+    
+    queue = WorkQueue('work_queue')
+    pulled = queue.pull()
+    if pulled is None:
+        return
+    run_pulled(queue, pulled, pipeline, fidelities)
 
+def run_pilot_slot(pipeline, deadline, fidelities = (1.0,)):
+    '''
+    one slot of a pilot job, pulls and runs genomes until the queue is closed
+    or there is not enough time left before the deadline to finish another trial
+    '''
+    import traceback
+    from time import time
+    
+    from optimize_dinosaur.work_queue import WorkQueue
+    
+    #a sqlite connection or worker pool inherited from the pilot must not be shared across the fork
+    pipeline.store = None
+    pipeline.rollup_pool = None
+    queue = WorkQueue('work_queue')
+    while True:
+        remaining = deadline - time() - trial_walltime(pipeline, fidelities)
+        if remaining <= 0:
+            return
+        pulled = queue.pull(timeout = remaining)
+        if pulled is None:
+            return
+        try:
+            run_pulled(queue, pulled, pipeline, fidelities)
+        except Exception:
+            #a failed trial must not end the slot
+            traceback.print_exc()
 
-def genetic_slurm_array_submission(pipeline, target, N):
-    import subprocess
+def run_pilot_job(sarray_i, pipeline, walltime, fidelities = (1.0,), margin = 120):
+    '''
+    a pilot job holds a whole node for walltime and runs as many trials at once as fit,
+    floor(node cores/pipeline.cores) limited by memory, each slot is a separate process
+    so the temporary directories, working directory and trial store connection are its own
+    arguments:
+        sarray_i: the slurm array index
+        pipeline: the pipeline being optimized
+        walltime: the slurm time limit of the pilot job
+        fidelities: the fidelities genomes are run at
+        margin: the number of seconds before walltime by which every trial should have finished
+    '''
+    import multiprocessing
     import os
+    from time import time
+    
+    from optimize_dinosaur.executors import LocalExecutor
+    from optimize_dinosaur.pipeline_tools import walltime_seconds
+    
+    deadline = time() + walltime_seconds(walltime) - margin
+    cpus, memory = LocalExecutor.node_resources()
+    slots = LocalExecutor(cpus, memory).slots(pipeline)
+    print(f'pilot {sarray_i} running {slots} slots', flush = True)
+    pipeline.pilot = True
+    
+    if pipeline.node_staging:
+        #the slots share the reference of this process, so the node stage lives as long as the pilot
+        pipeline.workspace = os.getcwd()
+        pipeline.node_stage()
+    
+    if getattr(pipeline, 'store', None) is not None and hasattr(pipeline.store, 'close'):
+        #every slot opens its own connection
+        pipeline.store.close()
+        pipeline.store = None
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target = run_pilot_slot, args = (pipeline, deadline, fidelities))
+                 for _ in range(slots)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    pipeline.release_stage()
 
-    slurm_params_file = os.path.abspath(__file__)
-    slurm_params_file = os.path.split(os.path.split(os.path.split(slurm_params_file)[0])[0])[0]
-    slurm_params_file = os.path.join(slurm_params_file, 'slurm_params.txt')
-    with open(slurm_params_file, 'r') as params_file:
-        local_params = ['#SBATCH ' + l.strip() for l in params_file]
-    
-    header = ['#!/bin/bash'] + local_params
-    with open('genetic_run_script.sbatch', 'w') as sbatch:
-        sbatch.write('\n'.join(header + [f'#SBATCH -t {pipeline.timeout}',
-                                         '#SBATCH --nodes=1',
-                                         f'#SBATCH -c {pipeline.cores}',
-                                         f'#SBATCH --mem={pipeline.memory}g',
-                                         f'#SBATCH -J {pipeline.name}',
-                                         f'#SBATCH --output=out_{pipeline.name}_%j_%a.log',
-                                         f'#SBATCH --error=err_{pipeline.name}_%j_%a.log',
-                                         f'#SBATCH --array=0-{N-1}\n',]))
-        sbatch.write(' '.join(['python -m optimize_dinosaur',
-                               '-t genetic_job',
-                               f'-d {target}',
-                               f'-p {pipeline.name}',
-                               '-i $SLURM_ARRAY_TASK_ID']))
-    
-    subprocess.run('sbatch genetic_run_script.sbatch', shell = True)
+def campaign_arguments(pipeline):
+    '''
+    returns the command line arguments that carry the campaign settings of pipeline to its jobs
+    '''
+    arguments = [f'-r {"objective" if pipeline.runtime_objective else "ignore"}',
+                 f'-x {"retry" if pipeline.retry_expired else "fail"}',
+                 f'--resources {"adaptive" if pipeline.adaptive_resources else "static"}',
+                 f'--staging {"node" if pipeline.node_staging else "shared"}']
+    if pipeline.runtime_cap is not None:
+        arguments.append(f'-c {pipeline.runtime_cap:g}')
+    return arguments
 
+def genetic_slurm_array_submission(pipeline, target, N, task = 'genetic_job', strategy = 'genetic', fidelities = (1.0,), executor = None):
+    '''
+    arguments:
+        pipeline: the pipeline to optimize
+        target: the directory containing input data
+        N: the number of jobs
+        task: the task of every job, genetic_job or queue_job
+        strategy: a key of strategies.strategies
+        fidelities: the fidelities genomes are run at
+        executor: where the jobs run, an executors.SlurmExecutor by default
+    '''
+    from optimize_dinosaur.executors import SlurmExecutor
+    from optimize_dinosaur.pipeline_tools import slurm_walltime
+    
+    #a genome may run at every fidelity before it reaches the full data
+    fidelities = sorted(set(fidelities) | {1.0}) if pipeline.supports_fidelity else [1.0]
+    timeout = pipeline.timeout if len(fidelities) == 1 else slurm_walltime(trial_walltime(pipeline, fidelities))
+    
+    arguments = [f'-t {task}',
+                 f'-d {target}',
+                 f'-p {pipeline.name}',
+                 f'-g {strategy}',
+                 f'-f {",".join(f"{f:g}" for f in fidelities)}'] + campaign_arguments(pipeline)
+    
+    executor = executor or SlurmExecutor()
+    executor.submit(pipeline, arguments, N, timeout, 'genetic_run_script.sbatch')
+
+def pilot_slurm_submission(pipeline, target, N, walltime, fidelities = (1.0,), executor = None):
+    '''
+    submits pilot jobs that run queue workers in slots on whole nodes
+    arguments:
+        pipeline: the pipeline to optimize
+        target: the directory containing input data
+        N: the number of pilot jobs, i.e. nodes
+        walltime: the slurm time limit of every pilot job
+        fidelities: the fidelities genomes are run at
+        executor: where the pilot jobs run, an executors.SlurmExecutor by default
+    '''
+    from optimize_dinosaur.executors import SlurmExecutor
+    
+    fidelities = sorted(set(fidelities) | {1.0}) if pipeline.supports_fidelity else [1.0]
+    arguments = ['-t pilot_job',
+                 f'-d {target}',
+                 f'-p {pipeline.name}',
+                 f'-f {",".join(f"{f:g}" for f in fidelities)}',
+                 f'-w {walltime}'] + campaign_arguments(pipeline)
+    
+    executor = executor or SlurmExecutor()
+    executor.submit(pipeline, arguments, N, walltime, 'pilot_run_script.sbatch', exclusive = True)
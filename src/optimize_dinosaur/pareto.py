@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:05:33 2026
+
+@author: 4vt
+"""
+
+import json
+import os
+
+import numpy as np
+
+def objective_matrix(outcomes, metrics):
+    '''
+    arguments:
+        outcomes: a dataframe with one column per metric, values may be strings
+        metrics: a dictionary of {metric:1 if larger is good else -1}
+    returns:
+        a float array of shape (rows, metrics) where smaller is better in every column
+        missing or unparsable values are set to inf so they never dominate
+    '''
+    import pandas as pd
+
+    points = np.column_stack([pd.to_numeric(outcomes[m], errors = 'coerce').to_numpy(dtype = float)*-d
+                              for m, d in metrics.items()])
+    points[~np.isfinite(points)] = np.inf
+    return points
+
+def pipeline_objectives(outcomes, pipeline):
+    '''
+    arguments:
+        outcomes: a dataframe of outcomes read from the trial store
+        pipeline: the pipeline being optimized
+    returns:
+        objective_matrix() of pipeline.get_objectives(), rows over pipeline.runtime_cap are set to inf
+        the cap is scaled by the fidelity for rung outcomes
+    '''
+    import pandas as pd
+
+    points = objective_matrix(outcomes, pipeline.get_objectives())
+    if pipeline.runtime_cap is not None:
+        cap = np.full(len(outcomes), float(pipeline.runtime_cap))
+        if 'fidelity' in outcomes.columns:
+            cap *= pd.to_numeric(outcomes['fidelity'], errors = 'coerce').to_numpy(dtype = float)
+        runtime = pd.to_numeric(outcomes['runtime'], errors = 'coerce').to_numpy(dtype = float)
+        points[~(runtime <= cap)] = np.inf
+    return points
+
+def objective_signature(pipeline):
+    '''
+    returns a string that changes whenever pipeline_objectives() would compute different points
+    '''
+    return f'{sorted(pipeline.get_objectives().items())} cap={pipeline.runtime_cap}'
+
+def dominated_by(front, point):
+    '''
+    takes an array of points and a single point, all objectives minimized
+    returns True if any point in front dominates point
+    '''
+    return bool(np.any(np.all(front <= point, axis = 1) & np.any(front < point, axis = 1)))
+
+def nondominated_sort(points):
+    '''
+    efficient non-dominated sort with binary search over fronts
+    takes an array of shape (n, objectives) where every objective is minimized
+    returns an int array of front ranks where 0 is the Pareto front
+    with two objectives each front only has to be checked against its last member,
+    which makes the sort O(n log n)
+    '''
+    points = np.asarray(points, dtype = float)
+    n, n_objectives = points.shape
+    ranks = np.zeros(n, dtype = np.int64)
+    order = np.lexsort(points.T[::-1])
+    
+    if n_objectives == 2:
+        #the last member of a front has the largest first and smallest second objective
+        last = []
+        for i in order:
+            x, y = points[i]
+            low, high = 0, len(last)
+            while low < high:
+                middle = (low + high)//2
+                lx, ly = last[middle]
+                if ly <= y and (lx < x or ly < y):
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == len(last):
+                last.append((x, y))
+            else:
+                last[low] = (x, y)
+            ranks[i] = low
+        return ranks
+    
+    #members of each front are kept in growing buffers for vectorized dominance checks
+    fronts = []
+    sizes = []
+    for i in order:
+        point = points[i]
+        low, high = 0, len(fronts)
+        while low < high:
+            middle = (low + high)//2
+            if dominated_by(fronts[middle][:sizes[middle]], point):
+                low = middle + 1
+            else:
+                high = middle
+        if low == len(fronts):
+            fronts.append(np.empty((16, n_objectives)))
+            sizes.append(0)
+        if sizes[low] == len(fronts[low]):
+            fronts[low] = np.vstack([fronts[low], np.empty_like(fronts[low])])
+        fronts[low][sizes[low]] = point
+        sizes[low] += 1
+        ranks[i] = low
+    return ranks
+
+def crowding_distance(points, ranks):
+    '''
+    arguments:
+        points: an array of shape (n, objectives)
+        ranks: the front ranks from nondominated_sort()
+    returns:
+        the NSGA-II crowding distance of every point within its own front
+        boundary points of each front have infinite distance
+    '''
+    points = np.asarray(points, dtype = float)
+    distance = np.zeros(len(points))
+    for rank in np.unique(ranks):
+        members = np.flatnonzero(ranks == rank)
+        if len(members) < 3:
+            distance[members] = np.inf
+            continue
+        for objective in points[members].T:
+            order = np.argsort(objective, kind = 'stable')
+            values = objective[order]
+            with np.errstate(invalid = 'ignore'):
+                #a front of failed runs is all inf
+                span = values[-1] - values[0]
+            distance[members[order[[0, -1]]]] = np.inf
+            if np.isfinite(span) and span > 0:
+                distance[members[order[1:-1]]] += (values[2:] - values[:-2])/span
+    return distance
+
+def normalize(points, reference = 1.1):
+    '''
+    arguments:
+        points: an array of shape (n, objectives), all minimized, non-finite rows are ignored
+        reference: the reference point coordinate in normalized units
+    returns:
+        (points scaled so the finite rows span [0, 1] in every objective, reference point)
+    '''
+    points = np.asarray(points, dtype = float)
+    finite = np.all(np.isfinite(points), axis = 1)
+    if not np.any(finite):
+        return points, np.full(points.shape[1], reference)
+    low = points[finite].min(axis = 0)
+    span = points[finite].max(axis = 0) - low
+    span[span == 0] = 1
+    return (points - low)/span, np.full(points.shape[1], reference)
+
+def hypervolume_3d(points, reference):
+    '''
+    arguments:
+        points: an array of shape (n, 3), all minimized and dominating the reference point
+        reference: the reference point
+    returns:
+        the dominated volume, swept along the last objective in O(n log n)
+        the two dimensional front of the points below the sweep is kept sorted
+        so that each point only updates the area it adds to it
+    '''
+    import bisect
+    
+    points = points[np.argsort(points[:,2], kind = 'stable')]
+    #the front below the sweep, x ascending and y descending
+    xs = []
+    ys = []
+    area = 0.0
+    volume = 0.0
+    last_z = points[0, 2]
+    for x, y, z in points:
+        volume += area*(z - last_z)
+        last_z = z
+        position = bisect.bisect_left(xs, x)
+        if position and ys[position - 1] <= y:
+            continue
+        if position < len(xs) and xs[position] == x and ys[position] <= y:
+            continue
+        top = ys[position - 1] if position else reference[1]
+        left = x
+        end = position
+        while end < len(xs) and ys[end] >= y:
+            #points that the new one dominates, the area under them is already counted
+            area += (xs[end] - left)*(top - y)
+            left = xs[end]
+            top = ys[end]
+            end += 1
+        right = xs[end] if end < len(xs) else reference[0]
+        area += (right - left)*(top - y)
+        xs[position:end] = [x]
+        ys[position:end] = [y]
+    return volume + area*(reference[2] - last_z)
+
+def hypervolume(points, reference):
+    '''
+    arguments:
+        points: an array of shape (n, objectives), all minimized
+        reference: the reference point, only the parts of points that dominate it count
+    returns:
+        the volume dominated by the points and bounded by the reference point
+    two and three objectives are swept in O(n log n), more are sliced along the last objective
+    '''
+    points = np.asarray(points, dtype = float)
+    reference = np.asarray(reference, dtype = float)
+    points = points[np.all(points < reference, axis = 1)]
+    if not len(points):
+        return 0.0
+    if points.shape[1] == 1:
+        return float(reference[0] - points[:,0].min())
+    if points.shape[1] == 2:
+        points = points[np.lexsort((points[:,1], points[:,0]))]
+        volume = 0.0
+        best_y = reference[1]
+        for x, y in points:
+            if y < best_y:
+                volume += (reference[0] - x)*(best_y - y)
+                best_y = y
+        return volume
+    if points.shape[1] == 3:
+        return hypervolume_3d(points, reference)
+    points = points[np.argsort(points[:,-1], kind = 'stable')]
+    volume = 0.0
+    for i in range(len(points)):
+        top = points[i + 1, -1] if i + 1 < len(points) else reference[-1]
+        if top > points[i, -1]:
+            volume += (top - points[i, -1])*hypervolume(points[:i + 1, :-1], reference[:-1])
+    return volume
+
+def hypervolume_contributions(points, reference):
+    '''
+    arguments:
+        points: an array of shape (n, objectives) of mutually non-dominated points, all minimized
+        reference: the reference point
+    returns:
+        the volume that only each point dominates
+    the contribution of a point is the volume of its box less the part of it that the other points
+    dominate, which is the hypervolume of the other points limited to the box
+    up to three objectives that is one O(n log n) sweep per point, with more objectives only the
+    limited points that are not dominated inside the box are sliced, usually a few neighbours
+    '''
+    points = np.asarray(points, dtype = float)
+    reference = np.asarray(reference, dtype = float)
+    contributions = np.zeros(len(points))
+    inside = np.all(points < reference, axis = 1)
+    for i in np.flatnonzero(inside):
+        limited = np.maximum(points[inside & (np.arange(len(points)) != i)], points[i])
+        limited = limited[np.all(limited < reference, axis = 1)]
+        box = float(np.prod(reference - points[i]))
+        if not len(limited):
+            contributions[i] = box
+            continue
+        if points.shape[1] > 3:
+            #slicing pays for every point it is given, the sweeps skip dominated points by themselves
+            #a point can only be dominated by one with a smaller sum, so one pass in that order finds the front
+            limited = np.unique(limited, axis = 0)
+            limited = limited[np.argsort(limited.sum(axis = 1), kind = 'stable')]
+            #most are dominated by one of the first few, which is cheap to check all at once
+            head = limited[:64, None]
+            dominated = np.any(np.all(head <= limited, axis = 2) & np.any(head < limited, axis = 2), axis = 0)
+            limited = limited[~dominated]
+            keep = [0]
+            for j in range(1, len(limited)):
+                if not dominated_by(limited[keep], limited[j]):
+                    keep.append(j)
+            limited = limited[keep]
+        contributions[i] = max(box - hypervolume(limited, reference), 0.0)
+    return contributions
+
+class ParetoArchive():
+    '''
+    the persisted set of non-dominated outcomes
+    it remembers how many outcome rows it has seen so that each new result
+    only has to be compared against the current front, and the hypervolume contributions
+    of the front so that they are only recomputed when the front or its scaling changes
+    '''
+    def __init__(self, path, signature = ''):
+        '''
+        arguments:
+            path: the json file the archive is kept in
+            signature: a description of how the objectives were computed,
+                the archive starts over when it changes
+        '''
+        self.path = path
+        self.signature = signature
+        self.processed = 0
+        self.rows = []
+        self.points = np.zeros((0, 0))
+        self.contributions = {}
+        if os.path.exists(path):
+            with open(path, 'r') as archive:
+                data = json.load(archive)
+            if data.get('signature', '') == signature:
+                self.processed = data['processed']
+                self.rows = data['rows']
+                if self.rows:
+                    self.points = np.array(data['points'], dtype = float)
+                self.contributions = data.get('contributions', {})
+
+    def add(self, row, point):
+        '''
+        arguments:
+            row: the index of the outcome
+            point: its objective values, all minimized
+        returns:
+            True if the outcome entered the archive
+        '''
+        point = np.asarray(point, dtype = float)
+        if row in self.rows or not np.all(np.isfinite(point)):
+            return False
+        if self.rows:
+            if dominated_by(self.points, point):
+                return False
+            keep = ~(np.all(point <= self.points, axis = 1) & np.any(point < self.points, axis = 1))
+            self.rows = [r for r, k in zip(self.rows, keep) if k]
+            self.points = self.points[keep]
+        self.rows.append(row)
+        self.points = np.vstack([self.points.reshape(-1, len(point)), point])
+        return True
+
+    def update(self, points, start = None):
+        '''
+        arguments:
+            points: the objective matrix of every outcome row
+            start: the first row to add, defaults to the first row not yet processed
+        adds the new rows to the archive and saves it
+        '''
+        start = self.processed if start is None else start
+        if start > len(points) or self.points.shape[1] not in (0, points.shape[1]):
+            #the outcomes or objectives changed, start over
+            self.rows = []
+            self.points = np.zeros((0, points.shape[1]))
+            start = 0
+        for row in range(start, len(points)):
+            self.add(row, points[row])
+        self.processed = len(points)
+        self.save()
+
+    def hypervolume_contributions(self, scaled, reference):
+        '''
+        arguments:
+            scaled: the normalized objective values of the archive rows, in the order of self.rows
+            reference: the reference point
+        returns:
+            hypervolume_contributions(scaled, reference), from the archive if they were already computed
+        '''
+        scaled = np.asarray(scaled, dtype = float)
+        reference = np.asarray(reference, dtype = float)
+        cached = self.contributions
+        if (cached.get('rows') == [int(r) for r in self.rows] and 
+            np.array_equal(cached.get('scaled'), scaled) and 
+            np.array_equal(cached.get('reference'), reference)):
+            return np.array(cached['values'], dtype = float)
+        values = hypervolume_contributions(scaled, reference)
+        self.contributions = {'rows':[int(r) for r in self.rows],
+                              'scaled':scaled.tolist(),
+                              'reference':reference.tolist(),
+                              'values':values.tolist()}
+        self.save()
+        return values
+
+    def save(self):
+        tmp = f'{self.path}.{os.getpid()}'
+        with open(tmp, 'w') as archive:
+            json.dump({'signature':self.signature,
+                       'processed':self.processed,
+                       'rows':[int(r) for r in self.rows],
+                       'points':self.points.tolist(),
+                       'contributions':self.contributions}, archive)
+        os.replace(tmp, self.path)
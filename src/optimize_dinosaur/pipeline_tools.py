@@ -6,6 +6,8 @@ Created on Thu Aug  1 15:45:57 2024
 @author: 4vt
 """
 from collections import defaultdict
+from contextlib import contextmanager
+import threading
 
 H = 1.007276
 
@@ -21,7 +23,128 @@ class keydefaultdict(defaultdict):
             ret = self[key] = self.default_factory(key)
             return ret
 
+def walltime_seconds(walltime):
+    '''
+    takes a slurm time limit such as '03:00:00', '1-12:00:00' or '90'
+    returns the number of seconds
+    '''
+    days, _, clock = walltime.rpartition('-')
+    parts = [int(p) for p in clock.split(':')]
+    if days:
+        #days-hours[:minutes[:seconds]]
+        parts += [0]*(3 - len(parts))
+    elif len(parts) < 3:
+        #minutes[:seconds]
+        parts = [0] + parts + [0]*(2 - len(parts))
+    hours, minutes, seconds = parts
+    return ((int(days or 0)*24 + hours)*60 + minutes)*60 + seconds
+
+def slurm_walltime(seconds):
+    '''
+    takes a number of seconds
+    returns a slurm time limit string, rounded up to whole minutes
+    '''
+    minutes = -(-int(seconds) // 60)
+    days, minutes = divmod(minutes, 24*60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{days}-{hours:02d}:{minutes:02d}:00' if days else f'{hours:02d}:{minutes:02d}:00'
+
+#the columns read from each tool's feature table
+#{tool column:(standard column, dtype, scale factor)}
+#retention times are scaled to minutes
+feature_table_columns = {'Dinosaur':{'rtStart':('rt_start', 'float32', 1),
+                                     'rtEnd':('rt_end', 'float32', 1),
+                                     'mass':('mz', 'float64', 1),
+                                     'charge':('charge', 'float32', 1),
+                                     'intensitySum':('intensity', 'float32', 1)},
+                         'Osfd':{'rt_start':('rt_start', 'float32', 1/60),
+                                 'rt_end':('rt_end', 'float32', 1/60),
+                                 'mz':('mz', 'float64', 1),
+                                 'intensity':('intensity', 'float32', 1)},
+                         'Xcms':{'rtmin':('rt_start', 'float32', 1/60),
+                                 'rtmax':('rt_end', 'float32', 1/60),
+                                 'mz':('mz', 'float64', 1),
+                                 'into':('intensity', 'float32', 1)},
+                         'Asari':{'rtim_left_base':('rt_start', 'float32', 1),
+                                  'rtime_right_base':('rt_end', 'float32', 1),
+                                  'mz':('mz', 'float64', 1)}}
+
+def read_feature_table(path, tool, extra_columns = None):
+    '''
+    arguments:
+        path: the tab separated feature table written by the tool
+        tool: a key of feature_table_columns
+        extra_columns: additional {tool column:(standard column, dtype, scale factor)}
+    returns:
+        a dataframe of only the specified columns with standard names and units
+    the pyarrow csv engine is used when it is installed
+    '''
+    import importlib.util
+    
+    import pandas as pd
+    
+    spec = dict(feature_table_columns[tool], **(extra_columns or {}))
+    engine = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+    features = pd.read_csv(path,
+                           sep = '\t',
+                           usecols = list(spec.keys()),
+                           dtype = {k:v[1] for k,v in spec.items()},
+                           engine = engine)
+    features = features[list(spec.keys())]
+    features.columns = [v[0] for v in spec.values()]
+    for column, _, scale in spec.values():
+        if scale != 1:
+            features[column] *= scale
+    return features
+
+def timing_summary(workspace):
+    '''
+    takes the optimization workspace directory
+    returns a dataframe with one row per stage of the trials in trial_timings.jsonl,
+    the total and mean seconds, the 95th percentile and the share of all trial time,
+    sorted from the largest share down
+    '''
+    import json
+    import os
+    
+    import pandas as pd
+    
+    with open(os.path.join(workspace, 'trial_timings.jsonl'), 'r') as timings:
+        spans = pd.DataFrame([json.loads(line)['spans'] for line in timings if line.strip()]).fillna(0)
+    summary = pd.DataFrame({'trials':(spans > 0).sum(),
+                            'total_s':spans.sum(),
+                            'mean_s':spans.mean(),
+                            'p95_s':spans.quantile(0.95)})
+    summary['share'] = summary['total_s']/summary['total_s'].sum()
+    return summary.sort_values('share', ascending = False)
+
 class Pipeline():
+    #the fraction of the input data that run_job() evaluates genomes on
+    fidelity = 1.0
+    #whether run_job() can run on RT cropped inputs from fidelity.prepare_inputs()
+    supports_fidelity = False
+    #whether the runtime of a trial is minimized alongside the metrics
+    runtime_objective = True
+    #trials that take longer than this many seconds at full fidelity are treated as failures, None for no cap
+    runtime_cap = None
+    #whether trials whose lease expired are released to be proposed again instead of recorded as failed
+    retry_expired = False
+    #tools are stopped once a trial runs this many times the median runtime of the Pareto front, None for no limit
+    budget_factor = 3
+    #the number of trials on the Pareto front needed before trials get a runtime budget
+    budget_min_front = 3
+    #whether cores, memory and timeout of submissions are sized from the recorded resource usage
+    adaptive_resources = True
+    #the number of input files whose tool runs at once in run_files(), None for up to one per core
+    concurrent_files = None
+    #the peak memory in GB of one tool run, run_files() runs no more at once than fit into memory, None for no limit
+    file_memory_gb = None
+    #whether trials run in node local scratch on copies of the inputs that are made once per node,
+    #the copies are removed when the last job holding them ends so this pays off for pilot jobs
+    node_staging = False
+    #whether the job is a pilot that holds its node for the walltime, set by run_pilot_job()
+    pilot = False
+    
     def __init__(self):
         self.name = NotImplemented
         self.cores = NotImplemented
@@ -49,6 +172,17 @@ class Pipeline():
         '''
         raise NotImplementedError()
     
+    def get_objectives(self):
+        '''
+        takes no arguments
+        returns a dictionary of {objective:1 if larger is good else -1}
+        these are the metrics plus runtime if self.runtime_objective is set
+        '''
+        objectives = dict(self.get_metrics())
+        if self.runtime_objective:
+            objectives['runtime'] = -1
+        return objectives
+    
     def setup_workspace(self):
         '''
         takes no arguments
@@ -60,66 +194,614 @@ class Pipeline():
     def run_job(self, job):
         '''
         the only argument is a dictionary of parameter choices
-        runs the pipeline and appends the outcome to outcomes.tsv
+        runs the pipeline and records the outcome in the trial store
         '''
-        with open('attempted_solutions.tsv', 'a') as tsv:
-            tsv.write('\t'.join(str(v) for v in job.values()) + '\n')
+        import os
+        from time import time
+        
+        from optimize_dinosaur.fidelity import prepare_inputs
+        
+        self.trial_start = time()
+        #the resources used by the tool subprocesses of this trial
+        self.usage = {'peak_rss_gb':0.0, 'cpu_seconds':0.0, 'tool_seconds':0.0}
+        #(start, end, peak_rss_gb) of every tool run, these may overlap under run_files()
+        self.tool_runs = []
+        self.tool_lock = threading.Lock()
+        self.censored = False
+        #the share of the trial resources of each tool run
+        self.file_cores = self.cores
+        self.file_memory = self.memory
+        #the seconds spent in each stage of this trial
+        self.spans = {}
+        self.workspace = os.getcwd()
+        #the directory holding the mzML and _PSMs.txt files at the current fidelity
+        self.inputs = self.workspace
+        if self.supports_fidelity and self.fidelity < 1:
+            with self.span('stage-inputs'):
+                self.inputs = prepare_inputs(self.workspace, self.fidelity)
+        #the inputs on shared storage, which the feature cache identifies input files by
+        self.source_inputs = self.inputs
+        if self.node_staging:
+            with self.span('stage-inputs'):
+                stage = self.node_stage()
+                self.inputs = stage.stage(self.inputs, self.staged_inputs(self.inputs))
+        self.record_attempt(job)
         self.set_params(job)
+        self.budget = self.trial_budget()
+    
+    def staged_inputs(self, directory):
+        '''
+        takes a directory of inputs
+        returns the names of the files and directories in it that trials read,
+        which are the mzML files, the _PSMs.txt files and their compiled stores
+        '''
+        import os
+        
+        return [f for f in os.listdir(directory) if f.endswith(('.mzML', '_PSMs.txt', '.store'))]
+    
+    def node_stage(self):
+        '''
+        returns the staging.NodeStage of the workspace on this node, it is acquired on first use
+        and released when the process exits, processes forked from the holder share its reference
+        '''
+        import atexit
+        import os
+        
+        from optimize_dinosaur.staging import NodeStage
+        
+        stage = getattr(self, 'stage', None)
+        if stage is None or stage.workspace != os.path.realpath(self.workspace):
+            self.release_stage()
+            self.stage = NodeStage(self.workspace).acquire()
+            atexit.register(self.stage.release)
+        return self.stage
+    
+    def release_stage(self):
+        '''
+        drops the reference of this process to its node stage
+        '''
+        if getattr(self, 'stage', None) is not None:
+            self.stage.release()
+            self.stage = None
+    
+    def trial_path(self, workspace = None):
+        '''
+        takes the workspace, self.workspace by default
+        returns the path that trial_dir() creates in this process, so that it can be recorded before the trial starts
+        '''
+        import os
+        
+        from optimize_dinosaur.staging import NodeStage
+        
+        workspace = workspace or self.workspace
+        if self.node_staging:
+            return os.path.join(NodeStage(workspace).trials, str(os.getpid()))
+        return os.path.join(workspace, str(os.getpid()))
+    
+    def trial_dir(self):
+        '''
+        creates and returns the temporary directory of the trial, named for the pid of the job,
+        in the node stage if self.node_staging is set and otherwise in the workspace
+        '''
+        import os
+        
+        if self.node_staging:
+            return self.node_stage().trial_dir()
+        path = self.trial_path()
+        os.mkdir(path)
+        return path
+    
+    @contextmanager
+    def span(self, stage):
+        '''
+        times the block as part of a stage of the trial, the stages are
+        stage-inputs, tool, parse-features, parse-psms, rollup, metrics and cleanup
+        a stage may be entered many times and its durations add up,
+        stages that overlap under run_files() add up to more than the trial took
+        '''
+        from time import time
+        
+        start = time()
+        try:
+            yield
+        finally:
+            spans = getattr(self, 'spans', None)
+            if spans is not None:
+                spans[stage] = spans.get(stage, 0) + time() - start
+    
+    def record_timings(self, job):
+        '''
+        takes the dictionary of parameter choices that was just run
+        appends the stage timings of the trial to trial_timings.jsonl in the workspace,
+        time outside of every stage is reported as other
+        '''
+        import json
+        import os
+        from time import time
+        
+        total = time() - self.trial_start
+        record = {'pipeline':self.name,
+                  'job':{k:str(v) for k,v in job.items()},
+                  'fidelity':self.fidelity,
+                  'started':self.trial_start,
+                  'total':total,
+                  'spans':dict(self.spans, other = max(total - sum(self.spans.values()), 0))}
+        with open(os.path.join(self.workspace, 'trial_timings.jsonl'), 'a') as timings:
+            timings.write(json.dumps(record) + '\n')
+    
+    def trial_budget(self):
+        '''
+        takes no arguments
+        returns the runtime budget in seconds of a trial at the current fidelity or None for no limit
+        this is self.budget_factor times the median runtime of the trials on the Pareto front of
+        get_metrics(), runtime itself is left out so that fast but poor settings do not set the pace,
+        and at most self.runtime_cap
+        '''
+        import numpy as np
+        
+        from optimize_dinosaur.pareto import objective_matrix, nondominated_sort
+        
+        budget = None
+        if self.budget_factor is not None:
+            outcomes = self.trial_store().outcomes()
+            points = objective_matrix(outcomes, self.get_metrics())
+            usable = np.all(np.isfinite(points), axis = 1)
+            if np.sum(usable) >= self.budget_min_front:
+                front = nondominated_sort(points[usable]) == 0
+                runtime = np.asarray(outcomes['runtime'], dtype = float)[usable][front]
+                if len(runtime) >= self.budget_min_front:
+                    budget = self.budget_factor*float(np.median(runtime))
+        if self.runtime_cap is not None:
+            budget = min(b for b in (budget, self.runtime_cap) if b is not None)
+        return None if budget is None else budget*self.fidelity
+    
+    def run_command(self, command):
+        '''
+        takes a shell command that runs the tool
+        runs it in its own process group under what is left of the trial budget,
+        if the budget runs out the tool is killed, a censored outcome with the elapsed
+        time as runtime and no metrics is recorded and watchdog.TrialTimeout is raised
+        this may be called from the threads of run_files(), tool runs that overlap count
+        once towards the tool time and with the sum of their peaks towards the memory
+        '''
+        from time import time
+        
+        from optimize_dinosaur.watchdog import supervised_run, TrialTimeout
+        
+        budget = getattr(self, 'budget', None)
+        timeout = None if budget is None else max(budget - (time() - self.trial_start), 1)
+        usage = {}
+        start = time()
+        try:
+            return supervised_run(command, timeout, usage = usage)
+        except TrialTimeout:
+            #the trial store belongs to the main thread, run_files() censors the trial from there
+            if threading.current_thread() is threading.main_thread():
+                self.censor_trial()
+            raise
+        finally:
+            self.record_tool_run(start, usage)
+    
+    def record_tool_run(self, start, usage):
+        '''
+        adds a tool run that started at start and ends now to the usage of the trial
+        arguments:
+            start: the time the run started
+            usage: the usage dictionary filled by watchdog.supervised_run(), empty if the
+                tool ran outside of this process
+        '''
+        from time import time
+        
+        with self.tool_lock:
+            self.tool_runs.append((start, time(), usage.get('peak_rss_gb', 0)))
+            runs = self.tool_runs
+            #the peak of every set of runs that were active at once is bounded by the sum of their peaks
+            concurrent = max(sum(p for s,e,p in runs if s <= start_i < e) for start_i,_,_ in runs)
+            self.usage['peak_rss_gb'] = max(self.usage['peak_rss_gb'], concurrent)
+            self.usage['cpu_seconds'] += usage.get('cpu_seconds', 0)
+            #the time during which any tool was running
+            busy = 0
+            end = 0
+            for s, e, _ in sorted(runs):
+                busy += max(e - max(s, end), 0)
+                end = max(end, e)
+            self.usage['tool_seconds'] = busy
+            if getattr(self, 'spans', None) is not None:
+                self.spans['tool'] = busy
+    
+    def censor_trial(self):
+        '''
+        records the running trial as a failure with the elapsed time as runtime and no metrics,
+        only the first call of a trial records anything
+        '''
+        from time import time
+        
+        if not self.censored:
+            self.censored = True
+            self.record_outcome(self.params, [float('nan')]*len(self.get_metrics()), time() - self.trial_start)
+    
+    def run_files(self, items, run, parse = None):
+        '''
+        runs the tool on several input files at once, as many as there are cores and as fit into
+        memory at self.file_memory_gb each, the cores and memory of the trial are split evenly
+        between the runs and are available as self.file_cores and self.file_memory
+        arguments:
+            items: a list of the input files or their base names
+            run: a function that takes an item and runs the tool on it with self.run_command()
+            parse: a function that takes an item whose tool run finished and returns its results,
+                it runs in this thread while the tools of the other items are still running
+        returns:
+            a list of the results of parse() in the order of items, None without parse
+        if a run fails the runs that have not started are cancelled, the ones that are running
+        are waited for so that they do not write into a removed directory, and the error is raised
+        '''
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        
+        from optimize_dinosaur.watchdog import TrialTimeout
+        
+        slots = min(len(items), self.concurrent_files or self.cores, self.cores)
+        if self.file_memory_gb is not None:
+            slots = min(slots, int(self.memory // self.file_memory_gb))
+        slots = max(1, slots)
+        self.file_cores = max(1, self.cores // slots)
+        self.file_memory = max(1, int(self.memory // slots))
+        results = [None]*len(items)
+        with ThreadPoolExecutor(slots) as pool:
+            pending = {pool.submit(run, item):i for i,item in enumerate(items)}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when = FIRST_COMPLETED)
+                    for future in done:
+                        i = pending.pop(future)
+                        future.result()
+                        if parse is not None:
+                            results[i] = parse(items[i])
+            except TrialTimeout:
+                self.censor_trial()
+                raise
+            finally:
+                for future in pending:
+                    future.cancel()
+        return results
+    
+    def record_usage(self, job):
+        '''
+        takes the dictionary of parameter choices that was just run
+        records the resources used by the trial in the trial store, wall_seconds covers the whole trial
+        the peak memory of the job process itself is added to that of the tools since both count
+        against the memory of the job, a censored trial is recorded at the walltime of the job
+        because how long it would have needed is not known
+        '''
+        from time import time
+        
+        from optimize_dinosaur.watchdog import job_peak_rss
+        
+        usage = dict(self.usage, wall_seconds = time() - self.trial_start)
+        usage['peak_rss_gb'] += job_peak_rss()
+        if self.censored:
+            usage['wall_seconds'] = max(usage['wall_seconds'], walltime_seconds(self.timeout)*self.fidelity)
+        self.trial_store().record_usage(job, usage, self.fidelity)
+    
+    def size_resources(self, quantile = 0.95, headroom = 1.25, min_trials = 10):
+        '''
+        sizes cores, memory and timeout for later submissions from the resources
+        used by full fidelity trials so far, nothing changes before min_trials were recorded
+        arguments:
+            quantile: the quantile of the observed usage that is provisioned for
+            headroom: the factor by which the provision exceeds the quantile
+            min_trials: the number of recorded trials needed
+        returns:
+            the number of trials the resources were sized from, 0 if they were left as they are
+        the usage is read from the trial store of self.workspace, the static settings of the
+        pipeline are upper bounds, trials that were censored or whose job was killed are recorded
+        at the limits they ran under so the estimates grow back after they were sized too small
+        '''
+        import numpy as np
+        
+        usage = self.trial_store().usage()
+        usage = usage[usage['fidelity'] == 1]
+        if len(usage) < min_trials:
+            return 0
+        memory = np.quantile(usage['peak_rss_gb'], quantile)*headroom
+        #tools that never ran a subprocess did their work in the python process itself
+        cores = np.quantile(usage['cpu_seconds']/np.maximum(usage['tool_seconds'], 1), quantile)*headroom
+        wall = np.quantile(usage['wall_seconds'], quantile)*headroom
+        self.memory = int(min(self.memory, max(1, np.ceil(memory))))
+        self.cores = int(min(self.cores, max(1, np.ceil(cores))))
+        self.timeout = slurm_walltime(min(walltime_seconds(self.timeout), max(600, wall)))
+        return len(usage)
+    
+    def trial_store(self):
+        '''
+        takes no arguments
+        returns the trial store of the current workspace, 
+        either the TSV files or trials.sqlite if the workspace was set up with it
+        '''
+        from optimize_dinosaur.trial_store import open_store
+        
+        if getattr(self, 'store', None) is None or self.store.workspace != self.workspace:
+            self.store = open_store(self.workspace, self)
+        return self.store
+    
+    def record_attempt(self, job):
+        '''
+        records a dictionary of parameter choices as attempted
+        '''
+        self.trial_store().claim(job)
+    
+    def record_outcome(self, job, metrics, runtime):
+        '''
+        arguments:
+            job: a dictionary of parameter choices
+            metrics: a sequence of values in the order of self.get_metrics()
+            runtime: the runtime in seconds
+        records the outcome in the trial store at the current fidelity
+        '''
+        self.trial_store().record_outcome(job, metrics, runtime, self.fidelity)
+    
+    def record_siblings(self, job, siblings, runtime):
+        '''
+        arguments:
+            job: the dictionary of parameter choices that was run
+            siblings: a list of (dictionary of parameter choices, metrics) for every setting
+                that was scored from the same tool run, job itself included
+            runtime: the runtime in seconds
+        at full fidelity every sibling that was not attempted before is claimed and recorded,
+        below it only job is recorded with the metrics of its best sibling so that a rung holds
+        one outcome per tool run and promotion judges the tool parameters, not the sweep width
+        '''
+        import pandas as pd
+        
+        from optimize_dinosaur.strategies import ranked_outcomes
+        
+        if self.fidelity < 1:
+            table = pd.DataFrame([list(m) for _, m in siblings], columns = list(self.get_metrics().keys()))
+            table['runtime'] = runtime
+            table['fidelity'] = self.fidelity
+            _, order = ranked_outcomes(table, self)
+            self.record_outcome(job, siblings[order[0]][1], runtime)
+            return
+        store = self.trial_store()
+        #siblings of a genome that was run before already have their outcomes,
+        #the TSV store claims anything so it is checked against the attempts first
+        attempts = store.attempts()
+        for child, metrics in siblings:
+            if child != job:
+                if store.codec.key(child) in attempts or not store.claim(child):
+                    continue
+            self.record_outcome(child, metrics, runtime)
 
 class PepQuantPipeline(Pipeline):
+    #how disagreement between replicates is scored, either 'pairwise' or 'cv'
+    replicate_error = 'pairwise'
+    
     def get_metrics(self):
         return {'quant_depth':1,
                 'mean_relative_error':-1}
+    
+    def setup_workspace(self):
+        '''
+        compiles every _PSMs.txt file in the workspace into a binary store
+        '''
+        import os
+        
+        from optimize_dinosaur.psm_store import compile_psms, store_path
+        
+        for psm_file in [f for f in os.listdir() if f.endswith('_PSMs.txt')]:
+            if not os.path.exists(store_path(psm_file)):
+                compile_psms(psm_file)
+    
+    def psm_store(self, base_name):
+        '''
+        takes the base name of an mzML file
+        returns the absolute path of the compiled store of its PSMs, building it if missing
+        '''
+        import os
+        
+        from optimize_dinosaur.psm_store import compile_psms, store_path
+        
+        psm_file = os.path.join(self.inputs, f'{base_name}_PSMs.txt')
+        store = store_path(psm_file)
+        if not os.path.exists(store):
+            compile_psms(psm_file)
+        return store
+    
+    def load_psms(self, base_name):
+        '''
+        takes the base name of an mzML file
+        returns a dataframe of its PSMs with columns: mass, rt, mz, sequence
+        '''
+        from optimize_dinosaur.psm_store import load_psms
+        
+        with self.span('parse-psms'):
+            return load_psms(self.psm_store(base_name))
 
-    def calc_metrics(self, quant1, quant2):
+    def calc_metrics(self, *quants):
         '''
         arguments:
-            takes two dataframes that are the output of self.peptide_rollup(),
-            meaning they have the columns sequence, intensity
+            takes two or more dataframes that are the output of self.peptide_rollup(),
+            meaning they have the columns sequence, intensity, one per replicate run
         returns:
             (quant_depth, mean_relative_error)
+        the error is the mean over all replicate pairs of |a - b|/mean(a, b) for
+        peptides quantified in both runs of a pair, if self.replicate_error is 'cv'
+        it is the mean coefficient of variation of peptides quantified in at least two runs
         '''
-        from collections import defaultdict
         import numpy as np
+        import pandas as pd
         
-        #build array of intensity values
-        quants = defaultdict(lambda:[np.nan]*2)
-        for i,table in enumerate((quant1, quant2)):
-            for sequence, intensity in zip(table['sequence'], table['intensity']):
-                quants[sequence][i] = intensity
-        quants = np.array(list(quants.values()))
+        #build a peptide x replicate array of intensity values
+        codes, sequences = pd.factorize(pd.concat([q['sequence'] for q in quants], ignore_index = True))
+        replicate = np.repeat(np.arange(len(quants)), [q.shape[0] for q in quants])
+        quants_array = np.full((len(sequences), len(quants)), np.nan)
+        quants_array[codes, replicate] = np.concatenate([q['intensity'].to_numpy(dtype = float) for q in quants])
+        finite = np.isfinite(quants_array)
         
         #calculate the number of quantified peptides
-        quant_depth = np.sum(np.isfinite(quants))
+        quant_depth = np.sum(finite)
         
-        #calculate mean relative error
-        quants = quants[np.all(np.isfinite(quants), axis = 1)]
-        means = np.mean(quants, axis = 1)
-        diffs = np.abs(quants[:,0] - quants[:,1])
-        mre = np.nanmean(diffs/means)
+        #calculate replicate error
+        if self.replicate_error == 'cv':
+            quants_array = quants_array[np.sum(finite, axis = 1) > 1]
+            cv = np.nanstd(quants_array, axis = 1, ddof = 1)/np.nanmean(quants_array, axis = 1)
+            error = np.nanmean(cv)
+        else:
+            first, second = np.triu_indices(len(quants), k = 1)
+            a = quants_array[:,first]
+            b = quants_array[:,second]
+            both = np.logical_and(finite[:,first], finite[:,second])
+            error = np.nanmean(np.abs(a[both] - b[both])/((a[both] + b[both])/2))
 
-        return (quant_depth, mre)
+        return (quant_depth, error)
 
 
 class FeatureFinderPipeline(PepQuantPipeline):    
+    #score every ppm and rt_wiggle choice from each feature finder run
+    sweep_rollup = True
+    #size bound of the raw feature output cache in the workspace, which outlives every node stage
+    feature_cache_gb = 50
+    supports_fidelity = True
+    
+    def setup_workspace(self):
+        '''
+        compiles the PSM stores and hashes every mzML file for the feature cache
+        '''
+        import os
+        
+        from optimize_dinosaur.feature_cache import FeatureCache
+        
+        super().setup_workspace()
+        cache = FeatureCache(os.path.join(os.getcwd(), 'feature_cache'), self.feature_cache_gb)
+        for mzml in [f for f in os.listdir() if f.endswith('.mzML')]:
+            cache.file_digest(mzml)
+    
     def get_params(self):
         self.param_choices = {'ppm':[5, 2, 8, 10, 15, 20],
                               'rt_wiggle':[0, 0.01, 0.05, 0.1]}
         self.pep_rollup_param_set = set(self.param_choices.keys())
         return self.param_choices
         
-    def map_feature(self, psm_idx):
-        feature_set = set([])
-        for charge in range(1,6):
-            rt = psm_rt[psm_idx]
-            mz = psm_mass[psm_idx]/charge + H
-            ppm = (mz/1e6)*float(self.params['ppm'])
-            rtstart_set = set((i[1] for i in rtstart_idx.irange((rt-max_rt_width,), (rt,))))
-            rtend_set = set((i[1] for i in rtend_idx.irange((rt,), (rt+max_rt_width,))))
-            rt_set = rtstart_set.intersection(rtend_set)
-            mz_set = set((i[1] for i in mz_idx.irange((mz-ppm,),(mz+ppm,))))
-            feature_set.update(rt_set.intersection(mz_set))
-        return feature_set
+    def tool_params(self, job):
+        '''
+        takes a dictionary of parameter choices
+        returns the subset of them that is passed to the feature finding tool
+        '''
+        return {k:v for k,v in job.items() if k not in self.pep_rollup_param_set}
+    
+    def cached_tool_run(self, job, inputs, run_tool):
+        '''
+        runs the feature finding tool unless its output for these parameters is cached
+        arguments:
+            job: a dictionary of parameter choices
+            inputs: a list of the names of the input files read by the tool, they are identified
+                by their source in the workspace so that every trial shares their digests
+            run_tool: a function that takes no arguments, runs the tool in the 
+                current directory and returns a list of the output files it wrote
+        returns:
+            the tool runtime in seconds, on a cache hit this is the runtime of the original run
+        '''
+        import os
+        from time import time
+        
+        from optimize_dinosaur.feature_cache import FeatureCache
+        
+        cache = FeatureCache(os.path.join(self.workspace, 'feature_cache'), self.feature_cache_gb)
+        key = cache.key(self.name, self.tool_params(job), [os.path.join(self.source_inputs, os.path.basename(f)) for f in inputs])
+        runtime = cache.fetch(key)
+        if runtime is None:
+            start = time()
+            outputs = run_tool()
+            runtime = time() - start
+            cache.store(key, outputs, runtime)
+        return runtime
+    
+    def get_rollup_pool(self):
+        '''
+        returns the RollupPool of this process, it is started on first use
+        and reused by every rollup for the rest of the job
+        '''
+        from optimize_dinosaur.rollup_pool import RollupPool
+        
+        if getattr(self, 'rollup_pool', None) is None:
+            self.rollup_pool = RollupPool(self.cores)
+        return self.rollup_pool
+    
+    def map_features(self, features, psms, ppm = None, rt_wiggle = None):
+        '''
+        arguments:
+            features (a dataframe) must have columns: rt_start, rt_end, mz
+            psms (a dataframe) must have columns: mass, rt
+            ppm, rt_wiggle: match tolerances, these default to the current parameters
+        returns:
+            (psm_index, feature_index, ppm_error, rt_error) arrays with one entry per
+            unique match over charges 1 through 5, the indices are positional and the
+            errors are the smallest ppm and rt_wiggle under which the pair still matches
+        '''
+        import numpy as np
+        
+        from optimize_dinosaur.feature_matching import unique_pairs
+        
+        ppm = float(self.params['ppm'] if ppm is None else ppm)
+        rt_wiggle = float(self.params['rt_wiggle'] if rt_wiggle is None else rt_wiggle)
+        
+        charges = np.arange(1, 6)
+        query_mz = (psms['mass'].to_numpy()[:,np.newaxis]/charges + H).ravel()
+        query_rt = np.repeat(psms['rt'].to_numpy(), len(charges))
+        tolerance = (query_mz/1e6)*ppm
+        
+        feature_mz = features['mz'].to_numpy()
+        rt_start = features['rt_start'].to_numpy()
+        rt_end = features['rt_end'].to_numpy()
+        pool = self.get_rollup_pool()
+        query_idx, feature_idx = pool.match_intervals(query_mz - tolerance,
+                                                      query_mz + tolerance,
+                                                      query_rt,
+                                                      feature_mz,
+                                                      feature_mz,
+                                                      rt_start - rt_wiggle,
+                                                      rt_end + rt_wiggle)
+        
+        mz = query_mz[query_idx]
+        rt = query_rt[query_idx]
+        ppm_error = (np.abs(feature_mz[feature_idx] - mz)/mz)*1e6
+        rt_error = np.maximum(np.maximum(rt_start[feature_idx] - rt, rt - rt_end[feature_idx]), 0)
+        
+        #keep the charge state with the smallest m/z error for each pair
+        order = np.argsort(ppm_error, kind = 'stable')
+        psm_idx, feature_idx, first = unique_pairs(query_idx[order] // len(charges),
+                                                   feature_idx[order],
+                                                   return_index = True)
+        return psm_idx, feature_idx, ppm_error[order][first], rt_error[order][first]
+    
+    def aggregate_peptides(self, seq_codes, psm_idx, feature_idx, intensity):
+        '''
+        arguments:
+            seq_codes: an array of factorized sequence codes, one per PSM
+            psm_idx, feature_idx: positional index pairs from map_features()
+            intensity: an array of feature intensities
+        returns:
+            (seq_idx, peptide_intensity) arrays for every peptide with a nondegenerate feature
+        '''
+        import numpy as np
+        
+        from optimize_dinosaur.feature_matching import unique_pairs
+        
+        #sparse peptide x feature incidence matrix stored as coordinate arrays
+        seq_idx, feature_idx = unique_pairs(seq_codes[psm_idx], feature_idx)
+        
+        #remove degenerate features, i.e. columns with more than one peptide
+        peptides_per_feature = np.bincount(feature_idx, minlength = len(intensity))
+        unique_feature = peptides_per_feature[feature_idx] == 1
+        seq_idx = seq_idx[unique_feature]
+        feature_idx = feature_idx[unique_feature]
+        
+        #calculate intensity as row sums over the remaining features
+        n_sequences = int(np.max(seq_codes)) + 1 if len(seq_codes) else 0
+        peptide_intensity = np.bincount(seq_idx, 
+                                        weights = intensity[feature_idx],
+                                        minlength = n_sequences)
+        quantified = np.flatnonzero(np.bincount(seq_idx, minlength = n_sequences))
+        return quantified, peptide_intensity[quantified]
     
     def peptide_rollup(self, features, psms):
         '''
@@ -130,75 +812,118 @@ class FeatureFinderPipeline(PepQuantPipeline):
             a dataframe with columns: sequence, intensity
         note that retention time should be in minutes
         '''
-        from multiprocessing import Pool
-
-        from sortedcontainers import SortedList
+        import pandas as pd
+        
+        psm_idx, feature_idx, _, _ = self.map_features(features, psms)
+        seq_codes, sequences = pd.factorize(psms['sequence'])
+        seq_idx, intensity = self.aggregate_peptides(seq_codes, 
+                                                     psm_idx, 
+                                                     feature_idx, 
+                                                     features['intensity'].to_numpy())
+        peptide_data = pd.DataFrame({'sequence':sequences[seq_idx],
+                                     'intensity':intensity})
+        return peptide_data
+    
+    def rollup_settings(self):
+        '''
+        returns a list of the (ppm, rt_wiggle) settings that one feature finder run is scored on
+        this is every combination of choices if self.sweep_rollup is set
+        '''
+        if self.sweep_rollup:
+            return [(p, w) for p in self.param_choices['ppm'] for w in self.param_choices['rt_wiggle']]
+        return [(self.params['ppm'], self.params['rt_wiggle'])]
+    
+    def rollup_sweep(self, features, psms, settings):
+        '''
+        evaluates several rollup settings with a single match at the widest tolerances
+        arguments:
+            features, psms: dataframes as for peptide_rollup()
+            settings: a list of (ppm, rt_wiggle) tuples
+        returns:
+            a list of peptide_rollup() style dataframes in the order of settings
+        '''
         import numpy as np
         import pandas as pd
         
-        #set up indexes as globals to use in parallelized map_feature() calls
-        global psm_rt
-        psm_rt = {i:rt for i,rt in zip(psms.index, psms['rt'])}
-        global psm_mass
-        psm_mass = {i:mass for i,mass in zip(psms.index, psms['mass'])}
-        global rtstart_idx
-        rtstart_idx = SortedList(zip(features['rt_start'] - float(self.params['rt_wiggle']), features.index))
-        global rtend_idx
-        rtend_idx = SortedList(zip(features['rt_end'] + float(self.params['rt_wiggle']), features.index))
-        global max_rt_width
-        max_rt_width = max(features['rt_end'] - features['rt_start'])
-        global mz_idx
-        mz_idx = SortedList(zip(features['mz'], features.index))
-        intensity_map = {idx:intensity for idx, intensity in zip(features.index, features['intensity'])}
-        
-        #connect features to PSMs
-        with Pool(self.cores) as p:
-            feature_map = p.map(self.map_feature, psms.index)
-        
-        class peptide():
-            def __init__(self, seq):
-                self.seq = seq
-                self.psm_indices = []
-                self.features = set([])
-            
-            def add_psm(self, psm_index, features):
-                self.psm_indices.append(psm_index)
-                self.features.update(features)
-            
-            def remove_bad_features(self, bad_features):
-                self.features = [f for f in self.features if f not in bad_features]
-                
-            def calculate_intensity(self, intensity_map):
-                self.intensity = np.sum([intensity_map[f] for f in self.features])
-            
-            def report(self):
-                return (self.seq, 
-                        self.intensity)
-        
-        #initialize peptide objects
-        peptides = keydefaultdict(peptide)
-        for seq, psm, feature_set in zip(psms['sequence'], psms.index, feature_map):
-            if feature_set:
-                peptides[seq].add_psm(psm, feature_set)
-
-        #remove degenerate features
-        feature_peptides = defaultdict(lambda:[])
-        for peptide in peptides.values():
-            for feature in peptide.features:
-                feature_peptides[feature].append(peptide.seq)
-        bad_features = set(f for f,p in feature_peptides.items() if len(p) > 1)
-
-        for peptide in peptides.values():
-            peptide.remove_bad_features(bad_features)
-        peptide_list = [pep for pep in peptides.values() if pep.features]
-
-        #calculate intensity
-        for peptide in peptide_list:
-            peptide.calculate_intensity(intensity_map)
+        settings = [(float(p), float(w)) for p, w in settings]
+        psm_idx, feature_idx, ppm_error, rt_error = self.map_features(features, 
+                                                                      psms, 
+                                                                      max(p for p,w in settings), 
+                                                                      max(w for p,w in settings))
+        seq_codes, sequences = pd.factorize(psms['sequence'])
+        intensity = features['intensity'].to_numpy()
         
-        #make results dataframe
-        peptide_data = pd.DataFrame([p.report() for p in peptide_list],
-                                    columns = ('sequence', 'intensity'))
-        return peptide_data
-
-
+        peptide_tables = []
+        for ppm, rt_wiggle in settings:
+            match = np.logical_and(ppm_error <= ppm, rt_error <= rt_wiggle)
+            seq_idx, pep_intensity = self.aggregate_peptides(seq_codes, 
+                                                             psm_idx[match], 
+                                                             feature_idx[match], 
+                                                             intensity)
+            peptide_tables.append(pd.DataFrame({'sequence':sequences[seq_idx],
+                                                'intensity':pep_intensity}))
+        return peptide_tables
+    
+    def sweep_metrics(self, feature_tables, psm_tables, settings = None):
+        '''
+        arguments:
+            feature_tables: a list of feature dataframes, one per replicate file
+            psm_tables: a list of psm dataframes in the same order
+            settings: a list of (ppm, rt_wiggle) tuples, defaults to self.rollup_settings()
+        returns:
+            a dataframe with columns ppm, rt_wiggle and one column per metric
+            with one row of calc_metrics() results per setting
+        '''
+        per_file = [self.rollup_file(f, p, settings) for f, p in zip(feature_tables, psm_tables)]
+        return self.sweep_grid(per_file, settings)
+    
+    def rollup_file(self, features, psms, settings = None):
+        '''
+        the rollup of one replicate file, so that it can run while the tool works on the others
+        arguments:
+            features, psms: dataframes as for peptide_rollup()
+            settings: a list of (ppm, rt_wiggle) tuples, defaults to self.rollup_settings()
+        returns:
+            the output of rollup_sweep()
+        '''
+        if settings is None:
+            settings = self.rollup_settings()
+        with self.span('rollup'):
+            return self.rollup_sweep(features, psms, settings)
+    
+    def sweep_grid(self, per_file, settings = None):
+        '''
+        arguments:
+            per_file: a list of rollup_file() outputs, one per replicate file
+            settings: the settings they were rolled up with, defaults to self.rollup_settings()
+        returns:
+            the sweep_metrics() dataframe
+        '''
+        import pandas as pd
+        
+        if settings is None:
+            settings = self.rollup_settings()
+        with self.span('metrics'):
+            rows = [list(setting) + list(self.calc_metrics(*tables)) 
+                    for setting, tables in zip(settings, zip(*per_file))]
+        return pd.DataFrame(rows, columns = ['ppm', 'rt_wiggle'] + list(self.get_metrics().keys()))
+    
+    def record_sweep(self, job, grid, runtime):
+        '''
+        arguments:
+            job: the dictionary of parameter choices that was run
+            grid: the output of sweep_metrics()
+            runtime: the runtime in seconds
+        records the row of every rollup setting as a sibling of job with record_siblings()
+        '''
+        metrics = list(self.get_metrics().keys())
+        siblings = []
+        for ppm, rt_wiggle, values in zip(grid['ppm'], grid['rt_wiggle'], grid[metrics].itertuples(index = False)):
+            if float(job['ppm']) == ppm and float(job['rt_wiggle']) == rt_wiggle:
+                siblings.append((job, values))
+            else:
+                child = dict(job)
+                child.update({'ppm':next(p for p in self.param_choices['ppm'] if float(p) == ppm),
+                              'rt_wiggle':next(w for w in self.param_choices['rt_wiggle'] if float(w) == rt_wiggle)})
+                siblings.append((child, values))
+        self.record_siblings(job, siblings, runtime)
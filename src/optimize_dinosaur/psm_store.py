@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:21:09 2026
+
+@author: 4vt
+
+loading a compiled store only needs numpy and pandas so that this module
+can be copied next to the tool scripts and imported from their conda environments
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+def store_path(psm_file):
+    '''
+    takes the path to a Proteome Discoverer _PSMs.txt file
+    returns the path of its compiled store
+    '''
+    return psm_file[:-4] + '.store' if psm_file.endswith('.txt') else psm_file + '.store'
+
+def compile_psms(psm_file):
+    '''
+    parses a Proteome Discoverer _PSMs.txt file once and writes a columnar store
+    of float64 mass, rt and m/z arrays, int32 sequence codes and the sequence table
+    takes the path to the _PSMs.txt file
+    returns the path of the store
+    '''
+    from optimize_dinosaur.pipeline_tools import H
+    
+    psms = pd.read_csv(psm_file,
+                       sep = '\t',
+                       usecols = ['Theo. MH+ [Da]', 'RT [min]', 'm/z [Da]', 'Annotated Sequence'],
+                       dtype = {'Annotated Sequence':str})
+    codes, sequences = pd.factorize(psms['Annotated Sequence'])
+
+    target = store_path(psm_file)
+    staging = f'{target}.{os.getpid()}'
+    os.mkdir(staging)
+    np.save(os.path.join(staging, 'mass.npy'), psms['Theo. MH+ [Da]'].to_numpy(dtype = np.float64) - H)
+    np.save(os.path.join(staging, 'rt.npy'), psms['RT [min]'].to_numpy(dtype = np.float64))
+    np.save(os.path.join(staging, 'mz.npy'), psms['m/z [Da]'].to_numpy(dtype = np.float64))
+    np.save(os.path.join(staging, 'sequence_codes.npy'), codes.astype(np.int32))
+    with open(os.path.join(staging, 'sequences.txt'), 'w') as table:
+        table.write('\n'.join(sequences) + '\n')
+    try:
+        os.rename(staging, target)
+    except OSError:
+        #another job compiled this file first
+        for file in os.listdir(staging):
+            os.remove(os.path.join(staging, file))
+        os.rmdir(staging)
+    return target
+
+def load_psms(store):
+    '''
+    takes the path of a compiled store
+    returns a dataframe with columns mass, rt, mz and a categorical sequence column
+    the numeric columns are read through memory maps
+    '''
+    columns = {c:np.load(os.path.join(store, f'{c}.npy'), mmap_mode = 'r') for c in ('mass', 'rt', 'mz')}
+    codes = np.load(os.path.join(store, 'sequence_codes.npy'), mmap_mode = 'r')
+    with open(os.path.join(store, 'sequences.txt'), 'r') as table:
+        sequences = table.read().split('\n')[:-1]
+    columns['sequence'] = pd.Categorical.from_codes(codes, categories = sequences)
+    return pd.DataFrame(columns)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:02:47 2026
+
+@author: 4vt
+"""
+
+import atexit
+from multiprocessing import Pool, resource_tracker, shared_memory
+
+import numpy as np
+
+from optimize_dinosaur.feature_matching import match_intervals
+
+#the shared memory segment currently attached by a worker process
+_attached = {}
+
+def _attach(name):
+    if name not in _attached:
+        for shm in _attached.values():
+            shm.close()
+        _attached.clear()
+        _attached[name] = shared_memory.SharedMemory(name = name)
+    return _attached[name]
+
+def _match_chunk(task):
+    '''
+    worker side of RollupPool.match_intervals()
+    takes a tuple of (segment name, number of features, number of queries, start, end)
+    returns a packed (2, n) int64 array of (query index, sorted feature index) pairs
+    '''
+    name, n_features, n_queries, start, end = task
+    buffer = _attach(name).buf
+    features = np.ndarray((4, n_features), dtype = np.float64, buffer = buffer)
+    queries = np.ndarray((3, n_queries), dtype = np.float64, buffer = buffer, offset = features.nbytes)
+    query_idx, feature_idx = match_intervals(queries[0, start:end],
+                                             queries[1, start:end],
+                                             queries[2, start:end],
+                                             *features)
+    return np.stack((query_idx + start, feature_idx))
+
+class RollupPool():
+    '''
+    a pool of worker processes that lives as long as the job that started it
+    each call publishes the feature and query arrays once through shared memory,
+    the workers read zero-copy views of them and return packed index arrays
+    '''
+    def __init__(self, cores, min_chunk = 20000):
+        self.cores = cores
+        self.min_chunk = min_chunk
+        #workers must inherit the resource tracker, otherwise each one starts
+        #its own and tries to clean up segments that the parent already unlinked
+        resource_tracker.ensure_running()
+        self.pool = Pool(cores) if cores > 1 else None
+        atexit.register(self.close)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def match_intervals(self, query_low, query_high, query_rt,
+                        feature_low, feature_high, rt_start, rt_end):
+        '''
+        a parallel version of feature_matching.match_intervals()
+        takes and returns the same values
+        '''
+        n_queries = len(query_low)
+        n_features = len(feature_low)
+        if self.pool is None or n_queries <= self.min_chunk or not n_features:
+            return match_intervals(query_low, query_high, query_rt,
+                                   feature_low, feature_high, rt_start, rt_end)
+
+        #presorting by the lower m/z bound makes the sort in each worker trivial
+        order = np.argsort(feature_low, kind = 'stable')
+        features = np.stack([np.asarray(a, dtype = np.float64)[order]
+                             for a in (feature_low, feature_high, rt_start, rt_end)])
+        queries = np.stack([np.asarray(a, dtype = np.float64)
+                            for a in (query_low, query_high, query_rt)])
+
+        shm = shared_memory.SharedMemory(create = True, size = features.nbytes + queries.nbytes)
+        try:
+            shared = np.ndarray(features.shape, dtype = np.float64, buffer = shm.buf)
+            shared[:] = features
+            shared = np.ndarray(queries.shape, dtype = np.float64, buffer = shm.buf, offset = features.nbytes)
+            shared[:] = queries
+            del shared
+
+            chunk = max(self.min_chunk, -(-n_queries // (4*self.cores)))
+            tasks = [(shm.name, n_features, n_queries, start, min(start + chunk, n_queries))
+                     for start in range(0, n_queries, chunk)]
+            pairs = np.concatenate(self.pool.map(_match_chunk, tasks), axis = 1)
+        finally:
+            shm.close()
+            shm.unlink()
+        return pairs[0], order[pairs[1]].astype(np.int64)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 19:42:18 2026
+
+@author: 4vt
+"""
+
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import os
+import shutil
+import signal
+import subprocess
+
+def scratch_root():
+    '''
+    returns the node local scratch directory, $TMPDIR or the system temporary directory
+    '''
+    import tempfile
+
+    return os.path.join(os.environ.get('TMPDIR') or tempfile.gettempdir(), 'optimize_dinosaur')
+
+def pid_alive(pid):
+    '''
+    returns whether a process with this pid is running on this node
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        #it exists but belongs to someone else
+        return True
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as stat:
+            #a zombie has exited but was not yet waited for by its parent
+            return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return True
+
+class NodeStage():
+    '''
+    node local copies of the inputs of a campaign, shared by every job of the campaign on the node
+    each input directory is copied once under a lock, every job that uses the stage holds a
+    reference in holders/ and the last job to release it removes the stage, the references
+    of jobs that were killed are ignored
+    trials run in trials/<pid> of the stage so that tool outputs never reach shared storage,
+    only the outcome records are written to the workspace
+    long running tool servers are started once per stage in services/<name> and stopped with it
+    '''
+    def __init__(self, workspace, root = None):
+        '''
+        arguments:
+            workspace: the optimization workspace directory
+            root: the node local directory to stage into, scratch_root() by default
+        '''
+        root = root or scratch_root()
+        self.workspace = os.path.realpath(workspace)
+        digest = hashlib.blake2b(self.workspace.encode(), digest_size = 6).hexdigest()
+        name = f'{os.path.basename(self.workspace)}_{digest}'
+        self.directory = os.path.join(root, name)
+        #the lock is outside of the stage so that it outlives its removal
+        self.lock_path = os.path.join(root, f'{name}.lock')
+        self.holders = os.path.join(self.directory, 'holders')
+        self.trials = os.path.join(self.directory, 'trials')
+        self.pid = os.getpid()
+        self.held = False
+
+    @contextmanager
+    def lock(self):
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok = True)
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def live_holders(self):
+        '''
+        returns the pids of the jobs that hold the stage and are still running
+        the caller must hold the lock
+        '''
+        if not os.path.exists(self.holders):
+            return set()
+        return set(int(p) for p in os.listdir(self.holders) if p.isdigit() and pid_alive(int(p)))
+
+    def clean(self):
+        '''
+        removes the references and trial directories of jobs that are no longer running
+        the caller must hold the lock
+        '''
+        for directory in (self.holders, self.trials):
+            if not os.path.exists(directory):
+                continue
+            for entry in os.listdir(directory):
+                if entry.isdigit() and not pid_alive(int(entry)):
+                    path = os.path.join(directory, entry)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors = True)
+                    else:
+                        os.remove(path)
+
+    def acquire(self):
+        '''
+        adds a reference for this job, returns self
+        '''
+        with self.lock():
+            os.makedirs(self.holders, exist_ok = True)
+            os.makedirs(self.trials, exist_ok = True)
+            self.clean()
+            open(os.path.join(self.holders, str(self.pid)), 'w').close()
+        self.held = True
+        return self
+
+    def release(self):
+        '''
+        drops the reference of this job and removes the stage if no running job holds it
+        '''
+        if not self.held or os.getpid() != self.pid:
+            return
+        self.held = False
+        with self.lock():
+            try:
+                os.remove(os.path.join(self.holders, str(self.pid)))
+            except FileNotFoundError:
+                pass
+            self.clean()
+            if not self.live_holders():
+                self.stop_services()
+                shutil.rmtree(self.directory, ignore_errors = True)
+
+    def stage(self, source, files):
+        '''
+        arguments:
+            source: a directory of inputs, the workspace or a fidelity directory in it
+            files: the names of the files and directories in source that trials read
+        returns:
+            the node local copy of source, which is made by the first job that asks for it
+        files that are missing from an existing copy are added to it,
+        so a copy is only shared by pipelines that agree on their inputs
+        '''
+        name = 'inputs' if os.path.realpath(source) == self.workspace else os.path.basename(source)
+        target = os.path.join(self.directory, name)
+        if all(os.path.exists(os.path.join(target, f)) for f in files):
+            return target
+        with self.lock():
+            os.makedirs(target, exist_ok = True)
+            for file in files:
+                destination = os.path.join(target, file)
+                if os.path.exists(destination):
+                    continue
+                #copies land under a temporary name so that a killed job never leaves a partial input
+                staging = f'{destination}.{os.getpid()}'
+                if os.path.isdir(os.path.join(source, file)):
+                    shutil.copytree(os.path.join(source, file), staging)
+                else:
+                    shutil.copy2(os.path.join(source, file), staging)
+                os.rename(staging, destination)
+        return target
+
+    def service_pid(self, name):
+        '''
+        returns the pid of a running service or None
+        '''
+        try:
+            with open(os.path.join(self.directory, 'services', name, 'pid'), 'r') as pid_file:
+                pid = int(pid_file.read())
+        except (OSError, ValueError):
+            return None
+        return pid if pid_alive(pid) else None
+
+    def service(self, name, command):
+        '''
+        starts a long running process for every job of the campaign on the node unless it is running
+        arguments:
+            name: the name of the service
+            command: the shell command that runs it
+        returns:
+            the directory of the service, which holds the directory named requests that it
+            reads request files from, its pid file and its log
+        '''
+        directory = os.path.join(self.directory, 'services', name)
+        with self.lock():
+            if self.service_pid(name) is None:
+                os.makedirs(directory, exist_ok = True)
+                os.makedirs(os.path.join(directory, 'requests'), exist_ok = True)
+                with open(os.path.join(directory, 'log'), 'a') as log:
+                    #its own session so that stopping it also stops everything it started
+                    process = subprocess.Popen(command, shell = True, start_new_session = True,
+                                               stdout = log, stderr = log)
+                with open(os.path.join(directory, 'pid'), 'w') as pid_file:
+                    pid_file.write(str(process.pid))
+        return directory
+
+    def stop_services(self):
+        '''
+        stops every running service, the caller must hold the lock
+        '''
+        services = os.path.join(self.directory, 'services')
+        if not os.path.exists(services):
+            return
+        for name in os.listdir(services):
+            pid = self.service_pid(name)
+            if pid is not None:
+                try:
+                    os.killpg(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def trial_dir(self):
+        '''
+        creates and returns the directory of the running trial, named for the pid of the job
+        '''
+        path = os.path.join(self.trials, str(os.getpid()))
+        os.mkdir(path)
+        return path
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:41:05 2026
+
+@author: 4vt
+"""
+
+import numpy as np
+
+def ranked_outcomes(outcomes, pipeline):
+    '''
+    returns (objective matrix, order of the rows from best to worst by front rank and crowding)
+    '''
+    from optimize_dinosaur.pareto import pipeline_objectives, nondominated_sort, crowding_distance
+
+    points = pipeline_objectives(outcomes, pipeline)
+    ranks = nondominated_sort(points)
+    crowding = crowding_distance(points, ranks)
+    return points, np.lexsort((-crowding, ranks))
+
+class Strategy():
+    '''
+    a search strategy proposes the next genome to run from the outcomes so far
+    subclasses implement candidates() and inherit the uniqueness check
+    '''
+    def candidates(self, outcomes, attempts, pipeline, rng):
+        '''
+        arguments:
+            outcomes: the dataframe of outcomes read from the trial store
+            attempts: a set of the genome keys of every attempted genome
+            pipeline: the pipeline being optimized
+            rng: a numpy random generator
+        returns:
+            a list of dictionaries of parameter choices, most promising first
+        '''
+        raise NotImplementedError()
+
+    def propose(self, outcomes, attempts, pipeline, store, rng):
+        '''
+        returns the first candidate that has not been attempted and could be claimed in the store,
+        if every candidate is taken the genetic strategy makes a unique child
+        '''
+        from optimize_dinosaur.optimizer_job import make_child
+
+        for job in self.candidates(outcomes, attempts, pipeline, rng):
+            if store.codec.key(job) in attempts:
+                continue
+            if store.atomic_claims and not store.claim(job):
+                continue
+            return job
+        return make_child(outcomes, attempts, pipeline, store, rng)
+
+class Genetic(Strategy):
+    '''
+    uniform crossover of two parents from the Pareto front plus mutation until unique,
+    parents are drawn in proportion to their hypervolume contribution
+    '''
+    def candidates(self, outcomes, attempts, pipeline, rng):
+        return []
+
+class Tpe(Strategy):
+    '''
+    a tree-structured Parzen estimator for categorical parameters
+    the outcomes are split into the best gamma fraction by front rank and crowding and the rest,
+    each parameter gets a smoothed categorical density for both groups and candidates
+    drawn from the good density are ranked by the ratio of good to bad density
+    '''
+    def __init__(self, gamma = 0.25, n_candidates = 256, prior_weight = 1.0):
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.prior_weight = prior_weight
+
+    def densities(self, codes, codec):
+        '''
+        returns a list of smoothed probability vectors, one per parameter
+        '''
+        densities = []
+        for i, size in enumerate(codec.sizes):
+            counts = np.bincount(codes[:,i][codes[:,i] >= 0], minlength = size).astype(float)
+            densities.append((counts + self.prior_weight)/(counts.sum() + self.prior_weight*size))
+        return densities
+
+    def candidates(self, outcomes, attempts, pipeline, rng):
+        from optimize_dinosaur.genome import GenomeCodec
+
+        codec = GenomeCodec(pipeline.get_params())
+        if len(outcomes) < 2:
+            return []
+        _, order = ranked_outcomes(outcomes, pipeline)
+        codes = codec.encode_frame(outcomes)
+        n_good = max(1, int(np.ceil(self.gamma*len(order))))
+        good = self.densities(codes[order[:n_good]], codec)
+        bad = self.densities(codes[order[n_good:]], codec)
+
+        samples = np.column_stack([rng.choice(len(g), self.n_candidates, p = g) for g in good])
+        samples = np.unique(samples, axis = 0)
+        score = np.zeros(len(samples))
+        for i, (g, b) in enumerate(zip(good, bad)):
+            score += np.log(g[samples[:,i]]) - np.log(b[samples[:,i]])
+        return [codec.decode(samples[s]) for s in np.argsort(-score, kind = 'stable')]
+
+class SurrogateScreen(Strategy):
+    '''
+    breeds many genetic children and some random genomes, predicts their objectives
+    with a random forest fit to the outcomes so far and proposes the candidates whose
+    optimistic prediction falls on the best front
+    '''
+    def __init__(self, n_candidates = 256, random_fraction = 0.25, kappa = 1.0, n_trees = 100):
+        self.n_candidates = n_candidates
+        self.random_fraction = random_fraction
+        self.kappa = kappa
+        self.n_trees = n_trees
+
+    def candidates(self, outcomes, attempts, pipeline, rng):
+        from optimize_dinosaur.genome import GenomeCodec
+        from optimize_dinosaur.optimizer_job import breeding_population, make_child
+        from optimize_dinosaur.pareto import nondominated_sort, crowding_distance
+        from optimize_dinosaur.surrogate import RandomForest
+
+        codec = GenomeCodec(pipeline.get_params())
+        points, _ = ranked_outcomes(outcomes, pipeline)
+        codes = codec.encode_frame(outcomes)
+        usable = np.all(np.isfinite(points), axis = 1) & np.all(codes >= 0, axis = 1)
+        if np.sum(usable) < 4:
+            return []
+
+        #the candidate pool, children of the current front and uniform random genomes
+        breeding = breeding_population(outcomes, pipeline)
+        n_random = int(self.random_fraction*self.n_candidates)
+        pool = {}
+        for _ in range(self.n_candidates - n_random):
+            code = codec.encode(make_child(outcomes, attempts, pipeline, None, rng, breeding))
+            pool[codec.key(code)] = code
+        for _ in range(n_random):
+            code = codec.random(rng)
+            if codec.key(code) not in attempts:
+                pool[codec.key(code)] = code
+        pool = np.array(list(pool.values()))
+
+        #fit standardized objectives and score candidates optimistically
+        y = points[usable]
+        center = y.mean(axis = 0)
+        scale = y.std(axis = 0)
+        scale[scale == 0] = 1
+        forest = RandomForest(n_trees = self.n_trees, seed = int(rng.integers(2**31)))
+        forest.fit(codes[usable], (y - center)/scale)
+        mean, std = forest.predict(pool)
+        predicted = mean - self.kappa*std
+
+        #rank candidates against the observed outcomes and prefer those that reach the lowest front
+        combined = np.vstack([(y - center)/scale, predicted])
+        ranks = nondominated_sort(combined)[len(y):]
+        crowding = crowding_distance(predicted, ranks)
+        return [codec.decode(pool[i]) for i in np.lexsort((-crowding, ranks))]
+
+strategies = {'genetic':Genetic,
+              'tpe':Tpe,
+              'surrogate':SurrogateScreen}
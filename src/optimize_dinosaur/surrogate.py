@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:03:18 2026
+
+@author: 4vt
+"""
+
+import numpy as np
+
+class RandomForest():
+    '''
+    a random forest regressor for categorical inputs written with numpy only
+    features are integer category codes and every split is one category versus the rest,
+    so the order of the parameter choices carries no meaning
+    all targets are fit jointly by multi-output variance reduction
+    '''
+    def __init__(self, n_trees = 100, min_leaf = 2, max_depth = 12, max_features = 'sqrt', seed = 0):
+        self.n_trees = n_trees
+        self.min_leaf = min_leaf
+        self.max_depth = max_depth
+        self.max_features = max_features
+        self.rng = np.random.default_rng(seed)
+
+    def fit(self, x, y):
+        '''
+        arguments:
+            x: an int array of shape (n, features) of category codes
+            y: a float array of shape (n, targets)
+        '''
+        x = np.asarray(x, dtype = np.int64)
+        y = np.asarray(y, dtype = float).reshape(len(x), -1)
+        self.n_categories = x.max(axis = 0) + 1 if len(x) else np.zeros(x.shape[1], dtype = np.int64)
+        n_features = x.shape[1]
+        if self.max_features == 'sqrt':
+            self.n_split_features = max(1, int(np.ceil(np.sqrt(n_features))))
+        else:
+            self.n_split_features = min(n_features, int(self.max_features))
+        self.trees = []
+        for _ in range(self.n_trees):
+            sample = self.rng.integers(0, len(x), len(x))
+            self.trees.append(self.fit_tree(x[sample], y[sample]))
+        return self
+
+    def fit_tree(self, x, y):
+        '''
+        grows one tree depth first
+        returns a tuple of arrays (feature, category, left child, right child, leaf value)
+        where internal nodes send rows with x[feature] == category to the left child
+        '''
+        feature = []
+        category = []
+        left = []
+        right = []
+        value = []
+        stack = [(np.arange(len(x)), 0, None)]
+        while stack:
+            rows, depth, parent = stack.pop()
+            node = len(feature)
+            if parent is not None:
+                (left if parent[1] else right)[parent[0]] = node
+            feature.append(-1)
+            category.append(-1)
+            left.append(-1)
+            right.append(-1)
+            value.append(y[rows].mean(axis = 0))
+            if depth >= self.max_depth or len(rows) < 2*self.min_leaf:
+                continue
+            split = self.best_split(x[rows], y[rows])
+            if split is None:
+                continue
+            feature[node], category[node] = split
+            mask = x[rows, split[0]] == split[1]
+            stack.append((rows[~mask], depth + 1, (node, False)))
+            stack.append((rows[mask], depth + 1, (node, True)))
+        return (np.array(feature), np.array(category), np.array(left), np.array(right), np.array(value))
+
+    def best_split(self, x, y):
+        '''
+        returns the (feature, category) with the largest variance reduction or None
+        '''
+        n = len(y)
+        total = y.sum(axis = 0)
+        base = np.sum(total**2)/n
+        best = None
+        best_gain = 1e-12
+        features = self.rng.choice(x.shape[1], self.n_split_features, replace = False)
+        for f in features:
+            counts = np.bincount(x[:,f], minlength = self.n_categories[f])
+            sums = np.stack([np.bincount(x[:,f], weights = y[:,t], minlength = self.n_categories[f])
+                             for t in range(y.shape[1])], axis = 1)
+            valid = (counts >= self.min_leaf) & (n - counts >= self.min_leaf)
+            if not np.any(valid):
+                continue
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                gain = (np.sum(sums**2, axis = 1)/counts +
+                        np.sum((total - sums)**2, axis = 1)/(n - counts) - base)
+            gain[~valid] = -np.inf
+            c = int(np.argmax(gain))
+            if gain[c] > best_gain:
+                best_gain = gain[c]
+                best = (int(f), c)
+        return best
+
+    def predict_trees(self, x):
+        '''
+        takes an int array of shape (n, features) of category codes
+        returns an array of shape (trees, n, targets) with the prediction of every tree
+        '''
+        x = np.asarray(x, dtype = np.int64)
+        predictions = []
+        for feature, category, left, right, value in self.trees:
+            node = np.zeros(len(x), dtype = np.int64)
+            active = feature[node] >= 0
+            while np.any(active):
+                rows = np.flatnonzero(active)
+                go_left = x[rows, feature[node[rows]]] == category[node[rows]]
+                node[rows] = np.where(go_left, left[node[rows]], right[node[rows]])
+                active = feature[node] >= 0
+            predictions.append(value[node])
+        return np.stack(predictions)
+
+    def predict(self, x):
+        '''
+        takes an int array of shape (n, features) of category codes
+        returns (mean, standard deviation) across trees, each of shape (n, targets)
+        '''
+        predictions = self.predict_trees(x)
+        return predictions.mean(axis = 0), predictions.std(axis = 0)
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:22:40 2026
+
+@author: 4vt
+"""
+
+from contextlib import contextmanager
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from optimize_dinosaur.genome import GenomeCodec
+
+def open_store(workspace, pipeline):
+    '''
+    arguments:
+        workspace: the optimization workspace directory
+        pipeline: the pipeline being optimized
+    returns:
+        a SqliteStore if the workspace holds trials.sqlite otherwise a TsvStore
+    '''
+    params = pipeline.get_params()
+    metrics = list(pipeline.get_metrics().keys())
+    if os.path.exists(os.path.join(workspace, SqliteStore.file_name)):
+        return SqliteStore(workspace, params, metrics)
+    return TsvStore(workspace, params, metrics)
+
+#file systems shared between nodes, on which shared memory locking is not coherent
+network_filesystems = {'nfs', 'nfs4', 'lustre', 'gpfs', 'beegfs', 'cifs', 'smb3', 'panfs', 'ceph', 'fuse.sshfs'}
+
+def filesystem_type(path, mounts = '/proc/mounts'):
+    '''
+    returns the type of the file system that holds path from the longest matching mount point,
+    or None if the mount table cannot be read
+    '''
+    path = os.path.realpath(path)
+    best = ''
+    fstype = None
+    try:
+        with open(mounts, 'r') as file:
+            for line in file:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                #spaces in mount points are escaped as octal
+                mount = fields[1].replace('\\040', ' ')
+                inside = path == mount or path.startswith(mount.rstrip('/') + '/')
+                if inside and len(mount) >= len(best):
+                    best = mount
+                    fstype = fields[2]
+    except OSError:
+        return None
+    return fstype
+
+#the resources recorded for every trial by Pipeline.record_usage()
+usage_columns = ['peak_rss_gb', 'cpu_seconds', 'tool_seconds', 'wall_seconds']
+
+class TsvStore():
+    '''
+    the original plain text backend, attempted_solutions.tsv and outcomes.tsv
+    are appended to by every job and read in full by every genetic job
+    '''
+    #claims are not atomic so jobs that start together have to be staggered
+    atomic_claims = False
+
+    def __init__(self, workspace, params, metrics):
+        '''
+        arguments:
+            workspace: the optimization workspace directory
+            params: the dictionary of {parameter:[value options]} from pipeline.get_params()
+            metrics: the metric names
+        '''
+        self.workspace = workspace
+        self.codec = GenomeCodec(params)
+        self.params = list(params.keys())
+        self.metrics = list(metrics)
+
+    def create(self):
+        '''
+        writes the header lines of both tables
+        '''
+        attempts = pd.DataFrame({k:[] for k in self.params})
+        attempts.to_csv(os.path.join(self.workspace, 'attempted_solutions.tsv'), sep = '\t', index = False)
+        outcomes = pd.DataFrame({k:[] for k in self.params + self.metrics + ['runtime']})
+        outcomes.to_csv(os.path.join(self.workspace, 'outcomes.tsv'), sep = '\t', index = False)
+
+    def claim(self, job):
+        '''
+        takes a dictionary of parameter choices
+        records the attempt and returns True if the genome had not been attempted
+        '''
+        with open(os.path.join(self.workspace, 'attempted_solutions.tsv'), 'a') as tsv:
+            tsv.write('\t'.join(str(job[p]) for p in self.params) + '\n')
+        return True
+
+    def release(self, job):
+        '''
+        the attempts table is only ever appended to, so a claim can not be released
+        returns False
+        '''
+        return False
+
+    def record_outcome(self, job, metrics, runtime, fidelity = 1.0):
+        '''
+        arguments:
+            job: a dictionary of parameter choices
+            metrics: a sequence of values in the order of pipeline.get_metrics()
+            runtime: the runtime in seconds
+            fidelity: the fraction of the input data the outcome was measured on,
+                outcomes below full fidelity go to rung_outcomes.tsv
+        '''
+        result_line = [job[p] for p in self.params] + list(metrics) + [runtime]
+        table = 'outcomes.tsv'
+        if fidelity < 1:
+            table = 'rung_outcomes.tsv'
+            result_line.append(fidelity)
+            if not os.path.exists(os.path.join(self.workspace, table)):
+                with open(os.path.join(self.workspace, table), 'a') as tsv:
+                    tsv.write('\t'.join(self.params + self.metrics + ['runtime', 'fidelity']) + '\n')
+        with open(os.path.join(self.workspace, table), 'a') as tsv:
+            tsv.write('\t'.join(str(r) for r in result_line) + '\n')
+
+    def record_usage(self, job, usage, fidelity = 1.0):
+        '''
+        arguments:
+            job: a dictionary of parameter choices
+            usage: a dictionary of {resource:value} with the keys of usage_columns
+            fidelity: the fidelity the trial ran at
+        appends to resource_usage.tsv
+        '''
+        path = os.path.join(self.workspace, 'resource_usage.tsv')
+        if not os.path.exists(path):
+            with open(path, 'a') as tsv:
+                tsv.write('\t'.join(self.params + ['fidelity'] + usage_columns) + '\n')
+        with open(path, 'a') as tsv:
+            tsv.write('\t'.join([str(job[p]) for p in self.params] + [str(fidelity)] +
+                                [str(usage[c]) for c in usage_columns]) + '\n')
+
+    def usage(self):
+        '''
+        returns a dataframe of the recorded resource usage with float fidelity and usage columns
+        '''
+        if not os.path.exists(os.path.join(self.workspace, 'resource_usage.tsv')):
+            return pd.DataFrame({c:[] for c in ['fidelity'] + usage_columns}, dtype = float)
+        usage = self.read_table('resource_usage.tsv')
+        for column in ['fidelity'] + usage_columns:
+            usage[column] = pd.to_numeric(usage[column], errors = 'coerce')
+        return usage
+
+    def attempts(self):
+        '''
+        returns a set of the genome keys of every attempted genome
+        '''
+        keys = self.codec.keys(self.codec.encode_frame(self.read_table('attempted_solutions.tsv')))
+        return set(keys[keys != self.codec.invalid].tolist())
+
+    def outcomes(self, since = 0):
+        '''
+        takes the number of outcomes that have already been read
+        returns a dataframe of the newer outcomes with string values
+        '''
+        return self.read_table('outcomes.tsv', since)
+
+    def rung_outcomes(self, fidelity):
+        '''
+        takes a fidelity below 1
+        returns a dataframe of the outcomes measured at that fidelity with string values
+        '''
+        columns = self.params + self.metrics + ['runtime', 'fidelity']
+        if not os.path.exists(os.path.join(self.workspace, 'rung_outcomes.tsv')):
+            return pd.DataFrame({c:[] for c in columns}, dtype = str)
+        rungs = self.read_table('rung_outcomes.tsv')
+        return rungs[pd.to_numeric(rungs['fidelity']) == fidelity].reset_index(drop = True)
+
+    def read_table(self, name, since = 0):
+        table = pd.read_csv(os.path.join(self.workspace, name),
+                            sep = '\t',
+                            dtype = str,
+                            keep_default_na = False,
+                            quoting = 3,
+                            skiprows = range(1, since + 1))
+        table.index = range(since, since + len(table))
+        return table
+
+    def export_tsv(self):
+        #the tables are already TSV files
+        pass
+
+class SqliteStore():
+    '''
+    a transactional backend in trials.sqlite, genomes are stored as packed genes
+    and claimed atomically through a unique index on their 64-bit key
+    so concurrent jobs never duplicate a trial
+    metrics are stored as typed columns and outcomes are numbered in the order
+    they finished so that readers can fetch only the rows they have not seen
+    WAL journaling lets readers proceed while a job is writing, but its -shm index relies
+    on shared memory locking that is not coherent between the nodes of a network file system,
+    so on NFS, Lustre and the like the rollback journal is used and readers wait for writers
+    '''
+    file_name = 'trials.sqlite'
+    atomic_claims = True
+
+    def __init__(self, workspace, params, metrics):
+        self.workspace = workspace
+        self.path = os.path.join(workspace, self.file_name)
+        self.codec = GenomeCodec(params)
+        self.params = list(params.keys())
+        self.metrics = list(metrics)
+        self.connection = sqlite3.connect(self.path, timeout = 600, isolation_level = None)
+        if filesystem_type(workspace) in network_filesystems:
+            self.connection.execute('PRAGMA journal_mode=DELETE')
+        else:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            #commits are durable without a sync per transaction only in WAL mode
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+
+    def create(self):
+        '''
+        creates the trials table and the rungs table of outcomes below full fidelity,
+        the TSV headers are also written for export
+        '''
+        metric_columns = ''.join(f', "{m}" REAL' for m in self.metrics)
+        with self.transaction() as cursor:
+            cursor.execute(f'''CREATE TABLE IF NOT EXISTS trials (
+                                   id INTEGER PRIMARY KEY,
+                                   genome_key INTEGER NOT NULL UNIQUE,
+                                   genome BLOB NOT NULL,
+                                   status TEXT NOT NULL,
+                                   claimed_at REAL,
+                                   finished_at REAL,
+                                   finished_seq INTEGER UNIQUE,
+                                   runtime REAL{metric_columns})''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS trials_finished ON trials(finished_seq)')
+            cursor.execute(f'''CREATE TABLE IF NOT EXISTS rungs (
+                                   genome_key INTEGER NOT NULL,
+                                   fidelity REAL NOT NULL,
+                                   finished_at REAL,
+                                   runtime REAL{metric_columns},
+                                   PRIMARY KEY (genome_key, fidelity))''')
+        TsvStore(self.workspace, dict(zip(self.params, self.codec.options)), self.metrics).create()
+
+    @contextmanager
+    def transaction(self):
+        '''
+        holds the write lock for the duration of the block and commits,
+        or rolls back if an exception was raised
+        '''
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.connection.cursor()
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def genome_key(self, job):
+        '''
+        takes a dictionary of parameter choices
+        returns (key, packed genes), raises a ValueError for values that are not among the options
+        '''
+        code = self.codec.encode(job)
+        if np.any(code < 0):
+            raise ValueError(f'{job} has values that are not parameter options')
+        return self.codec.key(code), self.codec.pack(code)
+
+    def claim(self, job):
+        '''
+        takes a dictionary of parameter choices
+        inserts the genome and returns True, or returns False if it was already claimed
+        '''
+        key, genome = self.genome_key(job)
+        with self.transaction() as cursor:
+            cursor.execute('''INSERT OR IGNORE INTO trials (genome_key, genome, status, claimed_at)
+                              VALUES (?, ?, 'running', ?)''',
+                           (key, genome, time.time()))
+            return cursor.rowcount == 1
+
+    def release(self, job):
+        '''
+        takes a dictionary of parameter choices
+        removes the claim of a genome that has no outcome at any fidelity yet
+        returns True if the claim was removed
+        '''
+        key = self.genome_key(job)[0]
+        with self.transaction() as cursor:
+            cursor.execute('''DELETE FROM trials WHERE genome_key = ? AND status = 'running' ''', (key,))
+            return cursor.rowcount == 1
+
+    def record_outcome(self, job, metrics, runtime, fidelity = 1.0):
+        '''
+        arguments:
+            job: a dictionary of parameter choices
+            metrics: a sequence of values in the order of pipeline.get_metrics()
+            runtime: the runtime in seconds
+            fidelity: the fraction of the input data the outcome was measured on
+        the first outcome of a genome at each fidelity wins, later ones are ignored
+        '''
+        values = [float(m) for m in metrics] + [float(runtime)]
+        key = self.genome_key(job)[0]
+        assignments = ', '.join(f'"{c}" = ?' for c in self.metrics + ['runtime'])
+        self.claim(job)
+        if fidelity < 1:
+            columns = ', '.join(f'"{c}"' for c in self.metrics + ['runtime'])
+            with self.transaction() as cursor:
+                cursor.execute(f'''INSERT OR IGNORE INTO rungs (genome_key, fidelity, finished_at, {columns})
+                                   VALUES (?, ?, ?{', ?'*len(values)})''',
+                               [key, fidelity, time.time()] + values)
+                cursor.execute('''UPDATE trials SET status = 'screened'
+                                  WHERE genome_key = ? AND status = 'running' ''', (key,))
+            return
+        with self.transaction() as cursor:
+            cursor.execute(f'''UPDATE trials SET status = 'done', finished_at = ?, {assignments},
+                                   finished_seq = (SELECT COALESCE(MAX(finished_seq), 0) + 1 FROM trials)
+                               WHERE genome_key = ? AND status != 'done' ''',
+                           [time.time()] + values + [key])
+
+    def record_usage(self, job, usage, fidelity = 1.0):
+        '''
+        arguments:
+            job: a dictionary of parameter choices
+            usage: a dictionary of {resource:value} with the keys of usage_columns
+            fidelity: the fidelity the trial ran at
+        '''
+        key = self.genome_key(job)[0]
+        columns = ', '.join(usage_columns)
+        with self.transaction() as cursor:
+            #workspaces created before usage was recorded do not have the table yet
+            cursor.execute(f'''CREATE TABLE IF NOT EXISTS usage (
+                                   genome_key INTEGER NOT NULL,
+                                   fidelity REAL NOT NULL,
+                                   recorded_at REAL,
+                                   {' REAL, '.join(usage_columns)} REAL)''')
+            cursor.execute(f'''INSERT INTO usage (genome_key, fidelity, recorded_at, {columns})
+                               VALUES (?, ?, ?{', ?'*len(usage_columns)})''',
+                           [key, fidelity, time.time()] + [float(usage[c]) for c in usage_columns])
+
+    def usage(self):
+        '''
+        returns a dataframe of the recorded resource usage
+        '''
+        columns = ', '.join(f'usage.{c}' for c in ['fidelity'] + usage_columns)
+        try:
+            rows = self.connection.execute(f'''SELECT trials.genome, {columns} FROM usage
+                                               JOIN trials ON trials.genome_key = usage.genome_key
+                                               ORDER BY usage.recorded_at''').fetchall()
+        except sqlite3.OperationalError:
+            #no usage has been recorded yet
+            rows = []
+        return self.table(rows, ['fidelity'] + usage_columns)
+
+    def attempts(self):
+        '''
+        returns a set of the genome keys of every attempted genome
+        '''
+        return set(r[0] for r in self.connection.execute('SELECT genome_key FROM trials'))
+
+    def table(self, rows, columns, index = None):
+        '''
+        takes query rows that start with the packed genes
+        returns a dataframe with the parameter values as strings followed by columns
+        '''
+        codes = np.array([self.codec.unpack(r[0]) for r in rows], dtype = np.int16).reshape(len(rows), len(self.params))
+        table = pd.DataFrame(self.codec.decode_strings(codes), index = index)
+        for i, column in enumerate(columns):
+            table[column] = np.array([r[i + 1] for r in rows], dtype = float)
+        return table
+
+    def outcomes(self, since = 0):
+        '''
+        takes the number of outcomes that have already been read
+        returns a dataframe of the newer outcomes in the order they finished,
+        parameter values are strings like the TSV backend and metrics are floats
+        '''
+        columns = ', '.join(f'"{c}"' for c in self.metrics + ['runtime'])
+        rows = self.connection.execute(f'''SELECT genome, {columns} FROM trials
+                                           WHERE finished_seq > ? ORDER BY finished_seq''',
+                                       (since,)).fetchall()
+        return self.table(rows, self.metrics + ['runtime'], range(since, since + len(rows)))
+
+    def rung_outcomes(self, fidelity):
+        '''
+        takes a fidelity below 1
+        returns a dataframe of the outcomes measured at that fidelity
+        '''
+        columns = ', '.join(f'rungs."{c}"' for c in self.metrics + ['runtime'])
+        rows = self.connection.execute(f'''SELECT trials.genome, {columns}, rungs.fidelity FROM rungs
+                                           JOIN trials ON trials.genome_key = rungs.genome_key
+                                           WHERE rungs.fidelity = ? ORDER BY rungs.finished_at''',
+                                       (fidelity,)).fetchall()
+        return self.table(rows, self.metrics + ['runtime', 'fidelity'])
+
+    def export_tsv(self):
+        '''
+        rewrites attempted_solutions.tsv, outcomes.tsv, resource_usage.tsv and rung_outcomes.tsv from the database
+        '''
+        rows = self.connection.execute('SELECT genome FROM trials ORDER BY id').fetchall()
+        self.table(rows, []).to_csv(os.path.join(self.workspace, 'attempted_solutions.tsv'),
+                                    sep = '\t', index = False, quoting = 3)
+        self.outcomes().to_csv(os.path.join(self.workspace, 'outcomes.tsv'),
+                               sep = '\t', index = False, quoting = 3)
+        usage = self.usage()
+        if len(usage):
+            usage.to_csv(os.path.join(self.workspace, 'resource_usage.tsv'),
+                         sep = '\t', index = False, quoting = 3)
+        fidelities = [r[0] for r in self.connection.execute('SELECT DISTINCT fidelity FROM rungs ORDER BY fidelity')]
+        if fidelities:
+            rungs = pd.concat([self.rung_outcomes(f) for f in fidelities])
+            rungs.to_csv(os.path.join(self.workspace, 'rung_outcomes.tsv'),
+                         sep = '\t', index = False, quoting = 3)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 15:48:13 2026
+
+@author: 4vt
+"""
+
+import os
+import signal
+import subprocess
+
+class TrialTimeout(Exception):
+    '''
+    raised when a tool runs past the runtime budget of the trial
+    '''
+    pass
+
+def session_usage(session):
+    '''
+    takes the id of a session, i.e. the pid of a process started with start_new_session
+    returns (resident memory in GB, CPU seconds) summed over the live processes of the session
+    the CPU time of each process includes its children that have exited, so the total
+    only misses processes that exited since they were last sampled together with their parent
+    '''
+    page = os.sysconf('SC_PAGE_SIZE')
+    ticks = os.sysconf('SC_CLK_TCK')
+    rss = 0
+    cpu = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as stat:
+                #the command name is in parentheses and may hold spaces
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[3]) != session:
+            continue
+        cpu += sum(int(f) for f in fields[11:15])/ticks
+        rss += int(fields[21])*page
+    return rss/2**30, cpu
+
+def peak_rss(pid):
+    '''
+    returns the peak resident memory in GB of a process or 0 if it is gone
+    '''
+    try:
+        with open(f'/proc/{pid}/status', 'r') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/2**20
+    except OSError:
+        pass
+    return 0.0
+
+def job_peak_rss():
+    '''
+    returns the peak resident memory in GB of this process and of the processes it forked
+    into its own session, such as worker pools, summed
+    tools run by supervised_run() have sessions of their own and are not included
+    '''
+    me = os.getpid()
+    session = os.getsid(0)
+    rss = peak_rss(me)
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as stat:
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == me and int(fields[3]) == session:
+            rss += peak_rss(pid)
+    return rss
+
+def kill_group(process, grace = 30):
+    '''
+    sends SIGTERM to the process group of a process started with start_new_session
+    and SIGKILL if it has not exited after grace seconds
+    '''
+    for sig, wait in ((signal.SIGTERM, grace), (signal.SIGKILL, None)):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            #the whole group already exited
+            break
+        try:
+            process.wait(wait)
+            if sig == signal.SIGTERM:
+                #the shell is gone but the tool it started may still be running
+                continue
+            break
+        except subprocess.TimeoutExpired:
+            continue
+
+def supervised_run(command, timeout = None, grace = 30, usage = None, interval = 1):
+    '''
+    arguments:
+        command: a shell command
+        timeout: the number of seconds the command may run, None for no limit
+        grace: the number of seconds between SIGTERM and SIGKILL
+        usage: a dictionary that is filled with the peak_rss_gb, cpu_seconds and wall_seconds
+            of the command and everything it started, sampled from /proc every interval seconds
+        interval: the number of seconds between samples
+    returns:
+        the exit code of the command
+    the command runs in its own process group so that the shell, the tool and
+    everything the tool started are stopped together, e.g. singularity and R
+    raises TrialTimeout if the command ran out of time
+    '''
+    from time import time
+    
+    start = time()
+    process = subprocess.Popen(command, shell = True, start_new_session = True)
+    peak_rss = 0
+    cpu = 0
+    try:
+        while True:
+            rss, sampled_cpu = session_usage(process.pid)
+            peak_rss = max(peak_rss, rss)
+            cpu = max(cpu, sampled_cpu)
+            wait = interval if timeout is None else min(interval, max(start + timeout - time(), 0))
+            try:
+                return process.wait(wait)
+            except subprocess.TimeoutExpired:
+                if timeout is not None and time() - start >= timeout:
+                    raise
+    except subprocess.TimeoutExpired:
+        kill_group(process, grace)
+        raise TrialTimeout(f'{command} ran longer than {timeout:.0f} seconds')
+    except BaseException:
+        #do not leave the tool running if this job is interrupted
+        kill_group(process, grace)
+        raise
+    finally:
+        if usage is not None:
+            usage.update({'peak_rss_gb':peak_rss, 'cpu_seconds':cpu, 'wall_seconds':time() - start})
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:10:52 2026
+
+@author: 4vt
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import socket
+import time
+
+class WorkQueue():
+    '''
+    a queue of genomes on the shared file system
+    the coordinator puts genomes into pending/, a worker moves one into claimed/
+    and posts its result to results/ where the coordinator collects it
+    workers announce themselves in waiting/ so that genomes are only proposed
+    when someone is ready to run them, using the latest outcomes
+    every change of state is a rename, which is atomic on a shared file system,
+    and the directory lock keeps workers from racing for the same genome
+    '''
+    def __init__(self, directory, stale_lock = 300):
+        self.directory = os.path.abspath(directory)
+        self.stale_lock = stale_lock
+        self.worker = f'{socket.gethostname()}_{os.getpid()}'
+        for subdir in ('pending', 'claimed', 'results', 'waiting'):
+            os.makedirs(os.path.join(self.directory, subdir), exist_ok = True)
+
+    def path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    @contextmanager
+    def lock(self):
+        '''
+        holds the queue lock for the duration of the block
+        mkdir is atomic on network file systems where flock is often not,
+        a lock older than stale_lock seconds is assumed to belong to a dead process
+        '''
+        lock = self.path('lock')
+        while True:
+            try:
+                os.mkdir(lock)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) > self.stale_lock:
+                        os.rmdir(lock)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.5)
+        try:
+            yield
+        finally:
+            os.rmdir(lock)
+
+    def write_json(self, path, data):
+        tmp = f'{path}.{self.worker}.tmp'
+        with open(tmp, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp, path)
+
+    def entries(self, subdir):
+        return sorted(f for f in os.listdir(self.path(subdir)) if f.endswith('.json'))
+
+    def put(self, job):
+        '''
+        takes a dictionary of parameter choices
+        returns the id of the queued genome
+        '''
+        job_id = f'{time.time_ns()}_{self.worker}'
+        with self.lock():
+            self.write_json(self.path('pending', f'{job_id}.json'), job)
+        return job_id
+
+    def pull(self, timeout = 3600, poll = 5):
+        '''
+        waits for a genome and claims it
+        arguments:
+            timeout: the number of seconds to wait for a genome
+            poll: the number of seconds between checks
+        returns:
+            (job id, dictionary of parameter choices) or None if the queue is closed or the wait timed out
+        '''
+        waiting = self.path('waiting', self.worker)
+        open(waiting, 'w').close()
+        try:
+            start = time.time()
+            while time.time() - start < timeout:
+                #a fresh announcement shows the coordinator that this worker is still alive
+                os.utime(waiting)
+                with self.lock():
+                    pending = self.entries('pending')
+                    if pending:
+                        claimed = self.path('claimed', pending[0])
+                        os.rename(self.path('pending', pending[0]), claimed)
+                        #the rename keeps the time of put(), the claim expires counting from now
+                        os.utime(claimed)
+                        with open(claimed, 'r') as file:
+                            return pending[0][:-5], json.load(file)
+                if self.closed():
+                    return None
+                time.sleep(poll)
+            return None
+        finally:
+            os.remove(waiting)
+
+    def post(self, job_id, result):
+        '''
+        arguments:
+            job_id: the id returned by self.pull()
+            result: a json serializable dictionary describing how the trial went
+        '''
+        result = dict(result, worker = self.worker)
+        self.write_json(self.path('results', f'{job_id}.json'), result)
+        try:
+            os.remove(self.path('claimed', f'{job_id}.json'))
+        except FileNotFoundError:
+            #the coordinator already gave up on this trial
+            pass
+
+    def collect(self):
+        '''
+        returns a list of the posted results, each with its job_id, and removes them from the queue
+        '''
+        results = []
+        for entry in self.entries('results'):
+            with open(self.path('results', entry), 'r') as file:
+                results.append(dict(json.load(file), job_id = entry[:-5]))
+            os.remove(self.path('results', entry))
+        return results
+
+    def expire(self, max_age):
+        '''
+        takes a number of seconds
+        drops claims older than max_age, whose workers are assumed dead
+        returns a list of the ids of the expired claims
+        '''
+        expired = []
+        for entry in self.entries('claimed'):
+            claimed = self.path('claimed', entry)
+            try:
+                if time.time() - os.path.getmtime(claimed) < max_age:
+                    continue
+                os.remove(claimed)
+            except OSError:
+                #the worker posted in the meantime
+                continue
+            expired.append(entry[:-5])
+        return expired
+
+    def n_pending(self):
+        return len(self.entries('pending'))
+
+    def n_claimed(self):
+        return len(self.entries('claimed'))
+
+    def n_waiting(self):
+        '''
+        returns the number of waiting workers, announcements of killed workers go stale after stale_lock seconds
+        '''
+        n = 0
+        for entry in os.listdir(self.path('waiting')):
+            try:
+                n += time.time() - os.path.getmtime(self.path('waiting', entry)) < self.stale_lock
+            except OSError:
+                #the worker claimed a genome or gave up in the meantime
+                continue
+        return n
+
+    def open(self):
+        '''
+        clears the closed marker left by a previous coordinator
+        '''
+        try:
+            os.remove(self.path('closed'))
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        '''
+        tells workers that no more genomes will be queued
+        '''
+        open(self.path('closed'), 'w').close()
+
+    def closed(self):
+        return os.path.exists(self.path('closed'))
@@ -11,7 +11,7 @@ parser = argparse.ArgumentParser()
 parser.add_argument('--mzml', action = 'store', required = True,
                     help = 'the .mzML spetrum file')
 parser.add_argument('--psms', action = 'store', required = True,
-                    help = 'the psm identification file from Proteome Discoverer')
+                    help = 'the psm identification file from Proteome Discoverer or its compiled .store')
 parser.add_argument('--output', action = 'store', required = True,
                     help = 'the output file name')
 parser.add_argument('--params', action = 'store', required = True,
@@ -21,10 +21,18 @@ args = parser.parse_args()
 import pyopenms as oms
 import pandas as pd
 import numpy as np
-from sortedcontainers import SortedList
-from collections import defaultdict
 
-psms = pd.read_csv(args.psms, sep = '\t')
+#these modules are copied next to this script by Pyopenms.setup_workspace()
+from feature_matching import match_intervals, unique_pairs, best_per_group
+from psm_store import load_psms
+
+if args.psms.endswith('.store'):
+    psms = load_psms(args.psms)
+else:
+    psms = pd.read_csv(args.psms, sep = '\t')
+    psms = pd.DataFrame({'mz':psms['m/z [Da]'],
+                         'rt':psms['RT [min]'],
+                         'sequence':psms['Annotated Sequence']})
 params = pd.read_csv(args.params, sep = '\t', header = None)
 omm_idx = next(i for i,p in zip(params.index, params.iloc[:,0]) if p == 'onMultiMatch')
 args.onMultiMatch = params.iloc[omm_idx, 1]
@@ -69,53 +77,33 @@ def get_data(feature, idx):
                         idx))
     return windows
 
-feature_data = [w for i,f in enumerate(features) for w in get_data(f, i)]
-
-#set up data structures for faster lookups
-intensity = {f[5]:f[4] for f in feature_data}
-rt_start = SortedList((f[0], f[5]) for f in feature_data)
-rt_end = SortedList((f[1], f[5]) for f in feature_data)
-max_Δrt = max(f[1]-f[0] for f in feature_data)
-mz_low = SortedList((f[2], f[5]) for f in feature_data)
-mz_high = SortedList((f[3], f[5]) for f in feature_data)
-max_Δmz = max(f[3]-f[2] for f in feature_data)
-
-def match_feature(mz, rt):
-    rt_starts = set(f[1] for f in rt_start.irange((rt-max_Δrt,), (rt,)))
-    rt_ends = set(f[1] for f in rt_end.irange((rt,), (rt+max_Δrt,)))
-    mz_starts = set(f[1] for f in mz_low.irange((mz-max_Δmz,), (mz,)))
-    mz_ends = set(f[1] for f in mz_high.irange((mz,), (mz+max_Δmz,)))
-    
-    matches = rt_starts
-    for match_set in (rt_ends, mz_starts, mz_ends):
-        matches = matches.intersection(match_set)
-    
-    return matches
-
-def peptide_rollup(feature_sets):
-    all_features = []
-    for feature_set in feature_sets:
-        if len(feature_set) > 1:
-            if args.onMultiMatch == 'drop':
-                continue
-            elif args.onMultiMatch == 'sum':
-                all_features.extend(feature_set)
-            elif args.onMultiMatch == 'max':
-                all_features.append(max(feature_set, key = lambda x: intensity[x]))
-        elif feature_set:
-            all_features.extend(feature_set)
-    all_features = set(all_features)
-    pep_intensity = np.sum([intensity[f] for f in all_features])
-    return pep_intensity
-
-feature_matches = defaultdict(lambda:[])
-for seq, mz, rt in zip(psms['Annotated Sequence'], psms['m/z [Da]'], psms['RT [min]']):
-    feature_matches[seq].append(match_feature(mz, rt))
-    
-peptides = list(set(psms['Annotated Sequence']))
-intensities = [peptide_rollup(feature_matches[s]) for s in peptides]
-
-report = pd.DataFrame({'sequence':peptides,
-                       'intensity':intensities})
+feature_data = np.array([w for i,f in enumerate(features) for w in get_data(f, i)]).reshape(-1, 6)
+feature_intensity = np.array([f.getIntensity() for f in features], dtype = float)
+
+#connect every PSM to the features whose convex hulls contain it
+psm_mz = psms['mz'].to_numpy()
+psm_idx, hull_idx = match_intervals(psm_mz,
+                                    psm_mz,
+                                    psms['rt'].to_numpy(),
+                                    feature_data[:,2],
+                                    feature_data[:,3],
+                                    feature_data[:,0],
+                                    feature_data[:,1])
+psm_idx, feature_idx = unique_pairs(psm_idx, feature_data[hull_idx,5].astype(int))
+
+#resolve PSMs that match more than one feature with each onMultiMatch strategy
+n_matches = np.bincount(psm_idx, minlength = psms.shape[0])[psm_idx]
+strategy_masks = {'drop':n_matches == 1,
+                  'sum':np.ones(len(psm_idx), dtype = bool),
+                  'max':best_per_group(psm_idx, feature_intensity[feature_idx])}
+
+#sum the intensity of the distinct features matched by each peptide
+seq_codes, peptides = pd.factorize(psms['sequence'])
+report = pd.DataFrame({'sequence':peptides})
+for strategy, keep in strategy_masks.items():
+    seq_idx, pep_features = unique_pairs(seq_codes[psm_idx[keep]], feature_idx[keep])
+    report[f'intensity_{strategy}'] = np.bincount(seq_idx, 
+                                                  weights = feature_intensity[pep_features], 
+                                                  minlength = len(peptides))
+report.insert(1, 'intensity', report[f'intensity_{args.onMultiMatch}'])
 report.to_csv(args.output, sep = '\t', index = False)
-
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:10:22 2026
+
+@author: 4vt
+"""
+
+import itertools
+
+import numpy as np
+
+from optimize_dinosaur.designs import initial_design, orthogonal_array
+from optimize_dinosaur.Dinosaur_pipeline import Dinosaur
+
+def test_orthogonal_array_is_balanced_in_pairs():
+    sizes = np.array([7]*8)
+    codes = orthogonal_array(sizes, 64, np.random.default_rng(0))
+    assert len(codes) == 49
+    for a, b in itertools.combinations(range(len(sizes)), 2):
+        pairs = np.unique(codes[:,[a, b]], axis = 0, return_counts = True)[1]
+        assert len(pairs) == 49 and set(pairs) == {1}
+
+def test_orthogonal_array_falls_back_within_budget():
+    sizes = np.array([5]*15)
+    codes = orthogonal_array(sizes, 64, np.random.default_rng(0))
+    assert len(codes) == 64
+    #every option of every parameter is used as in a Latin hypercube
+    assert all(len(np.unique(codes[:,i])) == 5 for i in range(len(sizes)))
+
+def test_default_design_is_one_at_a_time():
+    params = Dinosaur().get_params()
+    jobs = initial_design(params)
+    assert len(jobs) == 1 + sum(len(v) - 1 for v in params.values())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:12:40 2026
+
+@author: 4vt
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from optimize_dinosaur.genome import GenomeCodec
+from optimize_dinosaur.Percolator_pipeline import Percolator
+
+def percolator_codec():
+    return GenomeCodec(Percolator().get_params())
+
+def test_round_trip():
+    codec = percolator_codec()
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        code = codec.random(rng)
+        job = codec.decode(code)
+        assert np.array_equal(codec.encode(job), code)
+        assert codec.key(job) == codec.key(code)
+
+def test_decoded_values_are_strings():
+    codec = percolator_codec()
+    job = codec.decode(np.zeros(len(codec.names), dtype = np.int16))
+    assert all(isinstance(v, str) for v in job.values())
+    assert job['unitnorm'] == 'False'
+    assert job['testFDR'] == '0.01'
+
+def test_table_and_python_values_encode_alike():
+    codec = percolator_codec()
+    job = {'default-direction':'Xcorr', 'testFDR':0.05, 'trainFDR':'0.001', 'maxiter':15.0,
+           'init-weights':False, 'unitnorm':'True', 'nested-xval-bins':'3', 'tab-in':'-Y /data/S2_N1.pin'}
+    frame = pd.DataFrame([{k:str(v) for k,v in job.items()}])
+    assert np.array_equal(codec.encode(job), codec.encode_frame(frame)[0])
+    assert codec.key(job) != codec.invalid
+
+def test_unknown_value_is_invalid():
+    codec = percolator_codec()
+    job = codec.decode(np.zeros(len(codec.names), dtype = np.int16))
+    job['maxiter'] = '11'
+    assert codec.encode(job)[codec.names.index('maxiter')] == -1
+    assert codec.key(job) == codec.invalid
+
+def test_keys_are_unique():
+    codec = GenomeCodec({'a':[1, 2, 3], 'b':['x', 'y'], 'c':[0.1, 0.2]})
+    codes = np.array(list(itertools.product(range(3), range(2), range(2))))
+    assert len(set(codec.keys(codes))) == len(codes)
+
+def test_percolator_command_from_decoded_genome():
+    pipeline = Percolator()
+    codec = percolator_codec()
+    params = pipeline.job_params(codec.decode(np.zeros(len(codec.names), dtype = np.int16)))
+    assert params == '--default-direction Xcorr --testFDR 0.01 --trainFDR 0.01 --maxiter 10 --nested-xval-bins 1 -y /data/S1_N1.pin'
+
+    code = np.ones(len(codec.names), dtype = np.int16)
+    params = pipeline.job_params(codec.decode(code))
+    assert '--init-weights weights.tsv' in params
+    assert '--unitnorm' in params.split()
+    assert 'True' not in params and 'False' not in params
+
+def test_percolator_command_from_table_genome():
+    pipeline = Percolator()
+    codec = percolator_codec()
+    job = codec.decode(np.zeros(len(codec.names), dtype = np.int16))
+    frame = pd.DataFrame([job]).astype(str)
+    assert pipeline.job_params(dict(frame.iloc[0])) == pipeline.job_params(job)
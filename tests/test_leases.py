@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:37:05 2026
+
+@author: 4vt
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from optimize_dinosaur import leases
+from optimize_dinosaur.Dinosaur_pipeline import Dinosaur
+from optimize_dinosaur.staging import NodeStage
+from optimize_dinosaur.trial_store import TsvStore
+
+def make_pipeline(workspace):
+    pipeline = Dinosaur()
+    pipeline.workspace = str(workspace)
+    TsvStore(str(workspace), pipeline.get_params(), pipeline.get_metrics()).create()
+    return pipeline
+
+def write_lease(workspace, pipeline, scratch = None, age = 0, **fields):
+    '''
+    writes the lease of a trial of this process that last beat age seconds ago
+    '''
+    job = {k:str(v[0]) for k,v in pipeline.get_params().items()}
+    lease = leases.Lease(str(workspace), job, 1.0, (4, 16), scratch)
+    lease.lease.update(fields)
+    lease.lease['started'] -= age + 100
+    os.makedirs(os.path.dirname(lease.path), exist_ok = True)
+    with open(lease.path, 'w') as file:
+        json.dump(lease.lease, file)
+    os.utime(lease.path, (time.time() - age,)*2)
+    return lease
+
+def make_scratch(path, age = 0):
+    os.makedirs(path)
+    os.utime(path, (time.time() - age,)*2)
+    return path
+
+def test_expired_lease_is_recorded_and_cleaned(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    scratch = make_scratch(pipeline.trial_path())
+    lease = write_lease(tmp_path, pipeline, pipeline.trial_path(), leases.expiry + 10)
+    assert leases.reap(pipeline, str(tmp_path)) == (1, 0)
+    assert not os.path.exists(scratch)
+    assert not os.path.exists(lease.path)
+    store = pipeline.trial_store()
+    outcomes = store.outcomes()
+    assert len(outcomes) == 1
+    assert np.isnan(float(outcomes.iloc[0][list(pipeline.get_metrics())[0]]))
+    usage = store.usage()
+    assert len(usage) == 1
+    assert float(usage.iloc[0]['peak_rss_gb']) == 16
+    #usage is charged for as long as the heartbeat was seen
+    assert float(usage.iloc[0]['wall_seconds']) >= 100
+    assert float(usage.iloc[0]['cpu_seconds']) == pytest.approx(4*float(usage.iloc[0]['wall_seconds']))
+
+def test_fresh_lease_is_kept(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    scratch = make_scratch(pipeline.trial_path(), leases.expiry + 10)
+    lease = write_lease(tmp_path, pipeline, pipeline.trial_path())
+    assert leases.reap(pipeline, str(tmp_path)) == (0, 0)
+    assert os.path.exists(scratch)
+    assert os.path.exists(lease.path)
+    assert len(pipeline.trial_store().outcomes()) == 0
+
+def test_staged_trial_dir_is_removed(tmp_path, monkeypatch):
+    monkeypatch.setenv('TMPDIR', str(tmp_path/'node'))
+    workspace = tmp_path/'workspace'
+    workspace.mkdir()
+    pipeline = make_pipeline(workspace)
+    pipeline.node_staging = True
+    scratch = pipeline.trial_path()
+    assert scratch.startswith(NodeStage(str(workspace)).trials)
+    make_scratch(scratch)
+    write_lease(workspace, pipeline, scratch, leases.expiry + 10)
+    assert leases.reap(pipeline, str(workspace)) == (1, 0)
+    assert not os.path.exists(scratch)
+
+def test_other_node_trial_dir_is_left_to_its_stage(tmp_path, monkeypatch):
+    monkeypatch.setenv('TMPDIR', str(tmp_path/'node'))
+    workspace = tmp_path/'workspace'
+    workspace.mkdir()
+    pipeline = make_pipeline(workspace)
+    pipeline.node_staging = True
+    scratch = make_scratch(pipeline.trial_path())
+    write_lease(workspace, pipeline, scratch, leases.expiry + 10, host = 'another-node')
+    assert leases.reap(pipeline, str(workspace)) == (1, 0)
+    assert os.path.exists(scratch)
+
+def test_orphans_are_removed(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    orphan = make_scratch(os.path.join(tmp_path, '1234567'), leases.expiry + 10)
+    recent = make_scratch(os.path.join(tmp_path, '1234568'))
+    held = make_scratch(os.path.join(tmp_path, '1234569'), leases.expiry + 10)
+    write_lease(tmp_path, pipeline, '1234569')
+    assert leases.reap(pipeline, str(tmp_path)) == (0, 1)
+    assert not os.path.exists(orphan)
+    assert os.path.exists(recent)
+    assert os.path.exists(held)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:20:48 2026
+
+@author: 4vt
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from optimize_dinosaur.pareto import hypervolume, hypervolume_contributions, nondominated_sort
+
+def brute_force_ranks(points):
+    '''
+    peels off the points that nothing left dominates, one front at a time
+    '''
+    ranks = np.full(len(points), -1)
+    rank = 0
+    while np.any(ranks < 0):
+        left = np.flatnonzero(ranks < 0)
+        for i in left:
+            if not any(np.all(points[j] <= points[i]) and np.any(points[j] < points[i]) for j in left):
+                ranks[i] = rank
+        rank += 1
+    return ranks
+
+def brute_force_hypervolume(points, reference):
+    '''
+    counts the unit cells of the integer grid below the reference that any point dominates
+    '''
+    volume = 0
+    for cell in itertools.product(*[range(int(r)) for r in reference]):
+        if np.any(np.all(points <= np.array(cell), axis = 1)):
+            volume += 1
+    return float(volume)
+
+@pytest.mark.parametrize('n_objectives', [2, 3, 4])
+def test_nondominated_sort(n_objectives):
+    rng = np.random.default_rng(n_objectives)
+    for _ in range(20):
+        #a small range of integers makes ties and duplicates common
+        points = rng.integers(0, 5, (40, n_objectives)).astype(float)
+        assert np.array_equal(nondominated_sort(points), brute_force_ranks(points))
+
+def test_nondominated_sort_with_failed_runs():
+    points = np.array([[1, 2], [np.inf, np.inf], [2, 1], [np.inf, np.inf], [2, 2]])
+    assert list(nondominated_sort(points)) == [0, 2, 0, 2, 1]
+
+@pytest.mark.parametrize('n_objectives', [1, 2, 3, 4])
+def test_hypervolume(n_objectives):
+    rng = np.random.default_rng(n_objectives)
+    reference = np.full(n_objectives, 6.0)
+    for _ in range(10):
+        #points on or beyond the reference do not count
+        points = rng.integers(0, 8, (12, n_objectives)).astype(float)
+        assert hypervolume(points, reference) == pytest.approx(brute_force_hypervolume(points, reference))
+
+@pytest.mark.parametrize('n_objectives', [2, 3, 4])
+def test_hypervolume_contributions(n_objectives):
+    rng = np.random.default_rng(n_objectives)
+    reference = np.full(n_objectives, 6.0)
+    for _ in range(10):
+        points = rng.integers(0, 6, (30, n_objectives)).astype(float)
+        points = np.unique(points[nondominated_sort(points) == 0], axis = 0)
+        total = brute_force_hypervolume(points, reference)
+        expected = [total - brute_force_hypervolume(np.delete(points, i, axis = 0), reference)
+                    for i in range(len(points))]
+        assert hypervolume_contributions(points, reference) == pytest.approx(expected)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:02:17 2026
+
+@author: 4vt
+"""
+
+import pandas as pd
+
+from optimize_dinosaur.Dinosaur_pipeline import Dinosaur
+from optimize_dinosaur.optimizer_job import promoted
+from optimize_dinosaur.trial_store import TsvStore
+
+def make_pipeline(workspace):
+    pipeline = Dinosaur()
+    pipeline.runtime_objective = False
+    pipeline.workspace = str(workspace)
+    TsvStore(str(workspace), pipeline.get_params(), pipeline.get_metrics()).create()
+    return pipeline
+
+def parent(pipeline, i):
+    job = {k:str(v[0]) for k,v in pipeline.get_params().items()}
+    job['hillPPM'] = str(pipeline.get_params()['hillPPM'][i])
+    return job
+
+def sweep(pipeline, quality):
+    '''
+    the grid of one tool run, every rollup setting of a better tool run is better
+    and the first setting, which the parents use, is the worst of each run
+    '''
+    settings = pipeline.rollup_settings()
+    return pd.DataFrame({'ppm':[float(p) for p,_ in settings],
+                         'rt_wiggle':[float(w) for _,w in settings],
+                         'quant_depth':[100*quality + j for j in range(len(settings))],
+                         'mean_relative_error':[1 - 0.1*quality]*len(settings)})
+
+def test_rung_holds_one_outcome_per_tool_run(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    pipeline.fidelity = 0.5
+    for i in range(4):
+        job = parent(pipeline, i)
+        pipeline.record_attempt(job)
+        pipeline.record_sweep(job, sweep(pipeline, i + 1), 10.0)
+    store = pipeline.trial_store()
+    rungs = store.rung_outcomes(0.5)
+    assert len(rungs) == 4
+    #each parent carries the metrics of its best rollup setting
+    assert sorted(pd.to_numeric(rungs['quant_depth'])) == [100*q + 23 for q in range(1, 5)]
+    #siblings stay free to be proposed
+    assert len(store.attempts()) == 4
+    assert promoted(store, pipeline, parent(pipeline, 3), 0.5, 2)
+    assert promoted(store, pipeline, parent(pipeline, 2), 0.5, 2)
+    assert not promoted(store, pipeline, parent(pipeline, 0), 0.5, 2)
+
+def test_full_fidelity_records_every_sibling(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    job = parent(pipeline, 0)
+    pipeline.record_attempt(job)
+    pipeline.record_sweep(job, sweep(pipeline, 1), 10.0)
+    store = pipeline.trial_store()
+    assert len(store.outcomes()) == len(pipeline.rollup_settings())
+    assert len(store.attempts()) == len(pipeline.rollup_settings())
+    assert store.codec.key(job) in store.attempts()
+
+def test_repeated_sweep_adds_no_sibling_duplicates(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    job = parent(pipeline, 0)
+    for _ in range(2):
+        pipeline.record_attempt(job)
+        pipeline.record_sweep(job, sweep(pipeline, 1), 10.0)
+    store = pipeline.trial_store()
+    outcomes = store.outcomes()
+    attempted = store.read_table('attempted_solutions.tsv')
+    siblings = len(pipeline.rollup_settings()) - 1
+    #the parent itself is run twice, its siblings are only recorded once
+    assert len(outcomes) == siblings + 2
+    assert len(attempted) == siblings + 2
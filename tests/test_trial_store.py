@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:41:53 2026
+
+@author: 4vt
+"""
+
+import pytest
+
+from optimize_dinosaur import trial_store
+from optimize_dinosaur.trial_store import SqliteStore, TsvStore
+
+params = {'a':[1, 2, 3], 'b':['x', 'y'], 'c':[True, False]}
+metrics = ['m1', 'm2']
+
+def job(a = 1, b = 'x', c = True):
+    return {'a':str(a), 'b':b, 'c':str(c)}
+
+@pytest.fixture(params = [TsvStore, SqliteStore])
+def store(request, tmp_path):
+    store = request.param(str(tmp_path), params, metrics)
+    store.create()
+    yield store
+    if hasattr(store, 'close'):
+        store.close()
+
+def test_claim_dedupe(store):
+    assert store.claim(job())
+    assert store.claim(job(2))
+    #only the sqlite store refuses a genome that was already claimed
+    assert store.claim(job()) != store.atomic_claims
+    assert store.attempts() == {store.codec.key(job()), store.codec.key(job(2))}
+
+def test_release(store):
+    store.claim(job())
+    assert store.release(job()) == store.atomic_claims
+    if store.atomic_claims:
+        assert store.attempts() == set()
+        assert store.claim(job())
+        #a genome with an outcome stays claimed
+        store.record_outcome(job(), [1, 2], 3)
+        assert not store.release(job())
+
+def test_outcomes_since(store):
+    for i, a in enumerate([1, 2, 3]):
+        store.claim(job(a))
+        store.record_outcome(job(a), [i, -i], 10*i)
+    outcomes = store.outcomes()
+    assert list(outcomes['a']) == ['1', '2', '3']
+    assert [float(m) for m in outcomes['m1']] == [0, 1, 2]
+    newer = store.outcomes(2)
+    assert list(newer.index) == [2]
+    assert list(newer['b']) == ['x']
+
+def test_rungs_are_separate(store):
+    store.claim(job())
+    store.record_outcome(job(), [1, 1], 1, 0.25)
+    assert len(store.outcomes()) == 0
+    rungs = store.rung_outcomes(0.25)
+    assert len(rungs) == 1 and float(rungs['fidelity'][0]) == 0.25
+    assert len(store.rung_outcomes(0.5)) == 0
+
+def test_sqlite_first_outcome_wins(tmp_path):
+    store = SqliteStore(str(tmp_path), params, metrics)
+    store.create()
+    store.claim(job())
+    store.record_outcome(job(), [1, 1], 1)
+    store.record_outcome(job(), [2, 2], 2)
+    store.record_outcome(job(c = False), [3, 3], 3)
+    outcomes = store.outcomes()
+    assert list(outcomes['m1']) == [1, 3]
+    #recording an outcome claims the genome
+    assert store.codec.key(job(c = False)) in store.attempts()
+    store.close()
+
+def test_filesystem_type(tmp_path):
+    mounts = tmp_path/'mounts'
+    mounts.write_text('rootfs / ext4 rw 0 0\n'
+                      'server:/home /home nfs4 rw 0 0\n'
+                      '/dev/sdb1 /home/local xfs rw 0 0\n'
+                      'lustre@tcp:/scratch /scratch\\040space lustre rw 0 0\n')
+    assert trial_store.filesystem_type('/home/user/workspace', str(mounts)) == 'nfs4'
+    assert trial_store.filesystem_type('/home/local/workspace', str(mounts)) == 'xfs'
+    assert trial_store.filesystem_type('/home/localx', str(mounts)) == 'nfs4'
+    assert trial_store.filesystem_type('/scratch space/run', str(mounts)) == 'lustre'
+    assert trial_store.filesystem_type('/tmp', str(mounts)) == 'ext4'
+    assert trial_store.filesystem_type('/tmp', str(tmp_path/'missing')) is None
+
+def test_sqlite_journal_on_network_filesystem(tmp_path, monkeypatch):
+    monkeypatch.setattr(trial_store, 'filesystem_type', lambda path: 'lustre')
+    store = SqliteStore(str(tmp_path), params, metrics)
+    assert store.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    store.close()
+    monkeypatch.setattr(trial_store, 'filesystem_type', lambda path: 'ext4')
+    store = SqliteStore(str(tmp_path), params, metrics)
+    assert store.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    store.close()